@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_binary
+----------------------------------
+
+Bytes written, write and read rates of json lines against the binary
+format (``binary=True``), for the same debug records.
+
+    python benchmarks/bench_binary.py
+    python benchmarks/bench_binary.py --records 200000 --fields 0 5 50
+"""
+
+import os
+import shutil
+import argparse
+import tempfile
+
+from pyzlog import reader
+from bench_pipeline import Scenario, clock, default_dirs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--fields', type=int, nargs='+', default=[0, 5, 50])
+    parser.add_argument('--dirs', nargs='+', default=default_dirs()[:1])
+    args = parser.parse_args(argv)
+    print('%-16s %12s %12s %12s' % ('', 'bytes/rec', 'write rec/s',
+                                    'read rec/s'))
+    for base in args.dirs:
+        path = tempfile.mkdtemp(prefix='pyzlog-bench-', dir=base)
+        try:
+            for fields in args.fields:
+                for binary in (False, True):
+                    name = '%s_%d' % ('binary' if binary else 'json', fields)
+                    scenario = Scenario(name, fields=fields, binary=binary,
+                                        batch_records=100)
+                    wall, latencies = scenario.run(path, args.records)
+                    filename = os.path.join(path, '%s.log' % name)
+                    start = clock()
+                    read = sum(1 for _ in reader.read_file(filename))
+                    read_wall = clock() - start
+                    print('%-16s %12.1f %12.0f %12.0f' % (
+                        name, os.path.getsize(filename) / float(read),
+                        len(latencies) / wall, read / read_wall))
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
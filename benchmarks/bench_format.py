@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_format
+----------------------------------
+
+Time and memory cost of `JsonFormatter.format` as the whitelist and the
+number of extra record attributes grow.
+
+    python benchmarks/bench_format.py
+
+Peak bytes allocated per call are reported when tracemalloc is available
+(python 3.4+).
+"""
+
+import logging
+import timeit
+
+import pyzlog
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def make_record(whitelisted, extra_attrs):
+    record = logging.LogRecord(
+        'bench', logging.INFO, __file__, 1, '', None, None)
+    record.event_name = 'bench.event'
+    record.log_level = 'INFO'
+    for i in range(whitelisted):
+        setattr(record, 'field_%d' % i, i)
+    for i in range(extra_attrs):
+        setattr(record, 'ignored_%d' % i, i)
+    return record
+
+
+def peak_bytes(fn, calls=100):
+    """average peak bytes allocated by a single call to fn"""
+    fn()
+    total = 0
+    for _ in range(calls):
+        tracemalloc.start()
+        fn()
+        total += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return total // calls
+
+
+def main(number=20000):
+    print('%8s %8s %12s %12s' % ('fields', 'extras', 'usec/call',
+                                 'peak bytes'))
+    for whitelisted, extra_attrs in [(0, 0), (5, 0), (5, 20), (50, 50)]:
+        formatter = pyzlog.JsonFormatter(
+            server_hostname='localhost',
+            fields=dict(('field_%d' % i, None) for i in range(whitelisted)))
+        record = make_record(whitelisted, extra_attrs)
+
+        def fn():
+            formatter.format(record)
+
+        usec = timeit.timeit(fn, number=number) / number * 1e6
+        peak = peak_bytes(fn) if tracemalloc else '-'
+        print('%8d %8d %12.2f %12s' % (whitelisted, extra_attrs, usec, peak))
+
+
+if __name__ == '__main__':
+    main()
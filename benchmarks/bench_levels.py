@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_levels
+----------------------------------
+
+Cost of pyzlog calls below the configured level, which should be
+dropped before any of the work of building a record is done. An enabled
+call to a handler that discards everything is timed for comparison.
+
+    python benchmarks/bench_levels.py
+"""
+
+import logging
+import timeit
+
+import pyzlog
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+
+
+def setup(logger_name):
+    logger = logging.getLogger(logger_name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(NullHandler())
+
+
+def main(number=200000):
+    extra = dict(('field_%d' % i, i) for i in range(5))
+    setup('bench')
+    # a nested logger without a level of its own
+    setup('bench.nested')
+    logging.getLogger('bench.nested').setLevel(logging.NOTSET)
+    print('%-32s %12s' % ('call', 'usec/call'))
+    for label, logger_name, fn in [
+            ('debug, disabled', 'bench', pyzlog.debug),
+            ('debug, disabled, nested logger', 'bench.nested.child',
+             pyzlog.debug),
+            ('info, enabled, null handler', 'bench', pyzlog.info)]:
+        def call():
+            fn(logger_name=logger_name, event_name='bench.event',
+               extra=extra)
+        usec = timeit.timeit(call, number=number) / number * 1e6
+        print('%-32s %12.3f' % (label, usec))
+
+
+if __name__ == '__main__':
+    main()
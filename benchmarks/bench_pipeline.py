@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_pipeline
+----------------------------------
+
+End to end throughput and latency of the pyzlog logging pipeline, from
+`pyzlog.info(...)` through `JsonFormatter.format` to the file handler.
+
+    python benchmarks/bench_pipeline.py --output results.json
+    python benchmarks/bench_pipeline.py --compare old.json new.json
+
+Every scenario is run against each directory in --dirs; by default that
+is /dev/shm (tmpfs) when it exists and the current directory (a real
+disk). Results are written as json so runs of different versions can be
+compared with --compare.
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import timeit
+
+import pyzlog
+
+clock = timeit.default_timer
+
+
+class Scenario(object):
+    """one benchmark configuration.
+
+    :param name: unique name, used to match results across runs
+    :param fields: number of whitelisted fields set on every record
+    :param exception: log from inside an except block with pyzlog.error
+    :param filtered: log below the configured level
+    :param threads: number of threads emitting records
+    :param init_kwargs: extra arguments passed to pyzlog.init_logs
+    """
+
+    def __init__(self, name, fields=5, exception=False, filtered=False,
+                 threads=1, **init_kwargs):
+        self.name = name
+        self.fields = fields
+        self.exception = exception
+        self.filtered = filtered
+        self.threads = threads
+        self.init_kwargs = init_kwargs
+
+    def emitter(self):
+        extra = dict(('field_%d' % i, i) for i in range(self.fields))
+        if self.filtered:
+            def emit():
+                pyzlog.debug(logger_name=self.logger_name,
+                             event_name='bench.event', extra=extra)
+        elif self.exception:
+            def emit():
+                try:
+                    raise ValueError('bench')
+                except ValueError:
+                    start = clock()
+                    pyzlog.error(logger_name=self.logger_name,
+                                 event_name='bench.event', extra=extra)
+                    return clock() - start
+        else:
+            def emit():
+                pyzlog.info(logger_name=self.logger_name,
+                            event_name='bench.event', extra=extra)
+        return emit
+
+    def setup(self, path):
+        self.logger_name = 'pyzlog.bench.%s' % self.name
+        logger = logging.getLogger(self.logger_name)
+        logger.propagate = False
+        pyzlog.init_logs(
+            path=path, target='%s.log' % self.name,
+            logger_name=self.logger_name,
+            level=logging.INFO if self.filtered else logging.DEBUG,
+            server_hostname='localhost',
+            fields=dict(('field_%d' % i, None) for i in range(self.fields)),
+            **self.init_kwargs)
+
+    def teardown(self):
+        pyzlog.shutdown()
+        logger = logging.getLogger(self.logger_name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+    def run(self, path, records):
+        """emit records spread over self.threads threads.
+
+        :return: wall clock seconds and per call latencies in seconds
+        """
+        self.setup(path)
+        emit = self.emitter()
+        per_thread = records // self.threads
+        latencies = [[] for _ in range(self.threads)]
+
+        def worker(out):
+            for _ in range(per_thread):
+                start = clock()
+                elapsed = emit()
+                out.append(elapsed if elapsed is not None
+                           else clock() - start)
+
+        threads = [threading.Thread(target=worker, args=(out,))
+                   for out in latencies]
+        start = clock()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # async writers are only done once their queue is drained
+        self.teardown()
+        wall = clock() - start
+        return wall, [latency for out in latencies for latency in out]
+
+
+scenarios = [
+    Scenario('fields_0', fields=0),
+    Scenario('fields_5', fields=5),
+    Scenario('fields_50', fields=50),
+    Scenario('exception', exception=True),
+    Scenario('filtered', filtered=True),
+    Scenario('threads_4', threads=4),
+    Scenario('threads_8', threads=8),
+    Scenario('async', async_mode=True),
+    Scenario('async_threads_4', threads=4, async_mode=True),
+    Scenario('batched', batch_records=100),
+    Scenario('thread_buffers_4', threads=4, thread_buffers=True),
+    Scenario('thread_buffers_8', threads=8, thread_buffers=True),
+    # every record is identical, like a storm of errors from a dependency
+    Scenario('dedup_storm', exception=True, dedup_window=1),
+    Scenario('async_dedup_storm', exception=True, async_mode=True,
+             dedup_window=1),
+]
+
+
+def percentile(ordered, pct):
+    index = min(len(ordered) - 1, int(len(ordered) * pct / 100.0))
+    return ordered[index]
+
+
+def summarize(scenario, target, wall, latencies):
+    ordered = sorted(latencies)
+    usec = dict(
+        (name, percentile(ordered, pct) * 1e6)
+        for name, pct in [('p50', 50), ('p90', 90), ('p99', 99),
+                          ('p999', 99.9)])
+    usec['max'] = ordered[-1] * 1e6
+    return {'name': scenario.name,
+            'target': target,
+            'threads': scenario.threads,
+            'records': len(latencies),
+            'records_per_sec': len(latencies) / wall,
+            'latency_usec': usec}
+
+
+def default_dirs():
+    dirs = ['/dev/shm'] if os.path.isdir('/dev/shm') else []
+    return dirs + ['.']
+
+
+def run(dirs, records, names=None):
+    results = []
+    for base in dirs:
+        path = tempfile.mkdtemp(prefix='pyzlog-bench-', dir=base)
+        try:
+            for scenario in scenarios:
+                if names and scenario.name not in names:
+                    continue
+                wall, latencies = scenario.run(path, records)
+                results.append(summarize(scenario, base, wall, latencies))
+                print_result(results[-1])
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+    return {'pyzlog_version': pyzlog.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'records': records,
+            'results': results}
+
+
+def print_result(result):
+    print('%-16s %-10s %12.0f rec/s  p50 %8.1f  p99 %8.1f  p999 %8.1f usec'
+          % (result['name'], result['target'], result['records_per_sec'],
+             result['latency_usec']['p50'], result['latency_usec']['p99'],
+             result['latency_usec']['p999']))
+
+
+def compare(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    old_results = dict(((r['name'], r['target']), r) for r in old['results'])
+    print('%-16s %-10s %14s %14s' % ('scenario', 'target',
+                                     'rec/s ratio', 'p99 ratio'))
+    for result in new['results']:
+        before = old_results.get((result['name'], result['target']))
+        if before is None:
+            continue
+        print('%-16s %-10s %14.2f %14.2f' % (
+            result['name'], result['target'],
+            result['records_per_sec'] / before['records_per_sec'],
+            result['latency_usec']['p99'] / before['latency_usec']['p99']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='pyzlog pipeline throughput and latency benchmarks')
+    parser.add_argument('--records', type=int, default=20000,
+                        help='records emitted per scenario')
+    parser.add_argument('--dirs', nargs='+', default=default_dirs(),
+                        help='directories to write the log files to')
+    parser.add_argument('--scenario', action='append', dest='names',
+                        help='only run the named scenario(s)')
+    parser.add_argument('--output', help='write json results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two json result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run(args.dirs, args.records, args.names)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_serializers
+----------------------------------
+
+Time of `JsonFormatter.format` for records whose fields need
+json_default: the type registry of `pyzlog.serializers` against the
+isinstance chain it replaced.
+
+    python benchmarks/bench_serializers.py
+"""
+
+import uuid
+import decimal
+import logging
+import datetime
+import timeit
+
+import pyzlog
+from pyzlog import serializers
+
+
+def isinstance_chain(obj):
+    """json_default before the registry"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.strftime(pyzlog.default_date_fmt)
+    else:
+        return str(obj)
+
+
+def values():
+    now = datetime.datetime(2015, 10, 31, 1, 2, 3, 4)
+    typed = [
+        ('datetime', lambda i: now + datetime.timedelta(seconds=i)),
+        ('date', lambda i: now.date()),
+        ('decimal', lambda i: decimal.Decimal(i) / 7),
+        ('uuid', lambda i: uuid.UUID(int=i)),
+        ('bytes', lambda i: bytearray(b'payload %d' % i)),
+    ]
+    if serializers.enum is not None:
+        Color = serializers.enum.Enum('Color', 'red green blue')
+        typed.append(('enum', lambda i: Color(i % 3 + 1)))
+    return typed
+
+
+def make_record(fields):
+    record = logging.LogRecord(
+        'bench', logging.INFO, __file__, 1, '', None, None)
+    record.event_name = 'bench.event'
+    record.log_level = 'INFO'
+    for key, value in fields.items():
+        setattr(record, key, value)
+    return record
+
+
+def main(number=5000, fields=10):
+    typed = values()
+    cases = [(name, lambda i, make=make: make(i)) for name, make in typed]
+    cases.append(('mixed', lambda i: typed[i % len(typed)][1](i)))
+    print('%10s %14s %14s' % ('fields', 'isinstance us', 'registry us'))
+    for name, make in cases:
+        fields_ = dict(('field_%d' % i, make(i)) for i in range(fields))
+        record = make_record(fields_)
+        times = []
+        for json_default in (isinstance_chain, serializers.registry):
+            formatter = pyzlog.JsonFormatter(
+                server_hostname='localhost', json_default=json_default,
+                fields=dict((key, None) for key in fields_))
+            times.append(min(timeit.repeat(lambda: formatter.format(record),
+                                           number=number, repeat=5))
+                         / number * 1e6)
+        print('%10s %14.2f %14.2f' % (name, times[0], times[1]))
+
+
+if __name__ == '__main__':
+    main()
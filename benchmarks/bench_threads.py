@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_threads
+----------------------------------
+
+Records/sec as the number of logging threads grows, for the default
+`init_logs` setup, batched writes and ``thread_buffers=True``, which
+formats outside of any shared lock.
+
+    python benchmarks/bench_threads.py
+    python benchmarks/bench_threads.py --records 100000 --threads 1 4 16
+"""
+
+import shutil
+import argparse
+import tempfile
+
+from bench_pipeline import Scenario, default_dirs
+
+setups = [
+    ('init_logs', {}),
+    ('batch_records', {'batch_records': 100}),
+    ('thread_buffers', {'thread_buffers': True}),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[4])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    parser.add_argument('--dirs', nargs='+', default=default_dirs()[:1])
+    args = parser.parse_args(argv)
+    print('%-16s %s' % ('rec/s', ' '.join('%10d' % threads
+                                          for threads in args.threads)))
+    for base in args.dirs:
+        path = tempfile.mkdtemp(prefix='pyzlog-bench-', dir=base)
+        try:
+            for name, init_kwargs in setups:
+                rates = []
+                for threads in args.threads:
+                    scenario = Scenario('%s_%d' % (name, threads),
+                                        threads=threads, **init_kwargs)
+                    wall, latencies = scenario.run(path, args.records)
+                    rates.append(len(latencies) / wall)
+                print('%-16s %s' % (name, ' '.join('%10.0f' % rate
+                                                   for rate in rates)))
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
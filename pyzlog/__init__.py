@@ -20,13 +20,20 @@ application_name, and fields will be present in every log entry.
 """
 
 import os
-import json
+import time
+import atexit
 import socket
 import logging
-import logging.handlers
 import traceback
-import datetime
 import functools
+import itertools
+import threading
+
+from . import metrics as _metrics
+from . import network as _network
+from . import handlers as _handlers
+from . import sampling as _sampling
+from . import serializers as _serializers
 
 __author__ = 'zeeto.io'
 __version__ = '0.1.3'
@@ -44,15 +51,153 @@ level_map = {
 }
 """check out the level_map"""
 
+_listeners = []
+_reporters = []
+
+_clock = _metrics.clock
+_count = _metrics.registry.add
+_count_record = _metrics.count_record
+_observe = _metrics.registry.observe
+
+
+class Lazy(object):
+    """A field value that is only computed if the entry is written.
+
+    Pass one in extra (or bind it) for fields that are expensive to
+    compute::
 
-def _default_json_default(obj):
-    """ Coerce everything to strings.
-    All objects representing time get output according to default_date_fmt.
+        pyzlog.debug(event_name='cache.miss',
+                     extra={'memory': pyzlog.Lazy(memory_stats)})
+
+    fn(*args, **kwargs) is called when the entry is formatted, so not at
+    all for calls below the logger's level, dropped by a limit or for
+    fields missing from the whitelist. With async_mode that happens on
+    the writer thread. The result replaces the Lazy on the record, so it
+    is computed once however many handlers format it, and a None result
+    is left out like any other None field. Only top level field values
+    are computed, not Lazy objects nested inside them.
+
+    :param fn: function computing the value
+    :param args: positional arguments for fn
+    :param kwargs: keyword arguments for fn
+    :type fn: callable
     """
-    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
-        return obj.strftime(default_date_fmt)
-    else:
-        return str(obj)
+
+    __slots__ = ('fn', 'args', 'kwargs')
+
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.fn(*self.args, **self.kwargs)
+
+
+class _TimestampCache(object):
+    """Renders epoch timestamps in default_date_fmt.
+
+    The strftime'd seconds prefix is reused until the second changes,
+    so most calls only have to append the microseconds. The cached
+    (second, prefix) pair is swapped in as a single tuple, so threads
+    racing across a second rollover never pair a prefix with the
+    wrong second.
+    """
+
+    def __init__(self):
+        self._cached = (None, None)
+
+    def render(self, timestamp):
+        """render an epoch timestamp, e.g. time.time() or record.created
+
+        :param timestamp: seconds since the epoch
+        :type timestamp: float
+        :rtype: string
+        """
+        seconds = int(timestamp)
+        micros = int(round((timestamp - seconds) * 1000000))
+        if micros == 1000000:
+            seconds, micros = seconds + 1, 0
+        cached_seconds, prefix = self._cached
+        if seconds != cached_seconds:
+            prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+            self._cached = (seconds, prefix)
+        return '%s.%06dZ' % (prefix, micros)
+
+
+class _TracebackCache(object):
+    """Renders exc_info like traceback.format_exception.
+
+    The rendered frames are kept in a bounded LRU cache keyed by the
+    exception type and the code and line of every frame, so the same
+    exception raised from the same place over and over is only rendered
+    once; only the exception message is rendered each time. Chained
+    exceptions are rendered in full every time.
+
+    :param size: number of tracebacks to keep, 0 to not cache
+    :param limit: only render the innermost limit frames
+    :type size: int
+    :type limit: int
+    """
+
+    header = 'Traceback (most recent call last):\n'
+
+    def __init__(self, size=256, limit=None):
+        self.size = size
+        self.limit = limit
+        # key: [rendered frames, when it was last used]; hits only bump
+        # the use count, the least recently used entry is looked for
+        # when a new one has to be added
+        self._frames = {}
+        self._clock = itertools.count()
+        self._lock = threading.Lock()
+
+    def render(self, exc_info):
+        """render exc_info, None if there is no exception
+
+        :param exc_info: exception type, value and traceback
+        :type exc_info: tuple
+        :rtype: list
+        """
+        etype, value, tb = exc_info
+        if etype is None:
+            return None
+        if (getattr(value, '__cause__', None) is not None or
+                (getattr(value, '__context__', None) is not None and
+                 not getattr(value, '__suppress_context__', False))):
+            return traceback.format_exception(
+                etype, value, tb, limit=-self.limit if self.limit else None)
+        if tb is None:
+            return traceback.format_exception_only(etype, value)
+        return (list(self._get_frames(etype, tb)) +
+                traceback.format_exception_only(etype, value))
+
+    def _get_frames(self, etype, tb):
+        key = [etype]
+        frame = tb
+        while frame is not None:
+            key.append((frame.tb_frame.f_code, frame.tb_lineno))
+            frame = frame.tb_next
+        key = tuple(key)
+        entry = self._frames.get(key)
+        if entry is not None:
+            entry[1] = next(self._clock)
+            return entry[0]
+        frames = traceback.extract_tb(tb)
+        rendered = [self.header]
+        if self.limit and len(frames) > self.limit:
+            rendered.append('  ... %d frames omitted ...\n'
+                            % (len(frames) - self.limit))
+            frames = frames[-self.limit:]
+        frames = tuple(rendered + traceback.format_list(frames))
+        if self.size:
+            with self._lock:
+                if len(self._frames) >= self.size:
+                    oldest = min(self._frames,
+                                 key=lambda k: self._frames[k][1])
+                    del self._frames[oldest]
+                self._frames[key] = [frames, next(self._clock)]
+        return frames
 
 
 class LogTest(object):
@@ -139,36 +284,93 @@ class JsonFormatter(logging.Formatter):
 
     :param fmt: passed to logging.Formatter
     :param datefmt: format for timestamp field. passed to logging.Formatter
+    :param json_default: called with values the serializer can't encode,
+        by default :data:`pyzlog.serializers.registry`
     :param application_name: app name to add to each log entry
     :param server_hostname: hostname to add to each log entry
     :param fields: whitelist of allowed fields for each log entry
+    :param timestamp_from_record: use the time the record was created
+        for event_timestamp instead of the time it is formatted
+    :param serializer: json encoder backend; 'json', 'simplejson',
+        'ujson', 'orjson', or 'auto' for the fastest one installed
+    :param traceback_limit: only include the innermost traceback_limit
+        frames of exception tracebacks
+    :param traceback_cache_size: number of rendered tracebacks to reuse
+        for exceptions raised again from the same place, 0 to render
+        every one
     :type fmt: string
     :type datefmt: string
+    :type json_default: callable
     :type application_name: string
     :type server_hostname: string
     :type fields: dict
+    :type timestamp_from_record: bool
+    :type serializer: string
+    :type traceback_limit: int
+    :type traceback_cache_size: int
 
     """
 
     def __init__(self,
                  fmt=None,
-                 json_default=_default_json_default,
+                 json_default=_serializers.registry,
                  application_name='default',
                  server_hostname=None,
-                 fields=None):
+                 fields=None,
+                 timestamp_from_record=False,
+                 serializer='json',
+                 traceback_limit=None,
+                 traceback_cache_size=256):
         self.json_default = json_default
+        self.timestamp_from_record = timestamp_from_record
+        self._timestamps = _TimestampCache()
+        self._tracebacks = _TracebackCache(traceback_cache_size,
+                                           traceback_limit)
         self.fields = fields.copy() if fields else {}
         self.fields.update(exception=None)
         self.defaults = {
             'application_name': application_name,
             'server_hostname': self.resolve_hostname(server_hostname)}
+        self._encode = _serializers.get_encoder(serializer, json_default)
+        self._envelope = self._build_envelope()
+        self._field_plan, self._envelope_fields = self._build_field_plan()
+
+    def _build_field_plan(self):
+        """compile the fields whitelist into the (key, default) pairs
+        format reads off of each record, so only whitelisted attributes
+        are ever looked at. event_name and log_level are pulled out
+        because a truthy value is used for the envelope, not the
+        fields; exc_info is only ever rendered as exception.
+        """
+        plan, envelope_fields = [], []
+        for key, default in self.fields.items():
+            if key == 'exc_info':
+                continue
+            elif key in ('event_name', 'log_level'):
+                envelope_fields.append((key, default))
+            else:
+                plan.append((key, default))
+        return tuple(plan), tuple(envelope_fields)
+
+    def _build_envelope(self):
+        """encode the parts of an entry that never change into a
+        template; format only has to fill in the per record values.
+        Key order matches what json.dumps produced for the full dict.
+        """
+        def static(key):
+            return self._encode(self.defaults[key]).replace('%', '%%')
+
+        return ''.join([
+            '{"server_hostname": ', static('server_hostname'),
+            ', "event_name": %s, "log_level": %s, "application_name": ',
+            static('application_name'),
+            ', "fields": %s, "event_timestamp": "%s"}'])
 
     def resolve_hostname(self, server_hostname=None):
-        return filter(
-            None, [server_hostname,
-                   os.getenv('HOSTNAME'),
-                   socket.gethostname(),
-                   'localhost'])[0]
+        return next(name for name in [server_hostname,
+                                      os.getenv('HOSTNAME'),
+                                      socket.gethostname(),
+                                      'localhost'] if name)
 
     def format(self, record):
         """formats a logging.Record into a standard json log entry
@@ -178,48 +380,74 @@ class JsonFormatter(logging.Formatter):
         :return: the formatted json string
         :rtype: string
         """
+        started = _clock()
+        event_name, log_level, fields, timestamp = self.entry(record)
+        encode = self._encode
+        entry = self._envelope % (encode(event_name),
+                                  encode(log_level),
+                                  encode(fields),
+                                  timestamp)
+        _count_record(record, log_level)
+        _observe('format_seconds', _clock() - started)
+        return entry
+
+    def entry(self, record):
+        """the parts of record's entry that change from record to record,
+        before they are encoded
 
-        record_fields = record.__dict__.copy()
-        self._set_exc_info(record_fields)
-
-        event_name = 'default'
-        if record_fields.get('event_name'):
-            event_name = record_fields.pop('event_name')
-
-        log_level = 'INFO'
-        if record_fields.get('log_level'):
-            log_level = record_fields.pop('log_level')
-
-        [record_fields.pop(k) for k in record_fields.keys()
-         if k not in self.fields]
-
-        defaults = self.defaults.copy()
-        fields = self.fields.copy()
-        fields.update(record_fields)
-        filtered_fields = {}
-        for k, v in fields.iteritems():
-            if v is not None:
-                filtered_fields[k] = v
-
-        defaults.update({
-            'event_timestamp': self._get_now(),
-            'event_name': event_name,
-            'log_level': log_level,
-            'fields': filtered_fields})
-
-        return json.dumps(defaults, default=self.json_default)
-
-    def _set_exc_info(self, record_fields):
-        if 'exc_info' in record_fields:
-            if record_fields['exc_info']:
-                exc_info = traceback.format_exception(
-                    *record_fields['exc_info'])
-                if exc_info != ['None\n']:
-                    record_fields['exception'] = exc_info
-            record_fields.pop('exc_info')
+        :param record: record to be formatted
+        :type record: logging.Record
+        :return: event_name, log_level, fields and event_timestamp
+        :rtype: tuple
+        """
+        values = record.__dict__
+
+        event_name = values.get('event_name') or 'default'
+        log_level = values.get('log_level') or 'INFO'
+
+        fields = {}
+        for key, default in self._field_plan:
+            value = values.get(key, default)
+            if value.__class__ is Lazy:
+                value = values[key] = value()
+            if value is not None:
+                fields[key] = value
+        for key, default in self._envelope_fields:
+            value = default if values.get(key) else values.get(key, default)
+            if value.__class__ is Lazy:
+                value = value()
+            if value is not None:
+                fields[key] = value
+
+        exception = self._format_exception(values.get('exc_info'))
+        if exception is not None:
+            fields['exception'] = exception
+        dropped = values.get('pyzlog_dropped')
+        if dropped is not None:
+            fields['dropped'] = dropped
+        pipeline = values.get('pyzlog_stats')
+        if pipeline is not None:
+            fields['stats'] = pipeline
+        repeats = values.get('pyzlog_repeats')
+        if repeats is not None:
+            count, first, last = repeats
+            fields['repeat_count'] = count
+            fields['first_timestamp'] = self._timestamps.render(first)
+            fields['last_timestamp'] = self._timestamps.render(last)
+        return event_name, log_level, fields, self._get_timestamp(record)
+
+    def _format_exception(self, exc_info):
+        if exc_info:
+            return self._tracebacks.render(exc_info)
+        return None
+
+    def _get_timestamp(self, record):
+        if self.timestamp_from_record:
+            return self._timestamps.render(record.created)
+        return self._get_now()
 
     def _get_now(self):
-        return datetime.datetime.utcnow().strftime(default_date_fmt)
+        return self._timestamps.render(time.time())
 
 
 def init_logs(path=None,
@@ -230,13 +458,118 @@ def init_logs(path=None,
               backupCount=5,
               application_name='default',
               server_hostname=None,
-              fields=None):
+              fields=None,
+              async_mode=False,
+              timestamp_from_record=False,
+              serializer='json',
+              batch_records=0,
+              batch_bytes=64*1024,
+              batch_interval=0.2,
+              process_safe=False,
+              compress=None,
+              when=None,
+              interval=1,
+              index=False,
+              traceback_limit=None,
+              traceback_cache_size=256,
+              address=None,
+              transport='tcp',
+              queue_size=None,
+              overflow='drop_lowest',
+              queue_timeout=1.0,
+              stats_interval=0,
+              thread_buffers=False,
+              binary=False,
+              dedup_window=0,
+              dedup_keys=10000):
     """Initialize the zlogger.
 
     Sets up a rotating file handler to the specified path and file with
     the given size and backup count limits, sets the default
     application_name, server_hostname, and default/whitelist fields.
 
+    With async_mode, records are put on a queue and a background writer
+    thread does the json formatting, file writes and rotation. That
+    includes rendering exception tracebacks, so an error storm doesn't
+    slow down the threads raising the errors. Queued records are written
+    out at interpreter exit, or when :func:`shutdown` is called.
+
+    With address, entries are sent to a collector as newline delimited
+    json over transport ('tcp', 'udp' or 'unix') by a background thread
+    with a persistent connection, instead of being written to a file.
+    Entries already queued are sent together, up to batch_records (100
+    by default) or batch_bytes at a time, and with batch_records the
+    sender waits up to batch_interval for a batch to fill. While the
+    collector is down, entries are kept in path/target.spill, up to
+    64MB, if path and target are given, and sent once it is back.
+
+    queue_size caps the records waiting on the async_mode writer (no
+    limit by default) or the entries waiting to be sent to address
+    (10000 by default). Once it is reached, overflow decides what is
+    dropped: 'drop_lowest' drops the oldest of the lowest level queued,
+    so errors survive a flood of debug logging, 'drop_oldest' and
+    'drop_newest' go by age alone, and 'block' makes the logging call
+    wait up to queue_timeout seconds for room. Dropped records are
+    counted by level, see :mod:`pyzlog.queues`.
+
+    With stats_interval, a pyzlog.stats event with :func:`stats` in its
+    stats field is logged every stats_interval seconds.
+
+    Rendered tracebacks are cached (see traceback_cache_size), so an
+    exception raised again from the same place only has its message
+    rendered. traceback_limit keeps just the innermost frames of deep
+    tracebacks.
+
+    With batch_records, formatted entries are buffered and written to the
+    file in a single write once batch_records entries or batch_bytes
+    characters are buffered, or batch_interval seconds have passed.
+    ERROR and above are written right away.
+
+    With thread_buffers, each thread formats its records without taking
+    a lock shared with other threads and buffers the lines itself; a
+    background writer writes out what every thread has buffered at
+    least every batch_interval seconds, once a thread has batch_records
+    (100 by default) lines buffered, or right away for ERROR and above.
+    Under the GIL throughput doesn't grow with more threads, but it no
+    longer drops as they contend for the handler's lock either. Lines
+    logged by different threads at about the same time may be written
+    out of order.
+
+    With binary, entries are written in the compact binary format of
+    :mod:`pyzlog.binary`, which writes the strings repeated on every
+    entry once per file. :mod:`pyzlog.reader` reads binary files, and
+    ``python -m pyzlog.binary`` converts them back to json lines. Each
+    entry is written right away unless batch_records is set.
+
+    With dedup_window, records identical to one logged less than
+    dedup_window seconds before, same event_name, log_level and fields,
+    are collapsed: the first is written as usual, and the repeats as a
+    single entry at the end of the window, with repeat_count,
+    first_timestamp and last_timestamp fields. Up to dedup_keys distinct
+    records are tracked at a time. See
+    :class:`pyzlog.handlers.DedupHandler`.
+
+    With process_safe, several processes can log to the same file, for
+    example pre-fork server workers. Entries are appended with atomic
+    O_APPEND writes and rotation is coordinated with a lock file. The
+    logs can be initialized before forking.
+
+    With compress, rotated backups are compressed with 'gzip' or 'zstd'
+    (which needs the zstandard package) by a background thread, so
+    rollover itself is just a rename. Backups are named target.1.gz,
+    target.2.gz, ... or target.1.zst, ...
+
+    With when ('S', 'M', 'H' or 'D') the file is also rotated at the end
+    of every interval periods, in UTC, or at maxBytes, whichever comes
+    first. Backups are then named for the start of their interval, e.g.
+    target.2016-01-07_13 for hourly files, and backupCount of them are
+    kept (0 keeps them all). Pass maxBytes=0 to rotate on time alone.
+
+    With index, a sidecar index of each backup is written in the
+    background as it is rotated, letting :mod:`pyzlog.reader` skip
+    straight to the entries for a time range or event_name. See
+    :mod:`pyzlog.index`.
+
     :param path: path to write the log file
     :param target: name of the log file
     :param logger_name: name of the logger (defaults to root)
@@ -245,6 +578,38 @@ def init_logs(path=None,
     :param application_name: app name to add to each log entry
     :param server_hostname: hostname to add to each log entry
     :param fields: default/whitelist fields.
+    :param async_mode: format and write from a background thread
+    :param timestamp_from_record: stamp entries with the time they were
+        logged rather than the time they were formatted; useful with
+        async_mode
+    :param serializer: json encoder backend, see :class:`JsonFormatter`
+    :param batch_records: entries per write, 0 to write every entry
+    :param batch_bytes: characters buffered before writing
+    :param batch_interval: longest an entry is buffered, in seconds
+    :param process_safe: allow several processes to share the log file
+    :param compress: compress rotated backups, 'gzip' or 'zstd'
+    :param when: also rotate every interval seconds, minutes, hours or days
+    :param interval: number of when periods per file
+    :param index: write a sidecar index for each backup
+    :param traceback_limit: innermost frames of tracebacks to include,
+        see :class:`JsonFormatter`
+    :param traceback_cache_size: rendered tracebacks to reuse
+    :param address: send entries to this (host, port), or unix socket
+        path, rather than writing them to a file
+    :param transport: 'tcp', 'udp' or 'unix'
+    :param queue_size: records queued before overflow applies, 0 for no
+        limit
+    :param overflow: 'drop_lowest', 'drop_oldest', 'drop_newest' or
+        'block'
+    :param queue_timeout: seconds to wait for room with 'block'
+    :param stats_interval: seconds between pyzlog.stats events, 0 for
+        none
+    :param thread_buffers: format on the logging threads without a
+        shared lock, and write from a background thread
+    :param binary: write the compact binary format instead of json
+    :param dedup_window: seconds to collapse identical records for, 0
+        to write every one
+    :param dedup_keys: distinct records tracked for dedup_window
     :type path: string
     :type target: string
     :type logger_name: string
@@ -254,40 +619,314 @@ def init_logs(path=None,
     :type application_name: string
     :type server_hostname: string
     :type fields: dict
+    :type async_mode: bool
+    :type timestamp_from_record: bool
+    :type serializer: string
+    :type batch_records: int
+    :type batch_bytes: int
+    :type batch_interval: float
+    :type process_safe: bool
+    :type compress: string
+    :type when: string
+    :type interval: int
+    :type index: bool
+    :type traceback_limit: int
+    :type traceback_cache_size: int
+    :type address: tuple or string
+    :type transport: string
+    :type queue_size: int
+    :type overflow: string
+    :type queue_timeout: float
+    :type stats_interval: float
+    :type thread_buffers: bool
+    :type binary: bool
+    :type dedup_window: float
+    :type dedup_keys: int
+    :raises ValueError: for thread_buffers with async_mode or address,
+        or binary with address, process_safe, thread_buffers or index
     """
-    log_file = os.path.abspath(
-        os.path.join(path, target))
+    if thread_buffers and (async_mode or address is not None):
+        raise ValueError('thread_buffers already writes from a background '
+                         'thread, it cannot be combined with async_mode '
+                         'or address')
+    if binary and (address is not None or process_safe or thread_buffers or
+                   index):
+        raise ValueError('binary files are written by a single handler '
+                         'keeping their string table, they cannot be '
+                         'combined with address, process_safe, '
+                         'thread_buffers or index')
+    if path is not None and target is not None:
+        log_file = os.path.abspath(
+            os.path.join(path, target))
+    else:
+        log_file = None
     logger = logging.getLogger(logger_name)
     logger.setLevel(level)
 
-    handler = logging.handlers.RotatingFileHandler(
-        log_file, maxBytes=maxBytes, backupCount=backupCount)
+    if address is not None:
+        handler = _network.NetworkHandler(
+            address, transport=transport, capacity=batch_records or 100,
+            flush_bytes=batch_bytes,
+            flush_interval=batch_interval if batch_records else 0,
+            queue_size=10000 if queue_size is None else queue_size,
+            overflow=overflow, queue_timeout=queue_timeout,
+            spill_path=log_file + '.spill' if log_file else None)
+        _metrics.registry.gauge('network.%s' % logger_name,
+                                functools.partial(_network_stats, handler))
+    elif binary:
+        handler = _handlers.BinaryRotatingFileHandler(
+            log_file, maxBytes=maxBytes, backupCount=backupCount,
+            capacity=batch_records or 1, flush_bytes=batch_bytes,
+            flush_interval=batch_interval if batch_records else 0,
+            compress=compress, when=when, interval=interval)
+    elif thread_buffers:
+        if process_safe:
+            writer = _handlers.ProcessSafeRotatingFileHandler
+        else:
+            writer = _handlers.BatchingRotatingFileHandler
+        handler = _handlers.ThreadBufferedHandler(
+            writer(log_file, maxBytes=maxBytes, backupCount=backupCount,
+                   flush_interval=0, compress=compress, when=when,
+                   interval=interval, index=index),
+            capacity=batch_records or 100, flush_interval=batch_interval)
+    elif process_safe:
+        handler = _handlers.ProcessSafeRotatingFileHandler(
+            log_file, maxBytes=maxBytes, backupCount=backupCount,
+            capacity=batch_records or 1, flush_bytes=batch_bytes,
+            flush_interval=batch_interval if batch_records else 0,
+            compress=compress, when=when, interval=interval, index=index)
+    elif batch_records:
+        handler = _handlers.BatchingRotatingFileHandler(
+            log_file, maxBytes=maxBytes, backupCount=backupCount,
+            capacity=batch_records, flush_bytes=batch_bytes,
+            flush_interval=batch_interval, compress=compress,
+            when=when, interval=interval, index=index)
+    else:
+        handler = _handlers.RotatingFileHandler(
+            log_file, maxBytes=maxBytes, backupCount=backupCount,
+            compress=compress, when=when, interval=interval, index=index)
     handler.setLevel(level)
 
     handler.setFormatter(
         JsonFormatter(
             application_name=application_name,
             server_hostname=server_hostname,
-            fields=fields))
+            fields=fields,
+            timestamp_from_record=timestamp_from_record,
+            serializer=serializer,
+            traceback_limit=traceback_limit,
+            traceback_cache_size=traceback_cache_size))
+
+    if dedup_window:
+        handler = _handlers.DedupHandler(handler, window=dedup_window,
+                                         max_keys=dedup_keys)
+        handler.setLevel(level)
+
+    if async_mode:
+        handler, listener = _handlers.queue_handler(
+            handler, queue_size=queue_size or 0, overflow=overflow,
+            timeout=queue_timeout)
+        _listeners.append((logger, handler, listener))
+        _metrics.registry.gauge('queues.%s' % logger_name,
+                                functools.partial(_queue_stats, handler.queue))
 
     logger.addHandler(handler)
 
+    if stats_interval:
+        stop = threading.Event()
+        reporter = threading.Thread(
+            target=_report_stats, args=(logger_name, stats_interval, stop),
+            name='pyzlog-stats')
+        reporter.daemon = True
+        reporter.start()
+        _reporters.append((stop, reporter))
+
+
+def shutdown():
+    """Stop any background writers started by init_logs.
+
+    Everything already queued is written out and the file handlers are
+    closed. Called automatically at interpreter exit.
+    """
+    while _reporters:
+        stop, reporter = _reporters.pop()
+        stop.set()
+        reporter.join()
+    while _listeners:
+        logger, handler, listener = _listeners.pop()
+        _metrics.registry.remove_gauge('queues.%s' % logger.name)
+        logger.removeHandler(handler)
+        listener.stop()
+        for wrapped in listener.handlers:
+            wrapped.close()
+
+
+atexit.register(shutdown)
+
+
+def stats():
+    """Snapshot of what pyzlog has done in this process, e.g.::
+
+        {'records': {'INFO': 1200, 'ERROR': 3},
+         'filtered': {'level': 52000, 'sampled': 800},
+         'bytes_written': 412000, 'rotations': 1,
+         'format_seconds': {'count': 1203, 'seconds': 0.018,
+                            'buckets': {'8': 1100, '16': 90, ...}},
+         'write_seconds': {...}, 'rotation_seconds': {...},
+         'queues': {'root': {'depth': 0, 'dropped': {'DEBUG': 10}}}}
+
+    records counts formatted entries by pyzlog level, once each however
+    many handlers they go to. write_seconds times the writes to log
+    files, without formatting or rollover. filtered counts
+    calls dropped for being below the logger's level, by :func:`limit`
+    or as duplicates within dedup_window. The histograms count timings
+    in power of two buckets, keyed by their upper bound in
+    microseconds. queues and network hold the queues of async_mode
+    writers and network senders, by logger name. Counting is done per
+    thread without locks; the counts are only added up here. See
+    :mod:`pyzlog.metrics`.
+
+    :rtype: dict
+    """
+    return _metrics.registry.snapshot()
+
+
+def _queue_stats(record_queue):
+    return {'depth': record_queue.qsize(), 'dropped': record_queue.dropped}
+
+
+def _network_stats(handler):
+    return {'depth': handler.queue.qsize(),
+            'dropped': handler.queue.dropped,
+            'sent': handler.sent,
+            'lost': handler.dropped}
+
+
+def _report_stats(logger_name, interval, stop):
+    logger = logging.getLogger(logger_name)
+    while True:
+        stop.wait(interval)
+        if stop.is_set():
+            break
+        logger.info('', extra={'event_name': 'pyzlog.stats',
+                               'log_level': 'NOTICE',
+                               'pyzlog_stats': stats()})
+
+
+def _report_dropped(logger_name, event_name, log_level, dropped, seconds):
+    logging.getLogger(logger_name).info(
+        '', extra={'event_name': 'pyzlog.dropped', 'log_level': 'NOTICE',
+                   'pyzlog_dropped': {'event_name': event_name,
+                                      'log_level': log_level,
+                                      'count': dropped,
+                                      'seconds': round(seconds, 3)}})
+
+
+_limiter = _sampling.Limiter(_report_dropped)
+# runs before shutdown, so the last report still gets written
+atexit.register(_limiter.flush)
+
+
+def limit(event_name=None, log_level=None, sample_rate=1.0, rate=None,
+          burst=None):
+    """Sample and/or rate limit log calls.
+
+    Applies to calls with the given event_name, log_level or both, and
+    replaces any limit already set for them. When several limits match a
+    call, the one for both its event_name and log_level is used, then
+    the one for its event_name, then its log_level. Calls are dropped
+    before any formatting is done.
+
+    Every minute a pyzlog.dropped event is logged for each limit that
+    dropped something, with the count in its dropped field, e.g.::
+
+        "fields": {"dropped": {"event_name": "cache.miss",
+                               "log_level": null,
+                               "count": 41234, "seconds": 60.0}}
+
+    :param event_name: event name to limit
+    :param log_level: pyzlog level to limit, e.g. 'DEBUG'
+    :param sample_rate: fraction of calls to keep, e.g. 0.01 for 1%
+    :param rate: calls to keep per second, after sampling
+    :param burst: calls to keep in a burst, defaults to rate
+    :type event_name: string
+    :type log_level: string
+    :type sample_rate: float
+    :type rate: float
+    :type burst: float
+    """
+    _limiter.add(event_name=event_name, log_level=log_level,
+                 sample_rate=sample_rate, rate=rate, burst=burst)
+
+
+def clear_limits():
+    """remove all limits set with :func:`limit`, logging what they
+    dropped since their last report"""
+    _limiter.clear()
+
+
+_levels = dict((method, getattr(logging, method.upper()))
+               for method, _ in level_map.values())
+"""stdlib level number of each logger method in level_map"""
+
+_loggers = {}
+
+
+def _get_logger(logger_name):
+    """logging.getLogger, without taking the logging module lock once a
+    name has been looked up. Loggers are never replaced, so this never
+    needs invalidating; logger.isEnabledFor keeps its own cache of
+    levels, which setLevel clears (python 3.7+).
+    """
+    logger = _loggers.get(logger_name)
+    if logger is None:
+        logger = _loggers.setdefault(logger_name,
+                                     logging.getLogger(logger_name))
+    return logger
+
+
+def _write(logger, logger_name, event_name, method, log_level, exc_info,
+           extra, bound=None):
+    if _limiter.rules and not _limiter.allow(logger_name, event_name,
+                                             log_level):
+        _count('filtered.sampled')
+        return
+    if bound:
+        fields = bound.copy()
+        if extra:
+            fields.update(extra)
+        extra = fields
+    else:
+        extra = extra.copy() if extra else {}
+    extra.update(event_name=event_name, log_level=log_level)
+    getattr(logger, method)('', exc_info=exc_info, extra=extra)
+
 
 def _log(logger_name='root', event_name=None,
          _type=None, exc_info=False, extra=None):
-    extra = extra.copy() if extra else {}
     method, log_level = level_map.get(_type, ('info', 'INFO'))
-    extra.update(event_name=event_name, log_level=log_level)
-    getattr(logging.getLogger(logger_name), method)(
-        '', exc_info=exc_info, extra=extra)
+    logger = _get_logger(logger_name)
+    if logger.isEnabledFor(_levels[method]):
+        _write(logger, logger_name, event_name, method, log_level,
+               exc_info, extra)
+    else:
+        _count('filtered.level')
 
 
 def _log_fn(exc_info=False):
     def wrap(logfunc):
+        method, log_level = level_map[logfunc.__name__]
+        levelno = _levels[method]
+
         @functools.wraps(logfunc)
-        def wrapped(*args, **kwargs):
-            kwargs.update(_type=logfunc.__name__, exc_info=exc_info)
-            return _log(*args, **kwargs)
+        def wrapped(logger_name='root', event_name=None, extra=None):
+            # nothing is copied or looked up for calls below the level
+            logger = _loggers.get(logger_name) or _get_logger(logger_name)
+            if logger.isEnabledFor(levelno):
+                _write(logger, logger_name, event_name, method, log_level,
+                       exc_info, extra)
+            else:
+                _count('filtered.level')
         return wrapped
     return wrap
 
@@ -341,3 +980,89 @@ def critical(**kwargs):
 def debug(**kwargs):
     """log with pyzlog level DEBUG"""
     pass
+
+
+_reserved_fields = frozenset(
+    ['message', 'asctime', 'event_name', 'log_level'] +
+    list(logging.LogRecord('', logging.INFO, '', 0, '', None, None).__dict__))
+"""names logging won't let extra fields overwrite, plus the envelope's"""
+
+
+def _bound_log_fn(_type, exc_info=False):
+    method, log_level = level_map[_type]
+    levelno = _levels[method]
+
+    def log(self, event_name=None, extra=None):
+        if self._logger.isEnabledFor(levelno):
+            _write(self._logger, self.logger_name, event_name, method,
+                   log_level, exc_info, extra, self.fields)
+        else:
+            _count('filtered.level')
+    log.__name__ = _type
+    log.__doc__ = globals()[_type].__doc__
+    return log
+
+
+class BoundLogger(object):
+    """Logs with a set of fields already merged into every entry's
+    extra, see :func:`bind`.
+
+    Has the same level methods as the pyzlog module, taking event_name
+    and extra; extra is merged over the bound fields.
+
+    :param logger_name: name of the logger to log to
+    :param fields: fields added to every entry
+    :type logger_name: string
+    :type fields: dict
+    """
+
+    __slots__ = ('logger_name', 'fields', '_logger')
+
+    def __init__(self, logger_name='root', fields=None):
+        fields = dict(fields or {})
+        clashes = _reserved_fields.intersection(fields)
+        if clashes:
+            raise ValueError('cannot bind %s, reserved by logging or pyzlog'
+                             % ', '.join(sorted(clashes)))
+        self.logger_name = logger_name
+        self.fields = fields
+        self._logger = _get_logger(logger_name)
+
+    def bind(self, **fields):
+        """a new BoundLogger with fields merged over these ones"""
+        merged = self.fields.copy()
+        merged.update(fields)
+        return BoundLogger(self.logger_name, merged)
+
+    emergency = _bound_log_fn('emergency')
+    alert = _bound_log_fn('alert')
+    notice = _bound_log_fn('notice')
+    info = _bound_log_fn('info')
+    warning = _bound_log_fn('warning')
+    error = _bound_log_fn('error', exc_info=True)
+    critical = _bound_log_fn('critical')
+    debug = _bound_log_fn('debug')
+
+
+def bind(logger_name='root', **fields):
+    """Bind fields, e.g. a request id, to a logger.
+
+    The returned :class:`BoundLogger` adds the fields to everything it
+    logs, without them being passed in and copied on every call::
+
+        log = pyzlog.bind(request_id=request.id, user_id=user.id)
+        log.info(event_name='request.start')
+        log = log.bind(tenant=tenant.name)
+        log.error(event_name='request.failed', extra={'status': 500})
+
+    Fields still have to be whitelisted in init_logs to be written out.
+
+    :param logger_name: name of the logger to log to
+    :param fields: fields added to every entry
+    :type logger_name: string
+    :return: the bound logger
+    :rtype: :class:`BoundLogger`
+    :raises ValueError: for fields named like LogRecord attributes, which
+        logging would refuse on every call
+    """
+    return BoundLogger(logger_name, fields)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""Logging from asyncio code without blocking the event loop.
+
+Logs are initialized with :func:`init_logs`, which is
+:func:`pyzlog.init_logs` with async_mode always on: the level functions
+here only put the record on a bounded queue, and the json formatting
+(by :class:`pyzlog.JsonFormatter`), file writes and rotation happen on
+the background writer thread.
+
+Fields bound with :func:`bind` are kept in a context variable, so they
+follow the task they were bound in, and any task it creates, without
+being passed around::
+
+    from pyzlog import aio
+
+    aio.init_logs(path='/var/log', target='foo_app.log')
+
+    async def handle(request):
+        aio.bind(request_id=request.id)
+        aio.info(event_name='request.start')
+        ...
+
+    async def main():
+        ...
+        await aio.aclose()
+
+Needs python 3.7 or later.
+
+"""
+
+import asyncio
+import contextlib
+import contextvars
+
+import pyzlog
+
+_fields = contextvars.ContextVar('pyzlog_fields', default=None)
+
+
+def init_logs(**kwargs):
+    """:func:`pyzlog.init_logs`, always with async_mode.
+
+    :raises ValueError: for overflow='block', which would stall the
+        event loop whenever the queue is full
+    """
+    if kwargs.get('overflow') == 'block':
+        raise ValueError("overflow='block' would block the event loop")
+    kwargs['async_mode'] = True
+    pyzlog.init_logs(**kwargs)
+
+
+def bind(**fields):
+    """add fields to every entry logged from the current context, i.e.
+    the current task and the tasks it goes on to create
+
+    :return: token to pass to :func:`unbind`
+    :raises ValueError: for fields named like LogRecord attributes
+    """
+    clashes = pyzlog._reserved_fields.intersection(fields)
+    if clashes:
+        raise ValueError('cannot bind %s, reserved by logging or pyzlog'
+                         % ', '.join(sorted(clashes)))
+    merged = dict(_fields.get() or {})
+    merged.update(fields)
+    return _fields.set(merged)
+
+
+def unbind(token):
+    """restore the fields bound before the bind call that returned
+    token"""
+    _fields.reset(token)
+
+
+@contextlib.contextmanager
+def bound(**fields):
+    """bind fields for the duration of a with block"""
+    token = bind(**fields)
+    try:
+        yield
+    finally:
+        unbind(token)
+
+
+def fields():
+    """the fields bound in the current context"""
+    return dict(_fields.get() or {})
+
+
+def _log_fn(_type, exc_info=False):
+    method, log_level = pyzlog.level_map[_type]
+    levelno = pyzlog._levels[method]
+
+    def log(logger_name='root', event_name=None, extra=None):
+        logger = pyzlog._get_logger(logger_name)
+        if logger.isEnabledFor(levelno):
+            pyzlog._write(logger, logger_name, event_name, method,
+                          log_level, exc_info, extra, _fields.get())
+        else:
+            pyzlog._count('filtered.level')
+    log.__name__ = _type
+    log.__doc__ = getattr(pyzlog, _type).__doc__
+    return log
+
+
+emergency = _log_fn('emergency')
+alert = _log_fn('alert')
+notice = _log_fn('notice')
+info = _log_fn('info')
+warning = _log_fn('warning')
+error = _log_fn('error', exc_info=True)
+critical = _log_fn('critical')
+debug = _log_fn('debug')
+
+
+def _flush():
+    for _, _, listener in list(pyzlog._listeners):
+        listener.flush()
+
+
+def flush():
+    """wait, off the event loop, for everything logged so far to be
+    written; use as ``await aio.flush()``
+
+    :rtype: asyncio.Future
+    :raises RuntimeError: if called without a running event loop
+    """
+    return asyncio.get_running_loop().run_in_executor(None, _flush)
+
+
+def aclose():
+    """write out everything queued and stop the writers, see
+    :func:`pyzlog.shutdown`; use as ``await aio.aclose()``
+
+    :rtype: asyncio.Future
+    :raises RuntimeError: if called without a running event loop
+    """
+    return asyncio.get_running_loop().run_in_executor(None,
+                                                      pyzlog.shutdown)
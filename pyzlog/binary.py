@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+
+"""Compact binary log files, and converting them back to json.
+
+With ``binary=True``, :func:`pyzlog.init_logs` writes entries as
+length prefixed frames instead of json lines. The strings repeated on
+every entry (server_hostname, application_name, event_name, log_level
+and field names) are written once per file: each distinct combination
+of them, the entry's shape, is defined once and entries refer to it by
+number. Field values are still encoded by the formatter's json
+serializer, as one json array per entry, and event_timestamp is stored
+as microseconds since the epoch.
+
+The format saves space, not time: files are several times smaller,
+but as field values are still json, writing and reading run at about
+the rate of json lines, and with many fields reading can be slower.
+
+A file is made of segments. Each segment starts with a header frame
+followed by every definition made so far, so a file can be read on its
+own, and a process appending to an existing file starts a segment of
+its own. Frames are a varint length, then that many bytes of payload:
+
+* header: ``0x00 'PZLB' version``
+* string: ``0x01``, varint id, utf-8 string
+* shape: ``0x03``, varint id, varint number of fields, then the
+  server_hostname, application_name, event_name, log_level and field
+  names as strings
+* entry: ``0x02``, shape, timestamp, json array of the field values
+* base: ``0x04``, varint microseconds since the epoch the next
+  timestamp is relative to, at the start of a segment
+
+Strings and shapes are written as their id plus one, or as 0 followed
+by the string (varint length and utf-8 bytes) or shape once
+max_strings of them have been defined. The timestamp is the change in
+microseconds since the epoch from the previous timestamp, or from the
+segment's base, zigzag encoded (0, -1, 1, -2... as 0, 1, 2, 3...) plus one,
+or 0 and a string for timestamps not in default_date_fmt.
+
+Binary files are read by :mod:`pyzlog.reader` like any other log file,
+and converted to json lines, identical to what
+:class:`pyzlog.JsonFormatter` writes with the default serializer,
+with::
+
+    python -m pyzlog.binary /var/log/app.log.1 > app.log.1.json
+
+"""
+
+import sys
+import json
+import time
+import calendar
+
+from . import metrics as _metrics
+
+version = 1
+
+HEADER, STRING, ENTRY, SHAPE, BASE = 0, 1, 2, 3, 4
+
+magic = bytes(b'\x06\x00PZLB' + bytearray([version]))
+"""the header frame every segment, and so every binary file, starts with"""
+
+_encode_json = json.JSONEncoder().encode
+_clock = _metrics.clock
+_count_record = _metrics.count_record
+_observe = _metrics.registry.observe
+_no_values = b'[]'
+# raw_decode skips the wrapping json.loads and decode add to each entry
+_decode_json = json.JSONDecoder().raw_decode
+
+try:
+    _text = unicode
+except NameError:
+    _text = str
+
+
+def _varint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _utf8(string):
+    if isinstance(string, bytes):
+        return string
+    if not isinstance(string, _text):
+        # an event name or level logged as a number, say, is written
+        # as its text rather than losing the record
+        string = _text(string)
+    return string.encode('utf-8')
+
+
+def _frame(payload):
+    frame = bytearray()
+    _varint(frame, len(payload))
+    return frame + payload
+
+
+class Encoder(object):
+    """Encodes records into frames, keeping the strings and shapes
+    defined so far. Not thread safe; handlers only use it while holding
+    their lock.
+
+    :param max_strings: strings, and shapes, to define before writing
+        the rest in full
+    :type max_strings: int
+    """
+
+    def __init__(self, max_strings=4096):
+        self.max_strings = max_strings
+        self.strings = {}
+        self.shapes = {}
+        self._definitions = bytearray()
+        self._seconds = (None, None)
+        self.micros = 0
+        """the timestamp the next entry's is encoded relative to"""
+
+    def header(self, base=None):
+        """frames starting a new segment: the header, every definition
+        made so far and the base timestamp
+
+        :param base: the value micros had before the first entry written
+            after the header was encoded, micros by default
+        :type base: int
+        """
+        payload = bytearray([BASE])
+        _varint(payload, self.micros if base is None else base)
+        return bytes(magic + self._definitions + _frame(payload))
+
+    def _define(self, payload, definitions):
+        definition = _frame(payload)
+        self._definitions += definition
+        definitions += definition
+
+    def _string(self, string, out, definitions):
+        """write string, or its id, to out, adding a definition of it to
+        definitions if it is new"""
+        id = self.strings.get(string)
+        if id is None:
+            if len(self.strings) >= self.max_strings:
+                out.append(0)
+                data = _utf8(string)
+                _varint(out, len(data))
+                out += data
+                return
+            id = self.strings[string] = len(self.strings)
+            payload = bytearray([STRING])
+            _varint(payload, id)
+            payload += _utf8(string)
+            self._define(payload, definitions)
+        _varint(out, id + 1)
+
+    def _shape(self, shape, out, definitions):
+        """write shape, the names of an entry, or its id, to out"""
+        id = self.shapes.get(shape)
+        if id is None:
+            body = bytearray()
+            _varint(body, len(shape) - 4)
+            for string in shape:
+                self._string(string, body, definitions)
+            if len(self.shapes) >= self.max_strings:
+                out.append(0)
+                out += body
+                return
+            id = self.shapes[shape] = len(self.shapes)
+            payload = bytearray([SHAPE])
+            _varint(payload, id)
+            self._define(payload + body, definitions)
+        _varint(out, id + 1)
+
+    def _timestamp(self, timestamp, out):
+        if (len(timestamp) == 27 and timestamp[19] == '.' and
+                timestamp[26] == 'Z'):
+            prefix = timestamp[:19]
+            cached, seconds = self._seconds
+            try:
+                if prefix != cached:
+                    seconds = calendar.timegm(
+                        time.strptime(prefix, '%Y-%m-%dT%H:%M:%S'))
+                    self._seconds = (prefix, seconds)
+                micros = seconds * 1000000 + int(timestamp[20:26])
+                delta = micros - self.micros
+                self.micros = micros
+                delta = (delta << 1 if delta >= 0 else ~delta << 1 | 1) + 1
+                if delta < 0x80:
+                    out.append(delta)
+                else:
+                    _varint(out, delta)
+                return
+            except ValueError:
+                pass
+        out.append(0)
+        data = _utf8(timestamp)
+        _varint(out, len(data))
+        out += data
+
+    def encode(self, formatter, record):
+        """frames for record: definitions of any new strings and shapes,
+        then the entry
+
+        :param formatter: provides the entry and encodes field values
+        :type formatter: :class:`pyzlog.JsonFormatter`
+        :type record: logging.LogRecord
+        :rtype: bytes
+        """
+        started = _clock()
+        event_name, log_level, fields, timestamp = formatter.entry(record)
+        defaults = formatter.defaults
+        shape = (defaults['server_hostname'], defaults['application_name'],
+                 event_name, log_level) + tuple(fields)
+        definitions = bytearray()
+        id = self.shapes.get(shape)
+        if id is not None and id < 0x7f:
+            payload = bytearray((ENTRY, id + 1))
+        else:
+            payload = bytearray([ENTRY])
+            self._shape(shape, payload, definitions)
+        self._timestamp(timestamp, payload)
+        if fields:
+            payload += _utf8(formatter._encode(list(fields.values())))
+        else:
+            payload += _no_values
+        _varint(definitions, len(payload))
+        definitions += payload
+        data = bytes(definitions)
+        _count_record(record, log_level)
+        _observe('format_seconds', _clock() - started)
+        return data
+
+
+def _read_varint(data, position):
+    n = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, position
+        shift += 7
+
+
+def _read_frames(f, chunk_bytes=64*1024):
+    """payloads of the frames in f, stopping at a truncated frame"""
+    data = bytearray()
+    position = 0
+    while True:
+        try:
+            length, start = _read_varint(data, position)
+            end = start + length
+            if end > len(data):
+                raise IndexError
+        except IndexError:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            data = data[position:] + chunk
+            position = 0
+            continue
+        yield data[start:end]
+        position = end
+
+
+class _Timestamps(object):
+    """renders microseconds since the epoch in default_date_fmt,
+    reusing the seconds prefix while it doesn't change"""
+
+    def __init__(self):
+        self._cached = (None, None)
+
+    def render(self, micros):
+        seconds, micros = divmod(micros, 1000000)
+        cached, prefix = self._cached
+        if seconds != cached:
+            prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+            self._cached = (seconds, prefix)
+        return '%s.%06dZ' % (prefix, micros)
+
+
+class _Decoder(object):
+    """the strings and shapes defined in the current segment"""
+
+    def __init__(self):
+        self.strings = {}
+        self.shapes = {}
+
+    def string(self, payload, position):
+        id, position = _read_varint(payload, position)
+        if id:
+            return self.strings[id - 1], position
+        length, position = _read_varint(payload, position)
+        end = position + length
+        return payload[position:end].decode('utf-8'), end
+
+    def shape(self, payload, position):
+        """(server_hostname, application_name, event_name, log_level,
+        field names) and the position after them"""
+        count, position = _read_varint(payload, position)
+        names = []
+        for _ in range(count + 4):
+            name, position = self.string(payload, position)
+            names.append(name)
+        return (names[0], names[1], names[2], names[3],
+                tuple(names[4:])), position
+
+
+def _entries(f):
+    """the entries of f as (server_hostname, application_name,
+    event_name, log_level, field names, field values, event_timestamp)"""
+    decoder = _Decoder()
+    timestamps = _Timestamps()
+    micros = 0
+    no_values = ()
+    for payload in _read_frames(f):
+        kind = payload[0]
+        if kind == ENTRY:
+            id = payload[1]
+            if id < 0x80:
+                position = 2
+            else:
+                id, position = _read_varint(payload, 1)
+            if id:
+                host, application, event_name, log_level, keys = (
+                    decoder.shapes[id - 1])
+            else:
+                (host, application, event_name, log_level,
+                 keys), position = decoder.shape(payload, position)
+            delta = payload[position]
+            if delta < 0x80:
+                position += 1
+            else:
+                delta, position = _read_varint(payload, position)
+            if delta:
+                delta -= 1
+                micros += ~(delta >> 1) if delta & 1 else delta >> 1
+                timestamp = timestamps.render(micros)
+            else:
+                length, position = _read_varint(payload, position)
+                timestamp = payload[position:position + length].decode(
+                    'utf-8')
+                position += length
+            if keys:
+                values = _decode_json(payload[position:].decode('utf-8'))[0]
+            else:
+                values = no_values
+            yield (host, application, event_name, log_level, keys, values,
+                   timestamp)
+        elif kind == STRING:
+            id, position = _read_varint(payload, 1)
+            decoder.strings[id] = payload[position:].decode('utf-8')
+        elif kind == SHAPE:
+            id, position = _read_varint(payload, 1)
+            decoder.shapes[id] = decoder.shape(payload, position)[0]
+        elif kind == BASE:
+            micros = _read_varint(payload, 1)[0]
+        elif kind == HEADER:
+            decoder = _Decoder()
+            micros = 0
+
+
+def entries(f):
+    """lazily decode the entries of a binary log file
+
+    :param f: file object opened for reading bytes
+    :return: generator of (server_hostname, application_name,
+        event_name, log_level, fields, event_timestamp), where fields
+        is a list of (name, value) pairs in the order they were written
+    """
+    for (host, application, event_name, log_level, keys, values,
+         timestamp) in _entries(f):
+        yield (host, application, event_name, log_level,
+               list(zip(keys, values)), timestamp)
+
+
+def read(f):
+    """lazily decode the entries of a binary log file as dicts, like
+    json.loads of a json log line
+
+    :param f: file object opened for reading bytes
+    :return: generator of entries as dicts
+    """
+    for (host, application, event_name, log_level, keys, values,
+         timestamp) in _entries(f):
+        yield {'server_hostname': host,
+               'event_name': event_name,
+               'log_level': log_level,
+               'application_name': application,
+               'fields': dict(zip(keys, values)),
+               'event_timestamp': timestamp}
+
+
+def to_json(entry):
+    """render an entry from :func:`entries` as the json line
+    :class:`pyzlog.JsonFormatter` writes, without the newline"""
+    host, application, event_name, log_level, fields, timestamp = entry
+    return ('{"server_hostname": %s, "event_name": %s, "log_level": %s, '
+            '"application_name": %s, "fields": {%s}, '
+            '"event_timestamp": "%s"}' % (
+                _encode_json(host), _encode_json(event_name),
+                _encode_json(log_level), _encode_json(application),
+                ', '.join('%s: %s' % (_encode_json(key), _encode_json(value))
+                          for key, value in fields),
+                timestamp))
+
+
+def is_binary(f):
+    """whether f, opened for reading bytes, holds a binary log, leaving
+    it at the start"""
+    if hasattr(f, 'peek'):
+        head = f.peek(len(magic))[:len(magic)]
+    else:
+        head = f.read(len(magic))
+        f.seek(0)
+    return head == magic
+
+
+def convert(f, out):
+    """write the entries of binary log file f to out as json lines
+
+    :param f: file object opened for reading bytes
+    :param out: file object opened for writing text
+    """
+    for entry in entries(f):
+        out.write(to_json(entry))
+        out.write('\n')
+
+
+def main(argv=None):
+    # argparse is 2.7+; imported here so pyzlog itself imports on 2.6
+    import argparse
+    from .reader import open_log
+    parser = argparse.ArgumentParser(
+        description='convert binary pyzlog log files to json lines')
+    parser.add_argument('files', nargs='+', metavar='FILE',
+                        help='binary log files or compressed backups')
+    args = parser.parse_args(argv)
+    for filename in args.files:
+        f = open_log(filename)
+        try:
+            convert(f, sys.stdout)
+        finally:
+            f.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1219 @@
+# -*- coding: utf-8 -*-
+
+"""Handlers used by pyzlog to move formatting and file I/O off of the
+calling thread, to cut down on the number of writes, and to rotate and
+compress log files.
+
+You should not need to use these directly; pass ``async_mode=True``,
+``batch_records``, ``process_safe``, ``thread_buffers``, ``compress``,
+``index`` or ``dedup_window`` to :func:`pyzlog.init_logs` instead.
+
+"""
+
+import collections
+import functools
+import gzip
+import logging
+import logging.handlers
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from . import metrics as _metrics
+from . import queues as _queues
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+class QueueHandler(logging.Handler):
+    """Hands records off to a queue instead of formatting and writing
+    them on the calling thread.
+
+    :param record_queue: queue records are put on
+    :type record_queue: :class:`pyzlog.queues.BoundedQueue`
+    """
+
+    def __init__(self, record_queue):
+        logging.Handler.__init__(self)
+        self.queue = record_queue
+
+    def handle(self, record):
+        _check_fork()
+        return logging.Handler.handle(self, record)
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+    def emit(self, record):
+        try:
+            self.enqueue(record)
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """Background writer thread for a :class:`QueueHandler`.
+
+    Pulls records off of the queue and passes them to the wrapped
+    handlers, which do the json formatting and the file writes. A
+    listener started before forking starts a new thread in the child,
+    with an empty queue.
+
+    :param record_queue: queue records are read from
+    :param handlers: handlers that will process each record
+    :type record_queue: :class:`pyzlog.queues.BoundedQueue`
+    :type handlers: logging.Handler
+    """
+    _sentinel = None
+
+    def __init__(self, record_queue, *handlers):
+        self.queue = record_queue
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        """start the background writer thread"""
+        self._thread = threading.Thread(
+            target=self._monitor, name='pyzlog-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        _fork_handlers.add(self)
+
+    def _after_fork(self):
+        self.queue._after_fork()
+        if self._thread is not None:
+            self.start()
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                break
+            try:
+                self.handle(record)
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """wait until everything already queued is written"""
+        self.queue.join()
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self):
+        """write out everything already queued, then stop the thread"""
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+        _fork_handlers.discard(self)
+        for handler in self.handlers:
+            handler.flush()
+
+
+def _gzip(source, destination):
+    with open(source, 'rb') as src:
+        dst = gzip.open(destination, 'wb')
+        try:
+            shutil.copyfileobj(src, dst)
+        finally:
+            dst.close()
+
+
+def _zstd(source, destination):
+    import zstandard
+    with open(source, 'rb') as src:
+        with open(destination, 'wb') as dst:
+            zstandard.ZstdCompressor().copy_stream(src, dst)
+
+
+compressors = {
+    'gzip': ('.gz', _gzip),
+    'zstd': ('.zst', _zstd),
+}
+"""file extension and compress(source, destination) for each compress
+option init_logs accepts"""
+
+
+class _Locked(object):
+    """hold an exclusive flock on path, when the platform has flock and
+    path isn't None"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None and self.path is not None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _remove_backup(backup):
+    """remove a backup and its index"""
+    # index is imported where it's used rather than with the package,
+    # so python -m pyzlog.index doesn't find itself already imported
+    from . import index as _index
+    for filename in (backup, backup + _index.index_suffix):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def _rename_backup(source, destination, rename=os.rename):
+    """move a backup and its index, replacing whatever is there"""
+    from . import index as _index
+    _remove_backup(destination)
+    rename(source, destination)
+    if os.path.exists(source + _index.index_suffix):
+        os.rename(source + _index.index_suffix,
+                  destination + _index.index_suffix)
+
+
+def _shift_backups(base, backupCount, suffix='', name=None):
+    """move base.N to base.N+1, dropping the oldest, to free up base.1
+
+    :param name: called with each default backup name, returning the
+        name to use, like a handler's namer
+    """
+    name = name or (lambda default: default)
+    for i in range(backupCount - 1, 0, -1):
+        source = name('%s.%d%s' % (base, i, suffix))
+        destination = name('%s.%d%s' % (base, i + 1, suffix))
+        if os.path.exists(source):
+            _rename_backup(source, destination)
+    destination = name('%s.1%s' % (base, suffix))
+    _remove_backup(destination)
+    return destination
+
+
+class Compressor(object):
+    """Background thread that compresses and indexes rotated files.
+
+    Rollover only renames the log file to a unique pending name and
+    hands it to the compressor, so the logging thread never waits on
+    compression or indexing. The compressor writes the compressed copy
+    and the index, then shifts the backups and moves the new one into
+    place, e.g. as base.1.gz. Backups show up once they are done, in the
+    order this process rotated them.
+
+    With a grace period, for files other processes may still append
+    to, the final check that pending is unchanged, its removal and the
+    install are done holding an exclusive lock on base.lock. Writers
+    hold a shared lock on it while they check their file is still there
+    and write to it, so nothing is appended to pending once it is
+    removed.
+
+    :param compress: one of the names in compressors, or None to only
+        index
+    :param index: write a sidecar index for each backup, see
+        :mod:`pyzlog.index`
+    :type compress: string
+    :type index: bool
+    :raises ValueError: for an unknown compress name
+    :raises ImportError: if compress is 'zstd' and zstandard is missing
+    """
+    _sentinel = None
+
+    def __init__(self, compress='gzip', index=False):
+        if compress is not None and compress not in compressors:
+            raise ValueError('unknown compress %r, expected one of %s'
+                             % (compress, ', '.join(sorted(compressors))))
+        if compress == 'zstd':
+            import zstandard  # noqa
+        self.suffix, self.compress = compressors.get(compress, ('', None))
+        self.index = index
+        self.queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, pending, base, install, grace=0):
+        """compress pending and install it as a backup of base.
+
+        install is called with the compressed file and its extension,
+        and moves it into place. With grace,
+        pending is only compressed once it has gone grace seconds
+        without being written to, for files other processes may still
+        be appending to.
+        """
+        if self._pid != os.getpid():
+            # first submit, or a forked child that didn't inherit the thread
+            self.queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._monitor, name='pyzlog-compressor')
+            self._thread.daemon = True
+            self._thread.start()
+        self.queue.put((pending, base, install, grace))
+
+    def _monitor(self):
+        while True:
+            job = self.queue.get()
+            if job is self._sentinel:
+                break
+            try:
+                self._compress(*job)
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def _compress(self, pending, base, install, grace):
+        from . import index as _index
+        compressed = pending + self.suffix
+        done = None
+        while True:
+            stat = os.stat(pending)
+            idle = time.time() - stat.st_mtime
+            if idle < grace:
+                time.sleep(grace - idle)
+                continue
+            if (stat.st_size, stat.st_mtime) != done:
+                if self.compress is not None:
+                    self.compress(pending, compressed)
+                if self.index:
+                    _index.rebuild(pending,
+                                   compressed + _index.index_suffix)
+                done = (stat.st_size, stat.st_mtime)
+            with _Locked(base + '.lock' if grace else None):
+                stat = os.stat(pending)
+                if (stat.st_size, stat.st_mtime) != done:
+                    # appended to since, compress it again
+                    continue
+                if self.compress is not None:
+                    os.remove(pending)
+                install(compressed, self.suffix)
+            return
+
+    def stop(self):
+        """finish compressing everything submitted, then stop"""
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+
+
+rollover_periods = {
+    'S': (1, '%Y-%m-%d_%H-%M-%S', r'\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}'),
+    'M': (60, '%Y-%m-%d_%H-%M', r'\d{4}-\d{2}-\d{2}_\d{2}-\d{2}'),
+    'H': (60 * 60, '%Y-%m-%d_%H', r'\d{4}-\d{2}-\d{2}_\d{2}'),
+    'D': (24 * 60 * 60, '%Y-%m-%d', r'\d{4}-\d{2}-\d{2}'),
+}
+"""seconds, backup name format and pattern for each value of when"""
+
+
+class RotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """logging.handlers.RotatingFileHandler that can also rotate on a
+    schedule and compress its backups in the background.
+
+    Without when, backups are numbered base.1, base.2, ... like the
+    stdlib handler. With when, the file is also rolled over at the end
+    of every interval (aligned to UTC) or once it reaches maxBytes,
+    whichever comes first, and backups are named for the UTC start of
+    their interval, e.g. base.2016-01-07_13 for when='H'. Files rotated
+    for size within an interval get .1, .2, ... appended. backupCount
+    limits the number of timestamped backups kept, 0 keeps them all.
+
+    The time check compares record.created against the precomputed
+    rollover_at deadline, so it costs nothing per record.
+
+    The stdlib namer and rotator hooks, on python 3, are used for
+    numbered backups; rotator also moves timestamped ones into place,
+    which are always named by backup_format. With compress, rotator is
+    handed the compressed file.
+
+    Bytes written, write times and rotations are counted in
+    :mod:`pyzlog.metrics`.
+
+    :param filename: log file to write to
+    :param maxBytes: size of the file before rotation
+    :param backupCount: number of rotated files to keep
+    :param delay: don't open the file until the first write
+    :param compress: compress backups, 'gzip' or 'zstd'
+    :param when: rotation period, 'S', 'M', 'H' or 'D'
+    :param interval: number of periods per file
+    :param index: write a sidecar index for each backup
+    :type filename: string
+    :type maxBytes: int
+    :type backupCount: int
+    :type delay: bool
+    :type compress: string
+    :type when: string
+    :type interval: int
+    :type index: bool
+    :raises ValueError: for an unknown when
+    """
+
+    compress_grace = 0
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, delay=False,
+                 compress=None, when=None, interval=1, index=False):
+        self.compressor = (Compressor(compress, index)
+                           if compress or index else None)
+        self._unwritten = 0
+        self._formatted = (None, None)
+        self._started = None
+        logging.handlers.RotatingFileHandler.__init__(
+            self, filename, maxBytes=maxBytes, backupCount=backupCount,
+            delay=delay)
+        self.when = when.upper() if when else None
+        self.rollover_at = None
+        if self.when is None:
+            return
+        if self.when not in rollover_periods:
+            raise ValueError('unknown when %r, expected one of %s'
+                             % (when, ', '.join(sorted(rollover_periods))))
+        seconds, self.backup_format, pattern = rollover_periods[self.when]
+        self.rollover_interval = seconds * interval
+        self.backup_pattern = re.compile(
+            r'^%s\.(%s)(?:\.(\d+))?(?:\.gz|\.zst)?$'
+            % (re.escape(os.path.basename(self.baseFilename)), pattern))
+        if os.path.exists(self.baseFilename):
+            started = os.stat(self.baseFilename).st_mtime
+        else:
+            started = time.time()
+        self.rollover_at = self.compute_rollover(started)
+
+    def compute_rollover(self, now):
+        """end of the interval now falls in"""
+        interval = self.rollover_interval
+        return (int(now) // interval + 1) * interval
+
+    def due(self, now):
+        """whether the current interval has ended by now"""
+        return self.rollover_at is not None and now >= self.rollover_at
+
+    def shouldRollover(self, record):
+        if self.due(record.created):
+            return 1
+        return logging.handlers.RotatingFileHandler.shouldRollover(
+            self, record)
+
+    def _next_period(self):
+        """move rollover_at on past now and return the start of the
+        interval the current file was written in
+        """
+        if self.rollover_at is None:
+            return None
+        started = self.rollover_at - self.rollover_interval
+        self.rollover_at = self.compute_rollover(time.time())
+        return started
+
+    def rotate_files(self):
+        """move the current file out of the way as the newest backup"""
+        started = self._next_period()
+        if not os.path.exists(self.baseFilename):
+            return
+        if self.when is None and self.backupCount <= 0:
+            return
+        timer = _metrics.clock()
+        install = functools.partial(self.install_backup, started=started)
+        if self.compressor is None:
+            install(self.baseFilename)
+        else:
+            pending = '%s.%.6f.%d.pending' % (
+                self.baseFilename, time.time(), os.getpid())
+            os.rename(self.baseFilename, pending)
+            self.compressor.submit(pending, self.baseFilename, install,
+                                   self.compress_grace)
+        _metrics.registry.add('rotations')
+        _metrics.registry.observe('rotation_seconds',
+                                  _metrics.clock() - timer)
+
+    def install_backup(self, source, suffix='', started=None):
+        """rename source to the newest backup name and drop backups past
+        backupCount
+
+        :param source: the rotated file
+        :param suffix: file extension added by compression
+        :param started: start of the interval source was written in
+        """
+        base = self.baseFilename
+        rename = os.rename
+        if getattr(self, 'rotator', None) is not None:
+            rename = self.rotate
+        if self.when is None:
+            _rename_backup(source,
+                           _shift_backups(base, self.backupCount, suffix,
+                                          getattr(self, 'rotation_filename',
+                                                  None)),
+                           rename)
+            return
+        stamp = time.strftime(self.backup_format, time.gmtime(started))
+        counts = [count for (other, count), _ in self._backups()
+                  if other == stamp]
+        if counts:
+            # never reuse a pruned count, it would sort out of order
+            destination = '%s.%s.%d%s' % (base, stamp, max(counts) + 1,
+                                          suffix)
+        else:
+            destination = '%s.%s%s' % (base, stamp, suffix)
+        _rename_backup(source, destination, rename)
+        if self.backupCount > 0:
+            for backup in self.get_backups()[:-self.backupCount]:
+                _remove_backup(backup)
+
+    def _backups(self):
+        directory = os.path.dirname(self.baseFilename)
+        backups = []
+        for name in os.listdir(directory):
+            match = self.backup_pattern.match(name)
+            if match:
+                backups.append(((match.group(1), int(match.group(2) or 0)),
+                                os.path.join(directory, name)))
+        return sorted(backups)
+
+    def get_backups(self):
+        """timestamped backups of this file, oldest first"""
+        return [path for _, path in self._backups()]
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.rotate_files()
+        if not self.delay:
+            self.stream = self._open()
+
+    def format(self, record):
+        # the stdlib shouldRollover formats every record to measure it,
+        # and emit then formats it again
+        formatted, line = self._formatted
+        if formatted is record:
+            return line
+        line = logging.handlers.RotatingFileHandler.format(self, record)
+        self._formatted = (record, line)
+        return line
+
+    def emit(self, record):
+        # the stdlib's, but with the write timed apart from formatting
+        # and rollover
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            self._unwritten += len(self.format(record)) + 1
+            self._started = _metrics.clock()
+            logging.FileHandler.emit(self, record)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+        finally:
+            # don't keep the record, and its traceback, alive until the
+            # next one comes along
+            self._formatted = (None, None)
+
+    def flush(self):
+        logging.handlers.RotatingFileHandler.flush(self)
+        if self._unwritten:
+            self._wrote(self._started, self._unwritten)
+
+    def _wrote(self, started, written):
+        """count written bytes, written since started"""
+        self._unwritten = 0
+        _metrics.registry.add('bytes_written', written)
+        _metrics.registry.observe('write_seconds', _metrics.clock() - started)
+
+    def close(self):
+        logging.handlers.RotatingFileHandler.close(self)
+        if self.compressor is not None:
+            self.compressor.stop()
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """Rotating file handler that writes records out in batches.
+
+    Formatted records are buffered and written with a single write once
+    there are capacity records or flush_bytes characters buffered, or the
+    oldest buffered record is flush_interval seconds old. Records at
+    flush_level or above are written immediately along with everything
+    buffered before them. Rollover is checked once per batch, so a file
+    may go over maxBytes, or run past the end of its interval, by at most
+    one batch.
+
+    :param filename: log file to write to
+    :param maxBytes: size of the file before rotation
+    :param backupCount: number of rotated files to keep
+    :param capacity: number of records to buffer
+    :param flush_bytes: number of characters to buffer
+    :param flush_interval: seconds a record can sit in the buffer
+    :param flush_level: records at this level or above flush immediately
+    :param delay: don't open the file until the first write
+    :param compress: compress backups, 'gzip' or 'zstd'
+    :param when: rotation period, see :class:`RotatingFileHandler`
+    :param interval: number of periods per file
+    :param index: write a sidecar index for each backup
+    :type filename: string
+    :type maxBytes: int
+    :type backupCount: int
+    :type capacity: int
+    :type flush_bytes: int
+    :type flush_interval: float
+    :type flush_level: int
+    :type delay: bool
+    :type compress: string
+    :type when: string
+    :type interval: int
+    :type index: bool
+    """
+
+    _empty = ''
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, capacity=100,
+                 flush_bytes=64*1024, flush_interval=0.2,
+                 flush_level=logging.ERROR, delay=False, compress=None,
+                 when=None, interval=1, index=False):
+        RotatingFileHandler.__init__(
+            self, filename, maxBytes=maxBytes, backupCount=backupCount,
+            delay=delay, compress=compress, when=when, interval=interval,
+            index=index)
+        self.capacity = capacity
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self._buffer = []
+        self._buffered = 0
+        self._oldest = None
+        # not _closed, which logging.Handler uses for a bool of its own
+        self._stopping = threading.Event()
+        self._flusher = None
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self.flush_interval:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name='pyzlog-flusher')
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def _line(self, record):
+        """record as it is written to the file"""
+        return logging.Handler.format(self, record) + '\n'
+
+    def emit(self, record):
+        try:
+            line = self._line(record)
+            if not self._buffer:
+                self._oldest = time.time()
+            self._buffer.append(line)
+            self._buffered += len(line)
+            if (record.levelno >= self.flush_level or
+                    len(self._buffer) >= self.capacity or
+                    self._buffered >= self.flush_bytes):
+                self._write_batch()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _write_batch(self):
+        if not self._buffer:
+            return
+        batch = self._empty.join(self._buffer)
+        del self._buffer[:]
+        self._buffered = 0
+        self._oldest = None
+        if self.stream is None:
+            self.stream = self._open()
+        if self.due(time.time()):
+            self.doRollover()
+        elif self.maxBytes > 0:
+            self.stream.seek(0, 2)
+            position = self.stream.tell()
+            if position and position + len(batch) >= self.maxBytes:
+                self.doRollover()
+        started = _metrics.clock()
+        self.stream.write(batch)
+        self.stream.flush()
+        self._wrote(started, len(batch))
+
+    def _flush_periodically(self):
+        while not self._stopping.is_set():
+            self._stopping.wait(self.flush_interval)
+            oldest = self._oldest
+            if oldest is None or time.time() - oldest < self.flush_interval:
+                continue
+            self.acquire()
+            try:
+                # close may have written everything out and closed the
+                # file while we waited for the lock
+                if not self._stopping.is_set():
+                    self._write_batch()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+            finally:
+                self.release()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._write_batch()
+        finally:
+            self.release()
+
+    def write_lines(self, lines):
+        """write already formatted lines, after anything buffered, in a
+        single batch"""
+        self.acquire()
+        try:
+            self._buffer.extend(lines)
+            self._write_batch()
+        finally:
+            self.release()
+
+    def close(self):
+        if self._stopping.is_set():
+            return
+        # the flusher isn't joined: logging.shutdown closes handlers
+        # while holding their lock, which the flusher may be waiting on.
+        # It exits on its own once it sees _stopping.
+        self._stopping.set()
+        self._flusher = None
+        self.flush()
+        RotatingFileHandler.close(self)
+
+
+class BinaryRotatingFileHandler(BatchingRotatingFileHandler):
+    """Writes entries in the compact binary format of
+    :mod:`pyzlog.binary` rather than as json lines.
+
+    Each file, and each time the handler opens one, starts with a
+    header and every definition made so far, so backups can be read on
+    their own. Takes the same parameters as
+    :class:`BatchingRotatingFileHandler`, but writes every record
+    immediately by default.
+
+    :param max_strings: strings to define before writing the rest in
+        full, see :class:`pyzlog.binary.Encoder`
+    :type max_strings: int
+    """
+
+    _empty = b''
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, capacity=1,
+                 flush_bytes=64*1024, flush_interval=0,
+                 flush_level=logging.ERROR, delay=False, compress=None,
+                 when=None, interval=1, max_strings=4096):
+        # imported here for the same reason as index in _remove_backup
+        from . import binary as _binary
+        self.encoder = _binary.Encoder(max_strings)
+        # timestamps are encoded as changes from the one before, so a
+        # file opened while entries are buffered, by rotation, starts
+        # from the timestamp before the first of them
+        self._base = 0
+        BatchingRotatingFileHandler.__init__(
+            self, filename, maxBytes=maxBytes, backupCount=backupCount,
+            capacity=capacity, flush_bytes=flush_bytes,
+            flush_interval=flush_interval, flush_level=flush_level,
+            delay=delay, compress=compress, when=when, interval=interval)
+
+    def _open(self):
+        stream = open(self.baseFilename, 'ab')
+        stream.write(self.encoder.header(self._base))
+        return stream
+
+    def _line(self, record):
+        if not self._buffer:
+            self._base = self.encoder.micros
+        return self.encoder.encode(self.formatter, record)
+
+
+_fork_handlers = weakref.WeakSet()
+"""handlers whose _after_fork gives a forked child its own files, locks
+and background threads"""
+
+_pid = os.getpid()
+
+
+def _reinit_after_fork():
+    global _pid
+    _pid = os.getpid()
+    for handler in list(_fork_handlers):
+        handler._after_fork()
+
+
+_fork_hooks = hasattr(os, 'register_at_fork')
+if _fork_hooks:
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+def _check_fork():
+    """without fork hooks, run them from the first record a forked child
+    handles instead. Called before handle takes the handler lock, which
+    a thread in the parent may have been holding when we forked."""
+    if not _fork_hooks and _pid != os.getpid():
+        _reinit_after_fork()
+
+
+def _write_all(fd, data):
+    while data:
+        data = data[os.write(fd, data):]
+
+
+class ProcessSafeRotatingFileHandler(BatchingRotatingFileHandler):
+    """Rotating file handler that can be shared by several processes
+    writing to the same file, e.g. pre-fork gunicorn or uwsgi workers.
+
+    Each batch (by default each record) is appended with a single
+    O_APPEND write, so lines from different processes never interleave.
+    Rotation is done while holding an exclusive lock on filename.lock;
+    processes that find the file already rotated by someone else just
+    reopen it. A process can append a few more lines to a file another
+    process has just rotated, they end up in the first backup.
+
+    The handler can be created before forking; children reopen the
+    file and the lock and drop anything the parent had buffered.
+
+    Takes the same parameters as :class:`BatchingRotatingFileHandler`,
+    but writes every record immediately by default.
+
+    :raises RuntimeError: on platforms without fcntl
+    """
+    # rotated files are only compressed and indexed once other processes
+    # are done appending to them
+    compress_grace = 1.0
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, capacity=1,
+                 flush_bytes=64*1024, flush_interval=0,
+                 flush_level=logging.ERROR, compress=None, when=None,
+                 interval=1, index=False):
+        if fcntl is None:
+            raise RuntimeError(
+                'ProcessSafeRotatingFileHandler needs fcntl, which is not '
+                'available on this platform')
+        self._fd = None
+        self._lock_fd = None
+        BatchingRotatingFileHandler.__init__(
+            self, filename, maxBytes=maxBytes, backupCount=backupCount,
+            capacity=capacity, flush_bytes=flush_bytes,
+            flush_interval=flush_interval, flush_level=flush_level,
+            delay=True, compress=compress, when=when, interval=interval,
+            index=index)
+        self._open_files()
+        _fork_handlers.add(self)
+
+    def _open_files(self):
+        self._fd = os.open(self.baseFilename,
+                           os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lock_fd = os.open(self.baseFilename + '.lock',
+                                os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _close_files(self):
+        for fd in (self._fd, self._lock_fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._lock_fd = None
+
+    def _after_fork(self):
+        """give a forked child its own lock, file and buffer"""
+        self.createLock()
+        del self._buffer[:]
+        self._buffered = 0
+        self._oldest = None
+        if self._stopping.is_set():
+            return
+        self._close_files()
+        self._open_files()
+        self._start_flusher()
+
+    def handle(self, record):
+        _check_fork()
+        return BatchingRotatingFileHandler.handle(self, record)
+
+    def _write_batch(self):
+        if not self._buffer:
+            return
+        batch = ''.join(self._buffer)
+        del self._buffer[:]
+        self._buffered = 0
+        self._oldest = None
+        if not isinstance(batch, bytes):
+            batch = batch.encode('utf-8')
+        stat = os.fstat(self._fd)
+        if not stat.st_nlink:
+            # rotated, compressed and removed by another process
+            self._reopen()
+            stat = os.fstat(self._fd)
+        if self.due(time.time()):
+            self.doRollover()
+        elif self.maxBytes > 0:
+            if stat.st_size and stat.st_size + len(batch) >= self.maxBytes:
+                self.doRollover()
+        started = _metrics.clock()
+        # shared with other writers; a compressor only removes a file
+        # renamed for it under the exclusive lock, see Compressor
+        fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+        try:
+            if not os.fstat(self._fd).st_nlink:
+                self._reopen()
+            _write_all(self._fd, batch)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        self._wrote(started, len(batch))
+
+    def _reopen(self):
+        os.close(self._fd)
+        self._fd = os.open(self.baseFilename,
+                           os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def doRollover(self):
+        """rotate the file unless another process already has"""
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            mine = os.fstat(self._fd)
+            try:
+                current = os.stat(self.baseFilename)
+            except OSError:
+                current = None
+            if (current is not None and
+                    (current.st_dev, current.st_ino) ==
+                    (mine.st_dev, mine.st_ino)):
+                self.rotate_files()
+            else:
+                self._next_period()
+            self._reopen()
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._stopping.is_set():
+            return
+        BatchingRotatingFileHandler.close(self)
+        self._close_files()
+        _fork_handlers.discard(self)
+
+
+class ThreadBufferedHandler(logging.Handler):
+    """Formats records on the logging thread without taking any lock
+    shared with other threads, and leaves the writing to a single
+    background writer.
+
+    logging.Handler.handle holds the handler lock around format and the
+    file write, so threads logging at the same time wait on each other.
+    This handler skips that lock: each thread formats its own records
+    and appends the lines to a buffer of its own. The writer takes
+    everything buffered by every thread and hands it to target in one
+    write, every flush_interval seconds, or as soon as a thread has
+    capacity lines buffered or logs at flush_level or above.
+
+    Lines from one thread stay in order, but lines from different
+    threads logged close together may be written out of order; sort on
+    event_timestamp when that matters.
+
+    The handler can be created before forking; children start their own
+    writer and drop anything the parent had buffered.
+
+    :param target: handler that writes the lines and rotates the file
+    :param capacity: lines a thread buffers before waking the writer
+    :param flush_interval: longest a line is buffered, in seconds
+    :param flush_level: records at this level or above wake the writer
+    :type target: :class:`BatchingRotatingFileHandler`
+    :type capacity: int
+    :type flush_interval: float
+    :type flush_level: int
+    """
+
+    def __init__(self, target, capacity=100, flush_interval=0.2,
+                 flush_level=logging.ERROR):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self._local = threading.local()
+        self._buffers = []
+        self._buffers_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._start_writer()
+        _fork_handlers.add(self)
+
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._run,
+                                        name='pyzlog-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _after_fork(self):
+        """give a forked child its own buffers and writer; what the
+        parent had buffered is the parent's to write"""
+        self.createLock()
+        self._local = threading.local()
+        self._buffers = []
+        self._buffers_lock = threading.Lock()
+        self._wake = threading.Event()
+        if not self._closed:
+            self._start_writer()
+
+    def _buffer(self):
+        """this thread's buffer"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = collections.deque()
+            with self._buffers_lock:
+                self._buffers.append((threading.current_thread(), buffer))
+        return buffer
+
+    def handle(self, record):
+        _check_fork()
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + '\n'
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+        buffer = self._buffer()
+        buffer.append(line)
+        if ((record.levelno >= self.flush_level or
+                len(buffer) >= self.capacity) and not self._wake.is_set()):
+            self._wake.set()
+
+    def _take(self):
+        """every line buffered so far, taking the buffers of threads that
+        have exited out of the list"""
+        lines = []
+        with self._buffers_lock:
+            buffers = list(self._buffers)
+        for thread, buffer in buffers:
+            try:
+                for _ in range(len(buffer)):
+                    lines.append(buffer.popleft())
+            except IndexError:
+                # taken by a concurrent flush
+                pass
+            if not buffer and not thread.is_alive():
+                with self._buffers_lock:
+                    self._buffers.remove((thread, buffer))
+        return lines
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def flush(self):
+        """write out everything buffered by every thread"""
+        lines = self._take()
+        if lines:
+            self.target.write_lines(lines)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._writer.join()
+        self.flush()
+        self.target.close()
+        _fork_handlers.discard(self)
+        logging.Handler.close(self)
+
+
+class DedupHandler(logging.Handler):
+    """Collapses identical records into one entry with a repeat count.
+
+    The first record with a given event_name, log_level and fields is
+    handed to target straight away. Identical records logged in the
+    window seconds after it are only counted; once the window is over,
+    a single entry is written for them, the last of them with the
+    fields repeat_count, first_timestamp and last_timestamp added. The
+    next identical record starts a new window.
+
+    Records are compared by the entry target's formatter, a
+    :class:`pyzlog.JsonFormatter`, would write for them, less the
+    timestamp, so every record, duplicates included, costs about as
+    much as formatting it. That includes computing its
+    :class:`pyzlog.Lazy` fields; the values replace the Lazy objects on
+    the record, so they are not computed again when target formats the
+    ones that are written. At most max_keys windows are open at once; a
+    new record beyond that closes the oldest window early. The handler
+    can be created before forking; children start their own sweeper.
+
+    :param target: handler writing the entries
+    :param window: seconds identical records are collapsed for
+    :param max_keys: distinct records tracked at once
+    :type target: logging.Handler
+    :type window: float
+    :type max_keys: int
+    """
+
+    def __init__(self, target, window=1.0, max_keys=10000):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.window = window
+        self.max_keys = max_keys
+        # key: [last repeat, repeat count, first and last created]; the
+        # deque holds (window end, key) for each, oldest first
+        self._windows = {}
+        self._ends = collections.deque()
+        self._stopping = threading.Event()
+        self._start_sweeper()
+        _fork_handlers.add(self)
+
+    def _start_sweeper(self):
+        self._sweeper = threading.Thread(target=self._sweep_periodically,
+                                         name='pyzlog-dedup')
+        self._sweeper.daemon = True
+        self._sweeper.start()
+
+    def _after_fork(self):
+        """give a forked child its own lock and sweeper; the windows
+        open in the parent are the parent's to write"""
+        self.createLock()
+        self._windows = {}
+        self._ends = collections.deque()
+        if not self._stopping.is_set():
+            self._start_sweeper()
+
+    def handle(self, record):
+        _check_fork()
+        return logging.Handler.handle(self, record)
+
+    def _key(self, record):
+        formatter = self.target.formatter
+        event_name, log_level, fields, _ = formatter.entry(record)
+        return event_name, log_level, formatter._encode(fields)
+
+    def emit(self, record):
+        try:
+            created = record.created
+            self._sweep(created)
+            key = self._key(record)
+            repeats = self._windows.get(key)
+            if repeats is not None:
+                if not repeats[1]:
+                    repeats[2] = created
+                repeats[0] = record
+                repeats[1] += 1
+                repeats[3] = created
+                _metrics.registry.add('filtered.duplicate')
+                return
+            if len(self._windows) >= self.max_keys:
+                self._close_window()
+            self._windows[key] = [None, 0, None, None]
+            self._ends.append((created + self.window, key))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+        self.target.handle(record)
+
+    def _close_window(self):
+        """write the entry for the repeats in the oldest window"""
+        _, key = self._ends.popleft()
+        record, count, first, last = self._windows.pop(key)
+        if count:
+            summary = logging.makeLogRecord(record.__dict__)
+            summary.__dict__.pop('pyzlog_counted', None)
+            summary.pyzlog_repeats = (count, first, last)
+            self.target.handle(summary)
+
+    def _sweep(self, now):
+        """close the windows that are over by now"""
+        ends = self._ends
+        while ends and ends[0][0] <= now:
+            self._close_window()
+
+    def _sweep_periodically(self):
+        while not self._stopping.is_set():
+            self._stopping.wait(self.window)
+            self.acquire()
+            try:
+                # close may have written out every window while we waited
+                # for the lock
+                if not self._stopping.is_set():
+                    self._sweep(time.time())
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+            finally:
+                self.release()
+
+    def flush(self):
+        """write the entries for windows that are over, then flush
+        target"""
+        self.acquire()
+        try:
+            self._sweep(time.time())
+        finally:
+            self.release()
+        self.target.flush()
+
+    def close(self):
+        if self._stopping.is_set():
+            return
+        # not joined, as logging.shutdown closes handlers holding their
+        # lock, which the sweeper may be waiting on
+        self._stopping.set()
+        self.acquire()
+        try:
+            while self._ends:
+                self._close_window()
+        finally:
+            self.release()
+        self.target.close()
+        _fork_handlers.discard(self)
+        logging.Handler.close(self)
+
+
+def queue_handler(handler, queue_size=0, overflow='drop_lowest',
+                  timeout=1.0):
+    """wrap handler so it is driven by a background writer thread.
+
+    :param handler: the handler doing the actual formatting and writing
+    :param queue_size: records queued before overflow applies, 0 for no
+        limit
+    :param overflow: what to do with records once the queue is full, see
+        :mod:`pyzlog.queues`
+    :param timeout: seconds to wait for room with 'block'
+    :type handler: logging.Handler
+    :type queue_size: int
+    :type overflow: string
+    :type timeout: float
+    :return: the handler to attach to the logger and its started listener
+    :rtype: tuple
+    """
+    record_queue = _queues.BoundedQueue(queue_size, overflow, timeout)
+    front = QueueHandler(record_queue)
+    front.setLevel(handler.level)
+    listener = QueueListener(record_queue, handler)
+    listener.start()
+    return front, listener
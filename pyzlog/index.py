@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""Sidecar indexes for rotated log files.
+
+An index splits a log file into blocks of consecutive lines, one per
+minute of event_timestamps (and at most block_bytes long), and records
+each block's byte offset, its earliest and latest event_timestamp and
+the event names in it. :mod:`pyzlog.reader` uses it to seek straight to
+the blocks that can match a time range or event_name filter.
+
+The index of foo.log.1.gz is foo.log.1.gz.idx. Offsets are into the
+uncompressed contents. With ``index=True``, :func:`pyzlog.init_logs`
+builds the index of every backup in the background as it is rotated.
+Indexes for existing files can be rebuilt with::
+
+    python -m pyzlog.index /var/log/app.log.*
+
+"""
+
+import os
+import re
+import sys
+import json
+
+index_suffix = '.idx'
+"""added to the name of the file an index is for"""
+
+version = 1
+
+_timestamp = re.compile(br'"event_timestamp":\s*"([^"]*)"\}\s*$')
+_event_name = re.compile(br'"event_name":\s*("(?:[^"\\]|\\.)*")')
+
+
+def _parse(line):
+    """event_timestamp and event_name of a raw line, without parsing
+    all of it when possible. None for lines that aren't entries.
+    """
+    timestamp = _timestamp.search(line)
+    event_name = _event_name.search(line)
+    if timestamp and event_name:
+        try:
+            return (timestamp.group(1).decode('ascii'),
+                    json.loads(event_name.group(1).decode('utf-8')))
+        except ValueError:
+            pass
+    try:
+        entry = json.loads(line.decode('utf-8'))
+        return entry['event_timestamp'], entry['event_name']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class Index(object):
+    """The blocks of a log file.
+
+    :param size: number of bytes of the file covered by the blocks
+    :param blocks: (offset, first, last, event names) for each block,
+        where first and last are the earliest and latest event_timestamp
+    :type size: int
+    :type blocks: list
+    """
+
+    def __init__(self, size=0, blocks=None):
+        self.size = size
+        self.blocks = blocks or []
+
+    def ranges(self, matches):
+        """byte ranges of the blocks matches wants, with adjacent blocks
+        merged
+
+        :param matches: called with a block's first, last and event
+            names, returns whether it could hold matching entries
+        :type matches: callable
+        :return: (start, end) offsets
+        :rtype: list
+        """
+        ranges = []
+        ends = [block[0] for block in self.blocks[1:]] + [self.size]
+        for (offset, first, last, events), end in zip(self.blocks, ends):
+            if not matches(first, last, events):
+                continue
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((offset, end))
+        return ranges
+
+    def save(self, filename):
+        """write the index atomically to filename"""
+        names = sorted(set(name for block in self.blocks
+                           for name in block[3]))
+        ids = dict((name, i) for i, name in enumerate(names))
+        document = {
+            'version': version,
+            'size': self.size,
+            'event_names': names,
+            'blocks': [[offset, first, last,
+                        sorted(ids[name] for name in events)]
+                       for offset, first, last, events in self.blocks]}
+        temporary = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.rename(temporary, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """read an index written by save
+
+        :return: the index, or None if it is missing or unreadable
+        :rtype: :class:`Index`
+        """
+        try:
+            with open(filename) as f:
+                document = json.load(f)
+            if document.get('version') != version:
+                return None
+            names = document['event_names']
+            return cls(document['size'], [
+                (offset, first, last, frozenset(names[i] for i in events))
+                for offset, first, last, events in document['blocks']])
+        except (IOError, OSError, ValueError, KeyError, TypeError,
+                IndexError):
+            return None
+
+
+def build(filename, block_bytes=256*1024):
+    """index a log file or compressed backup.
+
+    :param filename: the file to index
+    :param block_bytes: largest block, in bytes
+    :type filename: string
+    :type block_bytes: int
+    :rtype: :class:`Index`
+    """
+    from .reader import open_log
+    index = Index()
+    offset = 0
+    block = None
+    f = open_log(filename)
+    try:
+        for line in f:
+            parsed = _parse(line)
+            if parsed is not None:
+                timestamp, event_name = parsed
+                if (block is None or
+                        timestamp[:16] != block[1][:16] or
+                        offset - block[0] >= block_bytes):
+                    block = [offset, timestamp, timestamp, set()]
+                    index.blocks.append(block)
+                elif timestamp < block[1]:
+                    block[1] = timestamp
+                elif timestamp > block[2]:
+                    block[2] = timestamp
+                block[3].add(event_name)
+            offset += len(line)
+    finally:
+        f.close()
+    index.size = offset
+    index.blocks = [tuple(block) for block in index.blocks]
+    return index
+
+
+def rebuild(filename, destination=None):
+    """build the index of filename and save it next to it, or to
+    destination
+    """
+    build(filename).save(destination or filename + index_suffix)
+
+
+def load(filename):
+    """the index of a log file, or None if it has none"""
+    return Index.load(filename + index_suffix)
+
+
+def main(argv=None):
+    # argparse is 2.7+; imported here so pyzlog itself imports on 2.6
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='rebuild the sidecar indexes of pyzlog log files')
+    parser.add_argument('files', nargs='+', metavar='FILE',
+                        help='log files or compressed backups to index')
+    args = parser.parse_args(argv)
+    for filename in args.files:
+        if filename.endswith(index_suffix) or filename.endswith('.lock'):
+            continue
+        rebuild(filename)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
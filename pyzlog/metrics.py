@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""Counters and timings of pyzlog's own work, see :func:`pyzlog.stats`.
+
+Every thread counts into a dict of its own, so counting never takes a
+lock or contends with other threads; the dicts are only added up when a
+snapshot is taken. Counts of threads that have exited are folded into a
+running total then.
+
+Timings go into histograms with power of two buckets in microseconds:
+a timing of 300us is counted in the 512 bucket, which holds everything
+over 256us and up to 512us.
+
+"""
+
+import math
+import time
+import threading
+
+clock = getattr(time, 'perf_counter', time.time)
+"""most precise clock available, for timings"""
+
+
+def _put(snapshot, name, value):
+    if '.' in name:
+        group, name = name.split('.', 1)
+        snapshot = snapshot.setdefault(group, {})
+    snapshot[name] = value
+
+
+class Metrics(object):
+    """Per thread counters and histograms, added up on read."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._threads = []
+        self._retired = {}
+        self._retire_at = 64
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def _counts(self):
+        """this thread's counts"""
+        try:
+            return self._local.counts
+        except AttributeError:
+            counts = self._local.counts = {}
+            with self._lock:
+                # so threads that come and go don't pile up between
+                # snapshots, retiring them takes time in the number of
+                # threads alive, at most once per doubling
+                if len(self._threads) >= self._retire_at:
+                    self._retire()
+                    self._retire_at = max(64, 2 * len(self._threads))
+                self._threads.append((threading.current_thread(), counts))
+            return counts
+
+    def _retire(self):
+        """fold the counts of threads that have exited into a running
+        total; called holding the lock"""
+        alive = []
+        for thread, counts in self._threads:
+            if thread.is_alive():
+                alive.append((thread, counts))
+                continue
+            for key, value in counts.items():
+                self._retired[key] = self._retired.get(key, 0) + value
+        self._threads = alive
+
+    def add(self, name, value=1):
+        """add value to the counter name"""
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._counts()
+        counts[name] = counts.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """count a timing in the histogram name"""
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._counts()
+        # the exponent is the bit length, which ints only have from 2.7
+        key = (name, math.frexp(int(seconds * 1e6))[1])
+        counts[key] = counts.get(key, 0) + 1
+        key = (name, 'seconds')
+        counts[key] = counts.get(key, 0) + seconds
+
+    def gauge(self, name, read):
+        """report the value read returns in every snapshot, replacing
+        any gauge already called name
+
+        :param read: called with no arguments when a snapshot is taken
+        :type read: callable
+        """
+        with self._lock:
+            self._gauges[name] = read
+
+    def remove_gauge(self, name):
+        """stop reporting the gauge name"""
+        with self._lock:
+            self._gauges.pop(name, None)
+
+    def totals(self):
+        """every thread's counts added up"""
+        with self._lock:
+            self._retire()
+            totals = self._retired.copy()
+            for _, counts in self._threads:
+                # copying a dict is atomic, iterating one another thread
+                # is adding to is not
+                for key, value in counts.copy().items():
+                    totals[key] = totals.get(key, 0) + value
+            gauges = list(self._gauges.items())
+        return totals, gauges
+
+    def snapshot(self):
+        """counters, histograms and gauges, as a dict.
+
+        Counters and gauges named group.key, e.g. records.INFO, are
+        nested under their group. Histograms have their count, total
+        seconds and the count in each bucket, keyed by the bucket's upper
+        bound in microseconds.
+        """
+        totals, gauges = self.totals()
+        snapshot = {}
+        histograms = {}
+        for key, value in totals.items():
+            if isinstance(key, tuple):
+                name, bucket = key
+                histogram = histograms.get(name)
+                if histogram is None:
+                    histogram = histograms[name] = {
+                        'count': 0, 'seconds': 0, 'buckets': {}}
+                if bucket == 'seconds':
+                    histogram['seconds'] = round(value, 6)
+                else:
+                    histogram['count'] += value
+                    histogram['buckets'][str(2 ** bucket)] = value
+            else:
+                _put(snapshot, key, value)
+        snapshot.update(histograms)
+        for name, read in gauges:
+            _put(snapshot, name, read())
+        return snapshot
+
+    def reset(self):
+        """zero every counter and histogram"""
+        with self._lock:
+            self._retired = {}
+            for _, counts in self._threads:
+                counts.clear()
+
+
+registry = Metrics()
+"""the metrics pyzlog counts into"""
+
+
+def count_record(record, log_level):
+    """count record in records.log_level, only the first time it is
+    formatted, however many handlers it goes to"""
+    values = record.__dict__
+    if 'pyzlog_counted' not in values:
+        values['pyzlog_counted'] = True
+        registry.add('records.' + log_level)
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+
+"""Ship log entries to a collector over the network instead of, or as
+well as, writing them to a file.
+
+Entries are formatted by :class:`pyzlog.JsonFormatter` as usual and sent
+as newline delimited json over TCP, UDP or a unix socket by background
+sender threads, each with its own persistent connection. While the
+collector can't be reached, entries are spilled to a bounded file on
+disk and sent ahead of new ones once it is back.
+
+You should not need to use these directly; pass ``address`` to
+:func:`pyzlog.init_logs` instead.
+
+"""
+
+import os
+import sys
+import time
+import random
+import operator
+import socket
+import logging
+import threading
+import traceback
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+from . import queues as _queues
+
+transports = ('tcp', 'udp', 'unix')
+"""transports NetworkHandler can send over"""
+
+
+class Connection(object):
+    """A connected socket that sends newline delimited entries.
+
+    :param transport: 'tcp', 'udp' or 'unix'
+    :param address: (host, port), or the socket path for 'unix'
+    :param timeout: seconds to wait on connecting and sending
+    :param max_datagram: largest udp datagram; each holds as many whole
+        entries as fit
+    :type transport: string
+    :type address: tuple or string
+    :type timeout: float
+    :type max_datagram: int
+    """
+
+    def __init__(self, transport, address, timeout=5.0, max_datagram=8192):
+        self.transport = transport
+        self.max_datagram = max_datagram
+        if transport == 'tcp':
+            self.sock = socket.create_connection(address, timeout)
+        elif transport == 'unix':
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._connect(address, timeout)
+        else:
+            family, _, _, _, address = socket.getaddrinfo(
+                address[0], address[1], 0, socket.SOCK_DGRAM)[0]
+            self.sock = socket.socket(family, socket.SOCK_DGRAM)
+            self._connect(address, timeout)
+
+    def _connect(self, address, timeout):
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.connect(address)
+        except Exception:
+            self.sock.close()
+            raise
+
+    def send(self, data):
+        """send data, which holds whole lines
+
+        :raises socket.error: if the collector can't be reached
+        """
+        if self.transport != 'udp':
+            self.sock.sendall(data)
+            return
+        start = 0
+        while start < len(data):
+            end = data.rfind(b'\n', start, start + self.max_datagram) + 1
+            if end <= start:
+                # a single entry bigger than max_datagram goes on its own
+                end = data.index(b'\n', start) + 1
+            self.sock.send(data[start:end])
+            start = end
+
+    def close(self):
+        self.sock.close()
+
+
+class ConnectionPool(object):
+    """Persistent connections, opened as they are needed and reused
+    until they fail.
+
+    :param connect: called with no arguments to open a new connection
+    :type connect: callable
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        """an idle connection, or a new one if there are none"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, connection):
+        """return a working connection to the pool"""
+        self._idle.put(connection)
+
+    def discard(self, connection):
+        """close a connection that failed"""
+        try:
+            connection.close()
+        except (socket.error, OSError):
+            pass
+
+    def close(self):
+        """close every idle connection"""
+        while True:
+            try:
+                self.discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+class Spill(object):
+    """File entries are kept in while the collector is down.
+
+    Writes that would take the file past max_bytes are dropped and
+    counted. The file is sent ahead of new entries once the collector is
+    back, and is only removed once all of it has been sent; entries sent
+    just before a failure may be sent again.
+
+    :param filename: the spill file
+    :param max_bytes: largest the file may get
+    :type filename: string
+    :type max_bytes: int
+    """
+
+    def __init__(self, filename, max_bytes=64*1024*1024):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._sent = 0
+        self._lock = threading.Lock()
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.filename)
+        except OSError:
+            return 0
+
+    def write(self, data):
+        """append data, unless there is no room for it
+
+        :return: whether data was written
+        :rtype: bool
+        """
+        with self._lock:
+            if self._size() + len(data) > self.max_bytes:
+                self.dropped += data.count(b'\n')
+                return False
+            with open(self.filename, 'ab') as f:
+                f.write(data)
+            return True
+
+    def pending(self):
+        """whether there is anything left to send"""
+        return self._size() > self._sent
+
+    def drain(self, send, chunk_bytes=64*1024):
+        """send the spilled entries, chunk_bytes at a time
+
+        :param send: called with each chunk of whole lines
+        :raises socket.error: from send; what was sent before that isn't
+            sent again
+        """
+        with self._lock:
+            if self._size() <= self._sent:
+                return
+            with open(self.filename, 'rb') as f:
+                f.seek(self._sent)
+                while True:
+                    lines = f.readlines(chunk_bytes)
+                    if not lines:
+                        break
+                    data = b''.join(lines)
+                    send(data)
+                    self._sent += len(data)
+            os.remove(self.filename)
+            self._sent = 0
+
+
+class NetworkHandler(logging.Handler):
+    """Sends formatted entries to a collector from background threads.
+
+    emit formats the record and puts it on a bounded queue, it never
+    waits on the network. Each of the pool_size sender threads takes up
+    to capacity entries or flush_bytes bytes off of the queue at a time,
+    waiting up to flush_interval seconds for a batch to fill, and sends
+    them with one write on its own persistent connection.
+
+    When a send fails the connection is dropped and the batch is written
+    to the spill file; batches are then spilled without trying the
+    network until a backoff of backoff, 2 * backoff, ... up to
+    max_backoff seconds, with random jitter, has passed. Entries are
+    also spilled when the queue is full, lowest level first by default
+    (see :mod:`pyzlog.queues` for the other overflow policies). Without
+    a spill file, or once it is full, entries are dropped and counted in
+    dropped.
+
+    :param address: (host, port), or the socket path for 'unix'
+    :param transport: 'tcp', 'udp' or 'unix'
+    :param capacity: entries per send
+    :param flush_bytes: bytes per send
+    :param flush_interval: seconds to wait for a batch to fill, 0 to
+        send whatever is queued right away
+    :param pool_size: number of sender threads and connections
+    :param queue_size: entries queued before overflow applies
+    :param overflow: 'block', 'drop_newest', 'drop_oldest' or
+        'drop_lowest'
+    :param queue_timeout: seconds emit waits for room with 'block'
+    :param spill_path: file to spill to while the collector is down
+    :param spill_bytes: largest the spill file may get
+    :param backoff: seconds to wait after the first failure
+    :param max_backoff: longest wait between attempts
+    :param timeout: seconds to wait on connecting and sending
+    :type address: tuple or string
+    :type transport: string
+    :type capacity: int
+    :type flush_bytes: int
+    :type flush_interval: float
+    :type pool_size: int
+    :type queue_size: int
+    :type overflow: string
+    :type queue_timeout: float
+    :type spill_path: string
+    :type spill_bytes: int
+    :type backoff: float
+    :type max_backoff: float
+    :type timeout: float
+    :raises ValueError: for an unknown transport or overflow policy
+    """
+    _sentinel = None
+
+    def __init__(self, address, transport='tcp', capacity=100,
+                 flush_bytes=64*1024, flush_interval=0, pool_size=1,
+                 queue_size=10000, overflow='drop_lowest', queue_timeout=1.0,
+                 spill_path=None, spill_bytes=64*1024*1024, backoff=0.5,
+                 max_backoff=30.0, timeout=5.0):
+        if transport not in transports:
+            raise ValueError('unknown transport %r, expected one of %s'
+                             % (transport, ', '.join(transports)))
+        logging.Handler.__init__(self)
+        self.address = address
+        self.transport = transport
+        self.capacity = capacity
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        # entries are queued as (levelno, data, level name)
+        self.queue = _queues.BoundedQueue(
+            queue_size, overflow, queue_timeout,
+            level=operator.itemgetter(0), name=operator.itemgetter(2),
+            discard=lambda entry: self._overflow(entry[1]))
+        self.pool = ConnectionPool(self._connect)
+        self.spill = Spill(spill_path, spill_bytes) if spill_path else None
+        self.sent = 0
+        self._dropped = 0
+        self._failures = 0
+        self._retry_at = 0
+        self._closed = False
+        self._senders = []
+        for i in range(pool_size):
+            sender = threading.Thread(target=self._run,
+                                      name='pyzlog-sender-%d' % i)
+            sender.daemon = True
+            sender.start()
+            self._senders.append(sender)
+
+    @property
+    def dropped(self):
+        """entries lost because there was nowhere to put them"""
+        return self._dropped + (self.spill.dropped if self.spill else 0)
+
+    def _connect(self):
+        return Connection(self.transport, self.address, self.timeout)
+
+    def emit(self, record):
+        try:
+            data = (self.format(record) + '\n').encode('utf-8')
+            self.queue.put((record.levelno, data,
+                            _queues.level_name(record)))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _overflow(self, data):
+        if self.spill is None:
+            self._dropped += data.count(b'\n')
+        else:
+            self.spill.write(data)
+
+    def _next_batch(self):
+        """lines to send next, None once the handler is closed"""
+        try:
+            entry = self.queue.get(timeout=max(self.flush_interval, 0.5))
+        except queue.Empty:
+            return []
+        if entry is self._sentinel:
+            # pass it on to the next sender thread
+            self.queue.put(entry)
+            return None
+        batch, size = [entry[1]], len(entry[1])
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.capacity and size < self.flush_bytes:
+            try:
+                if self.flush_interval:
+                    wait = deadline - time.time()
+                    if wait <= 0:
+                        break
+                    entry = self.queue.get(timeout=wait)
+                else:
+                    entry = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is self._sentinel:
+                # let this thread exit once the batch is sent
+                self.queue.put(entry)
+                break
+            batch.append(entry[1])
+            size += len(entry[1])
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                self._send(b''.join(batch))
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def _send(self, data):
+        if not data and (self.spill is None or not self.spill.pending()):
+            return
+        if time.time() < self._retry_at:
+            if data:
+                self._overflow(data)
+            return
+        connection = None
+        try:
+            connection = self.pool.acquire()
+            if self.spill is not None:
+                self.spill.drain(connection.send)
+            if data:
+                connection.send(data)
+        except (socket.error, OSError, IOError):
+            if connection is not None:
+                self.pool.discard(connection)
+            if data:
+                self._overflow(data)
+            self._failures += 1
+            delay = min(self.max_backoff,
+                        self.backoff * 2 ** (self._failures - 1))
+            self._retry_at = time.time() + random.uniform(delay / 2, delay)
+        else:
+            self.pool.release(connection)
+            self._failures = 0
+            self.sent += data.count(b'\n')
+
+    def close(self):
+        """send everything queued, spilling what can't be sent, and stop
+        the sender threads"""
+        self.acquire()
+        try:
+            if self._closed:
+                return
+            self._closed = True
+        finally:
+            self.release()
+        self.queue.put(self._sentinel)
+        for sender in self._senders:
+            sender.join()
+        self.pool.close()
+        logging.Handler.close(self)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""Bounded queue for records waiting on a background writer or sender.
+
+An unbounded queue grows without limit while its consumer is stalled,
+for example on a slow disk or an unreachable collector. A
+:class:`BoundedQueue` holds at most maxsize items and, once full,
+applies one of the overflow policies:
+
+* ``'block'``: the caller waits up to timeout seconds for room, then
+  the new item is dropped
+* ``'drop_newest'``: the new item is dropped
+* ``'drop_oldest'``: the oldest queued item is dropped to make room
+* ``'drop_lowest'``: the oldest item of the lowest level queued is
+  dropped, or the new item if its level is lower still, so ERROR and
+  above survive a flood of DEBUG
+
+Every dropped item is counted by its pyzlog log_level, so NOTICE and
+ALERT drops aren't lumped in with INFO. Pass ``queue_size`` and
+``overflow`` to :func:`pyzlog.init_logs` rather than using this
+directly.
+
+"""
+
+import time
+import logging
+import operator
+import threading
+import collections
+
+try:
+    from queue import Empty
+except ImportError:  # pragma: no cover
+    from Queue import Empty
+
+policies = ('block', 'drop_newest', 'drop_oldest', 'drop_lowest')
+"""overflow policies BoundedQueue supports"""
+
+_control = float('inf')
+"""level of the None sentinel, which is never dropped or counted"""
+
+
+def level_name(record):
+    """the pyzlog log_level of record, e.g. 'NOTICE', or its stdlib level
+    name if it wasn't logged through pyzlog"""
+    return (getattr(record, 'log_level', None) or
+            logging.getLevelName(record.levelno))
+
+
+class BoundedQueue(object):
+    """A FIFO queue holding at most maxsize items.
+
+    Implements the put/get subset of Queue.Queue used by the background
+    writers. Items are kept in a deque per level, so putting, getting
+    and dropping take time in the number of distinct levels queued, not
+    the number of items. None, used to stop the consumer, is always
+    queued and doesn't count towards maxsize.
+
+    :param maxsize: items held before the overflow policy applies, 0 for
+        no limit
+    :param overflow: 'block', 'drop_newest', 'drop_oldest' or
+        'drop_lowest'
+    :param timeout: seconds put waits for room with 'block'
+    :param level: called with an item to get its level, defaults to
+        the levelno of a log record
+    :param name: called with an item to get the level name its drops
+        are counted under, defaults to :func:`level_name`
+    :param discard: called with each item dropped, e.g. to keep it
+        somewhere else
+    :type maxsize: int
+    :type overflow: string
+    :type timeout: float
+    :type level: callable
+    :type name: callable
+    :type discard: callable
+    :raises ValueError: for an unknown overflow policy
+    """
+
+    def __init__(self, maxsize=0, overflow='block', timeout=1.0, level=None,
+                 name=None, discard=None):
+        if overflow not in policies:
+            raise ValueError('unknown overflow policy %r, expected one of %s'
+                             % (overflow, ', '.join(policies)))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.timeout = timeout
+        self.level = level or operator.attrgetter('levelno')
+        self.name = name or level_name
+        self.discard = discard
+        self._levels = {}
+        self._dropped = {}
+        self._size = 0
+        self._sequence = 0
+        self._unfinished = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+
+    def _after_fork(self):
+        """new locks and nothing queued for a forked child; what was
+        queued is the parent's to handle"""
+        self._levels = {}
+        self._size = 0
+        self._unfinished = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+
+    def qsize(self):
+        """number of items queued"""
+        return self._size
+
+    @property
+    def dropped(self):
+        """number of items dropped, by level name"""
+        with self._lock:
+            return dict(self._dropped)
+
+    def _append(self, item, level):
+        items = self._levels.get(level)
+        if items is None:
+            items = self._levels[level] = collections.deque()
+        items.append((self._sequence, item))
+        self._sequence += 1
+        if level is not _control:
+            self._size += 1
+            self._unfinished += 1
+        self._not_empty.notify()
+
+    def _pop(self, level):
+        _, item = self._levels[level].popleft()
+        if level is not _control:
+            self._size -= 1
+        return item
+
+    def _oldest_level(self, control=True):
+        oldest = None
+        for level, items in self._levels.items():
+            if not items or (level is _control and not control):
+                continue
+            if oldest is None or items[0][0] < self._levels[oldest][0][0]:
+                oldest = level
+        return oldest
+
+    def _drop(self, item, level):
+        name = self.name(item)
+        self._dropped[name] = self._dropped.get(name, 0) + 1
+        return item
+
+    def _evict(self, level):
+        """drop the oldest item of level from the queue"""
+        self._task_done()
+        return self._drop(self._pop(level), level)
+
+    def _make_room(self, level, block, timeout):
+        """(item dropped to make room for one of level, whether the new
+        item is to be dropped instead)"""
+        if self.overflow == 'block' and block:
+            deadline = time.time() + (self.timeout if timeout is None
+                                      else timeout)
+            while self._size >= self.maxsize:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, True
+                self._not_full.wait(remaining)
+            return None, False
+        if self.overflow == 'drop_oldest':
+            oldest = self._oldest_level(control=False)
+            if oldest is not None:
+                return self._evict(oldest), False
+        elif self.overflow == 'drop_lowest':
+            queued = [queued for queued, items in self._levels.items()
+                      if items and queued is not _control]
+            lowest = min(queued) if queued else None
+            if lowest is not None and lowest <= level:
+                return self._evict(lowest), False
+        return None, True
+
+    def put(self, item, block=True, timeout=None):
+        """queue item, applying the overflow policy if the queue is full
+
+        :param block: with 'block', wait for room; otherwise the new
+            item is dropped right away
+        :param timeout: seconds to wait, instead of the queue's timeout
+        :return: whether item was queued
+        :rtype: bool
+        """
+        evicted = None
+        with self._lock:
+            if item is None:
+                self._append(item, _control)
+                return True
+            level = self.level(item)
+            if self.maxsize and self._size >= self.maxsize:
+                evicted, refused = self._make_room(level, block, timeout)
+                if refused:
+                    self._drop(item, level)
+                    evicted = item
+            if evicted is not item:
+                self._append(item, level)
+        if evicted is not None and self.discard is not None:
+            self.discard(evicted)
+        return evicted is not item
+
+    def put_nowait(self, item):
+        """queue item without waiting for room"""
+        return self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """the oldest item queued
+
+        :raises Queue.Empty: if there is none, after waiting up to
+            timeout seconds if block
+        """
+        with self._lock:
+            if block:
+                deadline = None if timeout is None else time.time() + timeout
+                while self._oldest_level() is None:
+                    if deadline is None:
+                        self._not_empty.wait()
+                        continue
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+            level = self._oldest_level()
+            if level is None:
+                raise Empty
+            item = self._pop(level)
+            if level is not _control:
+                self._not_full.notify()
+            return item
+
+    def get_nowait(self):
+        """the oldest item queued, without waiting for one"""
+        return self.get(block=False)
+
+    def _task_done(self):
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._all_done.notify_all()
+
+    def task_done(self):
+        """tell join an item taken off of the queue has been handled"""
+        with self._lock:
+            self._task_done()
+
+    def join(self):
+        """wait until every item queued has been handled or dropped"""
+        with self._lock:
+            while self._unfinished:
+                self._all_done.wait()
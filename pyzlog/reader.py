@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+
+"""Read pyzlog log files back.
+
+Entries are parsed lazily, one line at a time, across a log file and
+all of its rotated backups, oldest first, so a scan never holds more
+than one entry in memory::
+
+    from pyzlog import reader
+
+    for entry in reader.read('/var/log/app', 'app.log',
+                             event_name='cache.miss', log_level='ERROR',
+                             start='2016-01-07T13:00:00Z',
+                             where={'user_id': 42}):
+        print(entry['event_timestamp'], entry['fields'])
+
+:func:`scan` takes the same filters but splits the files between a
+pool of processes, which is much faster for gigabytes of backups.
+Backups with a sidecar index (see :mod:`pyzlog.index`) only have the
+blocks that can match a time range or event_name read.
+
+"""
+
+import io
+import os
+import re
+import gzip
+import json
+import datetime
+import multiprocessing
+
+from . import default_date_fmt, _TimestampCache
+from . import index as _index
+from . import binary as _binary
+from . import handlers as _handlers
+
+
+def _open_zstd(filename):
+    import zstandard
+    f = open(filename, 'rb')
+    try:
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(f, closefd=True))
+    except Exception:
+        f.close()
+        raise
+
+
+openers = {
+    '.gz': lambda filename: gzip.open(filename, 'rb'),
+    '.zst': _open_zstd,
+}
+"""how to open a backup, by the extension its compression added"""
+
+
+def _backup_pattern(target):
+    stamps = sorted((pattern for _, _, pattern
+                     in _handlers.rollover_periods.values()),
+                    key=len, reverse=True)
+    return re.compile(
+        r'^%s\.(?:(\d+)|(%s)(?:\.(\d+))?)(%s)?$'
+        % (re.escape(target), '|'.join(stamps),
+           '|'.join(re.escape(suffix) for suffix in sorted(openers))))
+
+
+def log_files(path, target):
+    """the log file and its rotated backups, oldest first.
+
+    Numbered backups (target.2, target.1, ...) come before timestamped
+    ones (target.2016-01-07_13, ...), and target itself comes last.
+    Files still waiting to be compressed are not included.
+
+    :param path: directory of the log file
+    :param target: name of the log file
+    :type path: string
+    :type target: string
+    :return: paths of the files
+    :rtype: list
+    """
+    pattern = _backup_pattern(target)
+    backups = []
+    for name in os.listdir(path):
+        match = pattern.match(name)
+        if match is None:
+            continue
+        number, stamp, count, _ = match.groups()
+        if number is not None:
+            key = (0, -int(number), '', 0)
+        else:
+            key = (1, 0, stamp, int(count or 0))
+        backups.append((key, os.path.join(path, name)))
+    files = [filename for _, filename in sorted(backups)]
+    current = os.path.join(path, target)
+    if os.path.exists(current):
+        files.append(current)
+    return files
+
+
+def open_log(filename):
+    """open a log file or a compressed backup for reading lines
+
+    :param filename: path of the file
+    :type filename: string
+    :return: file object yielding lines as bytes
+    """
+    opener = openers.get(os.path.splitext(filename)[1])
+    if opener is None:
+        return open(filename, 'rb')
+    return opener(filename)
+
+
+def _timestamp(value):
+    """value as an event_timestamp string, which sort chronologically.
+    Strings are taken to be in default_date_fmt, and may be cut short,
+    e.g. '2016-01-07T13:05'.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        return value.strftime(default_date_fmt)
+    if isinstance(value, (int, float)):
+        return _TimestampCache().render(value)
+    return value.rstrip('Z')
+
+
+def _as_set(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(value)
+    return frozenset([value])
+
+
+def _needles(event_names):
+    """byte strings at least one of which has to be in any line with a
+    matching event_name, so most other lines are never parsed. None if
+    some name could be escaped differently by different serializers.
+    """
+    if event_names is None:
+        return None
+    needles = []
+    for name in event_names:
+        encoded = json.dumps(name)
+        if encoded != '"%s"' % name or '/' in name:
+            return None
+        needles.append(encoded.encode('ascii'))
+    return tuple(needles)
+
+
+class Filter(object):
+    """Matches parsed log entries.
+
+    :param event_name: an event name, or a list of them
+    :param log_level: a log level such as 'ERROR', or a list of them
+    :param start: earliest event_timestamp, inclusive
+    :param end: latest event_timestamp, exclusive
+    :param where: field name to the value it must have, or to a
+        function of the value (None if missing) returning whether it
+        matches
+    :type event_name: string or list
+    :type log_level: string or list
+    :type start: datetime (naive ones are UTC), epoch seconds, or a
+        string like '2016-01-07T13:05'
+    :type end: datetime (naive ones are UTC), epoch seconds, or a
+        string like '2016-01-07T13:05'
+    :type where: dict
+    """
+
+    def __init__(self, event_name=None, log_level=None, start=None,
+                 end=None, where=None):
+        self.event_names = _as_set(event_name)
+        self.log_levels = _as_set(log_level)
+        self.start = _timestamp(start)
+        self.end = _timestamp(end)
+        self.where = list(where.items()) if where else []
+        self.needles = _needles(self.event_names)
+        self.indexed = (self.event_names is not None or
+                        self.start is not None or self.end is not None)
+
+    def wants(self, line):
+        """cheap check on the raw line before it is parsed"""
+        if self.needles is None:
+            return True
+        for needle in self.needles:
+            if needle in line:
+                return True
+        return False
+
+    def wants_block(self, first, last, event_names):
+        """whether an index block could hold matching entries"""
+        if self.start is not None and last < self.start:
+            return False
+        if self.end is not None and first >= self.end:
+            return False
+        if (self.event_names is not None and
+                self.event_names.isdisjoint(event_names)):
+            return False
+        return True
+
+    def __call__(self, entry):
+        if (self.event_names is not None and
+                entry.get('event_name') not in self.event_names):
+            return False
+        if (self.log_levels is not None and
+                entry.get('log_level') not in self.log_levels):
+            return False
+        if self.start is not None or self.end is not None:
+            timestamp = entry.get('event_timestamp', '')
+            if self.start is not None and timestamp < self.start:
+                return False
+            if self.end is not None and timestamp >= self.end:
+                return False
+        fields = entry.get('fields') or {}
+        for key, expected in self.where:
+            value = fields.get(key)
+            if callable(expected):
+                if not expected(value):
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+
+def _clip(ranges, start, end):
+    """the parts of (start, end) ranges between start and end, where an
+    end of None runs to the end of the file"""
+    clipped = []
+    for first, last in ranges:
+        first = max(first, start)
+        if last is None or (end is not None and end < last):
+            last = end
+        if last is None or first < last:
+            clipped.append((first, last))
+    return clipped
+
+
+def _lines(f, sidecar, matches, start=0, end=None):
+    """lines of f starting from start up to end, limited to the index
+    blocks matches wants, and anything written after the index was
+    """
+    if start:
+        # the line running over start belongs to the previous chunk
+        f.seek(start - 1)
+        start += len(f.readline()) - 1
+    if sidecar is None:
+        ranges = [(start, end)]
+    else:
+        ranges = _clip(sidecar.ranges(matches.wants_block) +
+                       [(sidecar.size, None)], start, end)
+    if ranges == [(0, None)]:
+        for line in f:
+            yield line
+        return
+    # zstd backups can't seek, so they're read forward past the blocks
+    # that are skipped instead
+    seekable = getattr(f, 'seekable', lambda: True)()
+    position = 0
+    for start, end in ranges:
+        if seekable:
+            f.seek(start)
+            position = start
+        while position < start:
+            skipped = len(f.read(min(start - position, 1 << 20)))
+            if not skipped:
+                return
+            position += skipped
+        while end is None or position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def _json_entries(f, sidecar, matches, start=0, end=None):
+    for line in _lines(f, sidecar, matches, start, end):
+        if not matches.wants(line):
+            continue
+        try:
+            yield json.loads(line.decode('utf-8'))
+        except ValueError:
+            continue
+
+
+def _read_file(filename, matches, start=0, end=None):
+    sidecar = _index.load(filename) if matches.indexed else None
+    f = open_log(filename)
+    try:
+        if _binary.is_binary(f):
+            entries = _binary.read(f)
+        else:
+            entries = _json_entries(f, sidecar, matches, start, end)
+        for entry in entries:
+            if matches(entry):
+                yield entry
+    finally:
+        f.close()
+
+
+def read_file(filename, **filters):
+    """lazily parse the matching entries in a single file.
+
+    Lines that aren't valid json, such as a line still being written,
+    are skipped. If the file has an index, only the blocks that can
+    match are read. Binary log files (see :mod:`pyzlog.binary`) are
+    read too.
+
+    :param filename: a log file or compressed backup
+    :param filters: passed to :class:`Filter`
+    :type filename: string
+    :return: generator of entries as dicts
+    """
+    for entry in _read_file(filename, Filter(**filters)):
+        yield entry
+
+
+def read(path, target, **filters):
+    """lazily parse the matching entries of a log file and its backups,
+    oldest first.
+
+    :param path: directory of the log file
+    :param target: name of the log file
+    :param filters: passed to :class:`Filter`
+    :type path: string
+    :type target: string
+    :return: generator of entries as dicts
+    """
+    for filename in log_files(path, target):
+        for entry in read_file(filename, **filters):
+            yield entry
+
+
+def _chunks(filename, chunk_bytes):
+    """(start, end) offsets splitting filename into pieces for
+    :func:`scan`'s workers. Compressed and binary files can only be read
+    from the start, so they're a single piece."""
+    if os.path.splitext(filename)[1] in openers:
+        return [(0, None)]
+    with open(filename, 'rb') as f:
+        if _binary.is_binary(f):
+            return [(0, None)]
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+    starts = list(range(0, size, chunk_bytes)) or [0]
+    # the last piece also takes anything appended since
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def _read_chunk(args):
+    filename, start, end, filters = args
+    return list(_read_file(filename, Filter(**filters), start, end))
+
+
+def scan(path, target, processes=None, chunk_bytes=16 << 20, **filters):
+    """like :func:`read`, but files are read in a pool of processes.
+
+    Entries still come back oldest first. Log files are split into
+    pieces of chunk_bytes, and all the matches from a piece are sent
+    back at once. Compressed backups and binary log files can't be
+    split, so all the matches from one of those are held in memory
+    together; filters for them should be selective. where functions
+    are sent to the worker processes, so they have to be picklable,
+    e.g. module level functions rather than lambdas.
+
+    :param path: directory of the log file
+    :param target: name of the log file
+    :param processes: number of worker processes, defaults to the
+        number of cpus
+    :param chunk_bytes: how much of an uncompressed file a worker reads
+        at a time
+    :param filters: passed to :class:`Filter`
+    :type path: string
+    :type target: string
+    :type processes: int
+    :type chunk_bytes: int
+    :return: generator of entries as dicts
+    """
+    chunks = [(filename, start, end, filters)
+              for filename in log_files(path, target)
+              for start, end in _chunks(filename, chunk_bytes)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        for entries in pool.imap(_read_chunk, chunks):
+            for entry in entries:
+                yield entry
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""Sampling and rate limiting of log calls, see :func:`pyzlog.limit`.
+
+Rules are looked up and applied in :func:`pyzlog._log` before any of
+the work of building and formatting a record is done. None of it takes
+a lock: token buckets are updated without one, so under heavy
+contention a few more records than the limit may get through, and the
+dropped counts are kept in itertools.count objects, which are safe to
+advance from any thread.
+
+"""
+
+import time
+import random
+import itertools
+import threading
+
+
+class Rule(object):
+    """Sample rate and token bucket for one event_name and/or log_level.
+
+    :param sample_rate: fraction of records kept, e.g. 0.01 for 1%
+    :param rate: records allowed per second, after sampling
+    :param burst: records allowed in a burst, defaults to rate
+    :type sample_rate: float
+    :type rate: float
+    :type burst: float
+    """
+
+    def __init__(self, sample_rate=1.0, rate=None, burst=None):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('sample_rate must be between 0 and 1, got %r'
+                             % (sample_rate,))
+        self.sample_rate = sample_rate
+        self.rate = rate
+        self.burst = max(1, burst if burst is not None else rate or 1)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.dropped = {}
+        self.since = self.updated
+
+    def allow(self, now):
+        """whether to keep a record logged at now"""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        if self.rate is None:
+            return True
+        tokens = min(self.burst,
+                     self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+    def drop(self, logger_name):
+        """count a record dropped from logger_name"""
+        counter = self.dropped.get(logger_name)
+        if counter is None:
+            counter = self.dropped.setdefault(logger_name, itertools.count())
+        next(counter)
+
+    def take_dropped(self):
+        """(logger_name, count) of the records dropped since the last
+        call, resetting the counts"""
+        counts = []
+        for logger_name in list(self.dropped):
+            counter = self.dropped.pop(logger_name, None)
+            if counter is not None:
+                counts.append((logger_name, next(counter)))
+        return counts
+
+
+class Limiter(object):
+    """The rules for every event_name and log_level, and the periodic
+    report of what they dropped.
+
+    :param report: called with logger_name, event_name, log_level, the
+        number of records dropped and the seconds they were dropped over
+    :param report_interval: seconds between reports
+    :type report: callable
+    :type report_interval: float
+    """
+
+    def __init__(self, report, report_interval=60):
+        self.report = report
+        self.report_interval = report_interval
+        self.rules = {}
+        self.report_at = 0
+        self._reporting = threading.Lock()
+
+    def add(self, event_name=None, log_level=None, sample_rate=1.0,
+            rate=None, burst=None):
+        """limit records with event_name and/or log_level, replacing any
+        rule already set for them
+        """
+        if event_name is None and log_level is None:
+            raise ValueError('a limit needs an event_name or a log_level')
+        if log_level is not None:
+            log_level = log_level.upper()
+        self.rules[(event_name, log_level)] = Rule(sample_rate, rate, burst)
+
+    def clear(self):
+        """remove every rule, reporting what they dropped first"""
+        self.flush()
+        self.rules = {}
+
+    def allow(self, logger_name, event_name, log_level):
+        """whether to log a record, counting it as dropped if not.
+
+        The most specific rule applies: the one for both event_name and
+        log_level, then the one for event_name, then for log_level.
+        """
+        now = time.time()
+        if now >= self.report_at:
+            self.flush(now)
+        rules = self.rules
+        rule = (rules.get((event_name, log_level)) or
+                rules.get((event_name, None)) or
+                rules.get((None, log_level)))
+        if rule is None or rule.allow(now):
+            return True
+        rule.drop(logger_name)
+        return False
+
+    def flush(self, now=None):
+        """report the records dropped since the last report"""
+        if not self.rules or not self._reporting.acquire(False):
+            return
+        try:
+            now = now if now is not None else time.time()
+            self.report_at = now + self.report_interval
+            for (event_name, log_level), rule in list(self.rules.items()):
+                since, rule.since = rule.since, now
+                for logger_name, dropped in rule.take_dropped():
+                    if dropped:
+                        self.report(logger_name, event_name, log_level,
+                                    dropped, now - since)
+        finally:
+            self._reporting.release()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+"""JSON encoder backends for :class:`pyzlog.JsonFormatter`.
+
+Each backend is a factory that takes the formatter's json_default
+callback and returns a function encoding an object to a json string.
+Every backend hands datetimes and anything else it can't encode natively
+to json_default, and entries orjson can't encode at all, such as ints
+wider than 64 bits, are encoded by the stdlib instead. The backends then
+write the same values, except that:
+
+* ujson writes Decimal as a float, e.g. Decimal('1.10') as 1.1, where
+  the others write its str
+* orjson writes NaN and infinities as null, where the others write the
+  NaN and Infinity that json.loads accepts but strict parsers don't
+
+Only the stdlib backend is byte-identical to earlier versions of pyzlog;
+the others may differ in whitespace, and orjson writes non-ascii
+characters as utf-8 rather than escaping them.
+
+Values json can't encode itself are encoded by :data:`registry`, the
+default json_default, which picks an encoder by the value's type.
+Applications register encoders for their own types with
+:func:`register`::
+
+    from pyzlog import serializers
+
+    serializers.register(Money, lambda money: [money.amount, money.currency])
+
+The encoder is looked up once per exact type and cached, so subclasses
+of registered types cost a walk of their mro only the first time.
+Anything without an encoder is written as str(value).
+
+"""
+
+import json
+import uuid
+import decimal
+import datetime
+import threading
+
+try:
+    import enum
+except ImportError:  # pragma: no cover
+    enum = None
+
+try:
+    _memoryview = memoryview
+except NameError:  # pragma: no cover
+    # memoryview is 2.7+
+    _memoryview = None
+
+
+def _datetime(value):
+    return '%04d-%02d-%02dT%02d:%02d:%02d.%06dZ' % (
+        value.year, value.month, value.day, value.hour, value.minute,
+        value.second, value.microsecond)
+
+
+def _date(value):
+    return '%04d-%02d-%02dT00:00:00.000000Z' % (
+        value.year, value.month, value.day)
+
+
+def _time(value):
+    # what strftime gives a time, which has no date
+    return '1900-01-01T%02d:%02d:%02d.%06dZ' % (
+        value.hour, value.minute, value.second, value.microsecond)
+
+
+def _bytes(value):
+    return bytes(value).decode('utf-8', 'replace')
+
+
+def _enum(value):
+    return value.value
+
+
+class Registry(object):
+    """Encoders for values json can't encode, by type. Called with a
+    value, returns something json can encode, so it can be passed as a
+    formatter's json_default.
+
+    :param encoders: initial {type: encoder} mapping
+    :type encoders: dict
+    """
+
+    def __init__(self, encoders=None):
+        self._encoders = dict(encoders or {})
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def register(self, cls, encoder):
+        """encode values of cls, and its subclasses, with encoder
+
+        :param cls: type to register
+        :param encoder: called with a value, returns something json can
+            encode, possibly needing another encoder itself
+        :type cls: type
+        :type encoder: callable
+        """
+        with self._lock:
+            self._encoders[cls] = encoder
+            self._cache = {}
+
+    def unregister(self, cls):
+        """stop encoding values of cls with its registered encoder"""
+        with self._lock:
+            self._encoders.pop(cls, None)
+            self._cache = {}
+
+    def encoder(self, cls):
+        """the encoder for values of exactly cls: the one registered for
+        the nearest type in its mro, or str"""
+        cache = self._cache
+        try:
+            return cache[cls]
+        except KeyError:
+            pass
+        encoder = str
+        for klass in getattr(cls, '__mro__', (cls,)):
+            if klass in self._encoders:
+                encoder = self._encoders[klass]
+                break
+        cache[cls] = encoder
+        return encoder
+
+    def __call__(self, value):
+        try:
+            encoder = self._cache[type(value)]
+        except KeyError:
+            encoder = self.encoder(type(value))
+        return encoder(value)
+
+
+builtin_encoders = {
+    datetime.datetime: _datetime,
+    datetime.date: _date,
+    datetime.time: _time,
+    decimal.Decimal: str,
+    uuid.UUID: str,
+    bytes: _bytes,
+    bytearray: _bytes,
+    set: list,
+    frozenset: list,
+    tuple: list,
+}
+"""encoders every registry starts with; times are written in
+default_date_fmt, Decimal and UUID as their str, bytes decoded as utf-8,
+sets and tuples, such as the namedtuples orjson leaves to json_default,
+as lists and enums as their value"""
+if _memoryview is not None:
+    builtin_encoders[_memoryview] = _bytes
+if enum is not None:
+    builtin_encoders[enum.Enum] = _enum
+
+registry = Registry(builtin_encoders)
+"""the registry JsonFormatter uses unless given another json_default"""
+
+register = registry.register
+unregister = registry.unregister
+
+
+def _stdlib(json_default):
+    return json.JSONEncoder(default=json_default).encode
+
+
+def _simplejson(json_default):
+    import simplejson
+    if not simplejson._import_c_make_encoder():
+        raise ImportError('simplejson is installed without C speedups')
+    # simplejson writes Decimals as numbers and namedtuples as objects
+    # by default, the stdlib a str and a list
+    return simplejson.JSONEncoder(
+        default=json_default, use_decimal=False, namedtuple_as_object=False,
+        allow_nan=True).encode
+
+
+def _ujson(json_default):
+    import ujson
+    try:
+        ujson.dumps(object(), default=str)
+    except TypeError:
+        raise ImportError('ujson %s has no default= support'
+                          % ujson.__version__)
+
+    def encode(obj):
+        return ujson.dumps(obj, default=json_default,
+                           escape_forward_slashes=False)
+    return encode
+
+
+def _orjson(json_default):
+    import orjson
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    dumps = orjson.dumps
+    fallback = _stdlib(json_default)
+
+    def encode(obj):
+        try:
+            return dumps(obj, default=json_default,
+                         option=options).decode('utf-8')
+        except TypeError:
+            # e.g. an int wider than 64 bits
+            return fallback(obj)
+    return encode
+
+
+backends = {
+    'json': _stdlib,
+    'simplejson': _simplejson,
+    'ujson': _ujson,
+    'orjson': _orjson,
+}
+"""factories for each serializer name JsonFormatter accepts"""
+
+auto_order = ('orjson', 'ujson', 'simplejson', 'json')
+"""backends tried, fastest first, for serializer='auto'"""
+
+
+def get_encoder(serializer='json', json_default=None):
+    """Build the encode function for a serializer.
+
+    :param serializer: a name from backends, 'auto' to use the fastest
+        installed backend, or a callable taking json_default and
+        returning an encode function
+    :param json_default: called with objects the backend can't encode
+    :type serializer: string or callable
+    :type json_default: callable
+    :return: function encoding an object to a json string
+    :rtype: callable
+    :raises ValueError: if serializer is not a known backend
+    :raises ImportError: if the requested backend is not installed
+    """
+    if callable(serializer):
+        return serializer(json_default)
+    if serializer == 'auto':
+        for name in auto_order:
+            try:
+                return backends[name](json_default)
+            except ImportError:
+                continue
+    if serializer not in backends:
+        raise ValueError('unknown serializer %r, expected one of %s'
+                         % (serializer, ', '.join(sorted(backends))))
+    return backends[serializer](json_default)
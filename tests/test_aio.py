@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_aio
+----------------------------------
+
+Tests for `pyzlog.aio` module.
+"""
+
+import os
+import json
+import logging
+import unittest2
+import pyzlog
+
+try:
+    import asyncio
+    import types
+    from pyzlog import aio
+except ImportError:
+    aio = None
+
+
+def awaiting(make):
+    """a coroutine awaiting make(), which needs the loop to be running.
+    Written without yield from, so python 2 can still parse this file.
+    """
+    @types.coroutine
+    def wait():
+        future = make()
+        while not future.done():
+            yield
+        future.result()
+    return wait()
+
+
+@unittest2.skipIf(aio is None, 'needs python 3.7 or later')
+class TestAio(unittest2.TestCase, pyzlog.LogTest):
+
+    def setUp(self):
+        self.path = os.path.abspath('.')
+        self.target = 'foo.log'
+        self.remove_log()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        aio.init_logs(path=self.path, target=self.target,
+                      server_hostname='localhost',
+                      fields={'request_id': None, 'step': None})
+
+    def tearDown(self):
+        self.loop.run_until_complete(awaiting(aio.aclose))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        logger = logging.getLogger('root')
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        self.remove_log()
+
+    def get_entries(self):
+        return [json.loads(line) for line in self.get_log_messages()]
+
+    def test_flush_writes_queued_entries(self):
+        aio.info(event_name='queued')
+        self.loop.run_until_complete(awaiting(aio.flush))
+        self.assertEqual(['queued'],
+                         [e['event_name'] for e in self.get_entries()])
+
+    def test_fields_follow_tasks(self):
+        @types.coroutine
+        def handle(request_id):
+            aio.bind(request_id=request_id)
+            aio.info(event_name='start', extra={'step': 1})
+            # let the other task run before logging again
+            yield
+            aio.info(event_name='end')
+
+        self.loop.run_until_complete(asyncio.gather(handle('a'), handle('b')))
+        self.loop.run_until_complete(awaiting(aio.flush))
+        self.assertEqual(
+            [('start', 'a', 1), ('start', 'b', 1), ('end', 'a', None),
+             ('end', 'b', None)],
+            [(e['event_name'], e['fields']['request_id'],
+              e['fields'].get('step')) for e in self.get_entries()])
+        self.assertEqual({}, aio.fields())
+
+    def test_bound(self):
+        with aio.bound(request_id='a'):
+            self.assertEqual({'request_id': 'a'}, aio.fields())
+            aio.error(event_name='failed')
+        self.assertEqual({}, aio.fields())
+        self.loop.run_until_complete(awaiting(aio.flush))
+        self.assertEqual('a', self.get_entries()[0]['fields']['request_id'])
+
+    def test_bind_reserved_fields(self):
+        with self.assertRaises(ValueError):
+            aio.bind(levelname='x')
+
+    def test_needs_a_running_loop(self):
+        with self.assertRaises(RuntimeError):
+            aio.flush()
+
+    def test_blocking_overflow_is_refused(self):
+        with self.assertRaises(ValueError):
+            aio.init_logs(path=self.path, target=self.target,
+                          overflow='block')
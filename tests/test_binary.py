@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_binary
+----------------------------------
+
+Tests for `pyzlog.binary` module.
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest2
+import mock
+import pyzlog
+from pyzlog import binary, handlers, reader
+from tests.test_handlers import make_record
+
+
+class TestBinary(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.path, 'foo.log')
+        self.formatter = pyzlog.JsonFormatter(
+            server_hostname='localhost', timestamp_from_record=True,
+            fields={'n': None, 'name': None, 'nested': None})
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_handler(self, **kwargs):
+        handler = handlers.BinaryRotatingFileHandler(self.log_file, **kwargs)
+        handler.setFormatter(self.formatter)
+        self.addCleanup(handler.close)
+        return handler
+
+    def get_records(self, count=10):
+        records = []
+        for n in range(count):
+            record = make_record(
+                n=n, name=u'caf\xe9 %d' % n, nested={'a': [1, 2.5, None]},
+                event_name='foo.event', log_level='INFO')
+            record.created += n * 0.37
+            records.append(record)
+        return records
+
+    def convert(self, filename):
+        out = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        with open(filename, 'rb') as f:
+            binary.convert(f, out)
+        return out.getvalue().splitlines()
+
+    def test_converts_back_to_the_same_json(self):
+        handler = self.get_handler()
+        records = self.get_records()
+        for record in records:
+            handler.handle(record)
+        expected = [self.formatter.format(record) for record in records]
+        if sys.version_info[0] > 2:
+            self.assertEqual(expected, self.convert(self.log_file))
+        else:
+            self.assertEqual([json.loads(line) for line in expected],
+                             [json.loads(line)
+                              for line in self.convert(self.log_file)])
+
+    def test_repeated_strings_written_once(self):
+        handler = self.get_handler()
+        for record in self.get_records(50):
+            handler.handle(record)
+        with open(self.log_file, 'rb') as f:
+            data = f.read()
+        self.assertEqual(1, data.count(b'localhost'))
+        self.assertEqual(1, data.count(b'foo.event'))
+        self.assertEqual(1, data.count(b'nested'))
+        json_bytes = sum(len(self.formatter.format(record)) + 1
+                         for record in self.get_records(50))
+        self.assertLess(len(data), json_bytes * 0.6)
+
+    def test_backups_read_on_their_own(self):
+        handler = self.get_handler(maxBytes=400, backupCount=20)
+        for record in self.get_records(30):
+            handler.handle(record)
+        files = reader.log_files(self.path, 'foo.log')
+        self.assertGreater(len(files), 2)
+        numbers = []
+        for filename in files:
+            numbers.extend(e['fields']['n']
+                           for e in reader.read_file(filename))
+        self.assertEqual(list(range(30)), numbers)
+
+    def test_backup_timestamps(self):
+        for capacity in [1, 4]:
+            handler = self.get_handler(maxBytes=150, backupCount=50,
+                                       capacity=capacity)
+            records = self.get_records(30)
+            for record in records:
+                handler.handle(record)
+            handler.close()
+            expected = [self.formatter._get_timestamp(record)
+                        for record in records]
+            files = reader.log_files(self.path, 'foo.log')
+            self.assertGreater(len(files), 2)
+            timestamps = []
+            for filename in files:
+                timestamps.extend(e['event_timestamp']
+                                  for e in reader.read_file(filename))
+                os.remove(filename)
+            self.assertEqual(expected, timestamps)
+
+    def test_appending_starts_a_new_segment(self):
+        handler = self.get_handler()
+        handler.handle(make_record(n=1, event_name='first'))
+        handler.close()
+        handler = self.get_handler()
+        handler.handle(make_record(n=2, event_name='second'))
+        self.assertEqual(
+            [('first', 1), ('second', 2)],
+            [(e['event_name'], e['fields']['n'])
+             for e in reader.read_file(self.log_file)])
+
+    def test_truncated_entry_is_skipped(self):
+        handler = self.get_handler()
+        for record in self.get_records(3):
+            handler.handle(record)
+        with open(self.log_file, 'rb+') as f:
+            f.truncate(os.path.getsize(self.log_file) - 3)
+        self.assertEqual([0, 1], [e['fields']['n']
+                                  for e in reader.read_file(self.log_file)])
+
+    def test_event_name_that_is_not_a_string(self):
+        handler = self.get_handler()
+        handler.handle(make_record(n=0, event_name=5))
+        self.assertEqual(['5'], [e['event_name']
+                                 for e in reader.read_file(self.log_file)])
+
+    def test_strings_past_max_strings(self):
+        handler = self.get_handler(max_strings=2)
+        for n in range(3):
+            handler.handle(make_record(n=n, event_name='event.%d' % n))
+        self.assertEqual(2, len(handler.encoder.strings))
+        self.assertEqual(2, len(handler.encoder.shapes))
+        self.assertEqual(['event.0', 'event.1', 'event.2'],
+                         [e['event_name']
+                          for e in reader.read_file(self.log_file)])
+
+    def test_timestamps_out_of_order(self):
+        handler = self.get_handler()
+        records = self.get_records(4)
+        records[2].created -= 3600.5
+        for record in records:
+            handler.handle(record)
+        self.assertEqual(
+            [self.formatter._get_timestamp(record) for record in records],
+            [e['event_timestamp'] for e in reader.read_file(self.log_file)])
+
+    def test_other_timestamps_kept_as_is(self):
+        handler = self.get_handler()
+        with mock.patch.object(self.formatter, '_get_timestamp',
+                               return_value='now'):
+            handler.handle(make_record(n=1))
+        self.assertEqual('now', list(reader.read_file(
+            self.log_file))[0]['event_timestamp'])
+
+    def test_reader_filters(self):
+        handler = self.get_handler()
+        for record in self.get_records():
+            handler.handle(record)
+        self.assertEqual([3], [e['fields']['n'] for e in reader.read(
+            self.path, 'foo.log', where={'n': 3})])
+
+    def test_init_logs_binary(self):
+        pyzlog.init_logs(path=self.path, target='foo.log',
+                         logger_name='binary', binary=True,
+                         server_hostname='localhost', fields={'n': None})
+        logger = logging.getLogger('binary')
+        self.addCleanup(logger.handlers[0].close)
+        self.addCleanup(logger.removeHandler, logger.handlers[0])
+        pyzlog.info(logger_name='binary', event_name='packed',
+                    extra={'n': 1})
+        entry = json.loads(self.convert(self.log_file)[0])
+        self.assertEqual(('packed', {'n': 1}),
+                         (entry['event_name'], entry['fields']))
+
+    def test_binary_needs_a_single_writer(self):
+        with self.assertRaises(ValueError):
+            pyzlog.init_logs(path=self.path, target='foo.log', binary=True,
+                             process_safe=True)
@@ -0,0 +1,572 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_handlers
+----------------------------------
+
+Tests for `pyzlog.handlers` module.
+"""
+
+import os
+import gzip
+import json
+import time
+import shutil
+import weakref
+import logging
+import logging.handlers
+import tempfile
+import threading
+import unittest2
+import mock
+import pyzlog
+from pyzlog import handlers
+
+
+def make_record(level=logging.INFO, **fields):
+    record = logging.LogRecord('n', level, 'p', 1, '', None, None)
+    record.__dict__.update(fields)
+    return record
+
+
+class TestRotatingFileHandler(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.path, 'foo.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_handler(self, **kwargs):
+        handler = handlers.RotatingFileHandler(self.log_file, **kwargs)
+        handler.setFormatter(pyzlog.JsonFormatter(
+            server_hostname='localhost', fields={'n': None}))
+        self.addCleanup(handler.close)
+        return handler
+
+    def read_numbers(self, name, opener=open):
+        f = opener(os.path.join(self.path, name), 'rb')
+        try:
+            return [json.loads(line.decode('utf-8'))['fields']['n']
+                    for line in f]
+        finally:
+            f.close()
+
+    @unittest2.skipUnless(hasattr(logging.handlers.RotatingFileHandler,
+                                  'rotation_filename'),
+                          'namer and rotator are python 3 only')
+    def test_namer_and_rotator(self):
+        handler = self.get_handler(maxBytes=1, backupCount=2)
+        rotated = []
+
+        def rotator(source, destination):
+            rotated.append(os.path.basename(destination))
+            os.rename(source, destination)
+        handler.namer = lambda name: name + '.old'
+        handler.rotator = rotator
+        for n in range(4):
+            handler.handle(make_record(n=n))
+        self.assertEqual(['foo.log', 'foo.log.1.old', 'foo.log.2.old'],
+                         sorted(os.listdir(self.path)))
+        self.assertEqual(['foo.log.1.old'] * 4, rotated)
+        self.assertEqual([1], self.read_numbers('foo.log.2.old'))
+
+    def test_does_not_keep_the_last_record(self):
+        for handler in [self.get_handler(maxBytes=1 << 20),
+                        handlers.BatchingRotatingFileHandler(
+                            self.log_file, capacity=1, flush_interval=0)]:
+            handler.setFormatter(pyzlog.JsonFormatter(fields={'n': None}))
+            record = make_record(n=1)
+            ref = weakref.ref(record)
+            handler.handle(record)
+            handler.close()
+            del record
+            self.assertIsNone(ref())
+
+    def test_compressor_picks_up_late_appends(self):
+        pending = os.path.join(self.path, 'foo.log.pending')
+        with open(pending, 'wb') as f:
+            f.write(b'{"fields": {"n": 1}}\n')
+        compressor = handlers.Compressor('gzip')
+        compress = compressor.compress
+
+        def compress_then_append(source, destination):
+            compress(source, destination)
+            if len(calls) == 0:
+                # a process that hasn't seen the rotation yet
+                with open(source, 'ab') as f:
+                    f.write(b'{"fields": {"n": 2}}\n')
+            calls.append(destination)
+        calls = []
+        compressor.compress = compress_then_append
+        installed = []
+        compressor._compress(pending, self.log_file,
+                             lambda path, suffix: installed.append(path),
+                             grace=0.01)
+        self.assertEqual(2, len(calls))
+        self.assertFalse(os.path.exists(pending))
+        self.assertEqual([1, 2], self.read_numbers(installed[0], gzip.open))
+
+    def test_rotates_without_compression(self):
+        handler = self.get_handler(maxBytes=1, backupCount=2)
+        for n in range(4):
+            handler.handle(make_record(n=n))
+        self.assertEqual(['foo.log', 'foo.log.1', 'foo.log.2'],
+                         sorted(os.listdir(self.path)))
+        self.assertEqual([3], self.read_numbers('foo.log'))
+        self.assertEqual([1], self.read_numbers('foo.log.2'))
+
+    def test_compresses_backups(self):
+        handler = self.get_handler(maxBytes=1, backupCount=2,
+                                   compress='gzip')
+        for n in range(4):
+            handler.handle(make_record(n=n))
+        handler.close()
+        # only process safe handlers share a lock file
+        self.assertEqual(['foo.log', 'foo.log.1.gz', 'foo.log.2.gz'],
+                         sorted(os.listdir(self.path)))
+        self.assertEqual([3], self.read_numbers('foo.log'))
+        self.assertEqual([2], self.read_numbers('foo.log.1.gz', gzip.open))
+        self.assertEqual([1], self.read_numbers('foo.log.2.gz', gzip.open))
+
+    def test_compresses_with_zstd(self):
+        try:
+            import zstandard
+        except ImportError:
+            self.skipTest('zstandard is not installed')
+        handler = self.get_handler(maxBytes=1, backupCount=2,
+                                   compress='zstd')
+        for n in range(2):
+            handler.handle(make_record(n=n))
+        handler.close()
+        with open(os.path.join(self.path, 'foo.log.1.zst'), 'rb') as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f).read()
+        self.assertEqual(0, json.loads(data.decode('utf-8'))['fields']['n'])
+
+    def hour_name(self, timestamp):
+        return 'foo.log.' + time.strftime('%Y-%m-%d_%H',
+                                          time.gmtime(timestamp))
+
+    def test_rotates_on_time(self):
+        handler = self.get_handler(when='H', backupCount=5)
+        this_hour = handler.rollover_at - 3600
+        self.assertEqual(0, this_hour % 3600)
+        handler.handle(make_record(n=0))
+        # pretend the file was started an hour ago
+        handler.rollover_at = this_hour
+        handler.handle(make_record(n=1))
+        self.assertEqual(this_hour + 3600, handler.rollover_at)
+        self.assertEqual(sorted(['foo.log', self.hour_name(this_hour - 3600)]),
+                         sorted(os.listdir(self.path)))
+        self.assertEqual([0], self.read_numbers(
+            self.hour_name(this_hour - 3600)))
+        self.assertEqual([1], self.read_numbers('foo.log'))
+
+    def test_rotates_on_size_within_interval(self):
+        line = len(pyzlog.JsonFormatter(
+            server_hostname='localhost', fields={'n': None}).format(
+                make_record(n=0))) + 1
+        handler = self.get_handler(when='H', maxBytes=line + 1,
+                                   backupCount=2)
+        name = self.hour_name(handler.rollover_at - 3600)
+        for n in range(5):
+            handler.handle(make_record(n=n))
+        self.assertEqual([name + '.2', name + '.3'],
+                         [os.path.basename(path)
+                          for path in handler.get_backups()])
+        self.assertEqual([2], self.read_numbers(name + '.2'))
+        self.assertEqual([3], self.read_numbers(name + '.3'))
+
+    def test_rotates_on_time_compressed(self):
+        handler = self.get_handler(when='H', compress='gzip')
+        this_hour = handler.rollover_at - 3600
+        handler.handle(make_record(n=0))
+        handler.rollover_at = this_hour
+        handler.handle(make_record(n=1))
+        handler.close()
+        self.assertEqual([0], self.read_numbers(
+            self.hour_name(this_hour - 3600) + '.gz', gzip.open))
+
+    def test_unknown_when(self):
+        with self.assertRaises(ValueError):
+            handlers.RotatingFileHandler(self.log_file, when='fortnight')
+
+    def test_unknown_compress(self):
+        with self.assertRaises(ValueError):
+            handlers.RotatingFileHandler(self.log_file, compress='rar')
+
+
+class TestBatchingRotatingFileHandler(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.path, 'foo.log')
+
+    def tearDown(self):
+        self.handler.close()
+        shutil.rmtree(self.path)
+
+    def get_handler(self, **kwargs):
+        kwargs.setdefault('flush_interval', 0)
+        self.handler = handlers.BatchingRotatingFileHandler(
+            self.log_file, **kwargs)
+        self.handler.setFormatter(pyzlog.JsonFormatter(
+            server_hostname='localhost', fields={'n': None}))
+        return self.handler
+
+    def get_lines(self, name='foo.log'):
+        with open(os.path.join(self.path, name)) as f:
+            return [json.loads(line) for line in f]
+
+    def test_writes_at_capacity(self):
+        handler = self.get_handler(capacity=3)
+        handler.handle(make_record(n=1))
+        handler.handle(make_record(n=2))
+        self.assertEqual([], self.get_lines())
+        handler.handle(make_record(n=3))
+        self.assertEqual([1, 2, 3],
+                         [e['fields']['n'] for e in self.get_lines()])
+
+    def test_writes_at_flush_bytes(self):
+        handler = self.get_handler(capacity=100, flush_bytes=1)
+        handler.handle(make_record(n=1))
+        self.assertEqual(1, len(self.get_lines()))
+
+    def test_error_writes_immediately(self):
+        handler = self.get_handler(capacity=100)
+        handler.handle(make_record(n=1))
+        handler.handle(make_record(logging.ERROR, n=2))
+        self.assertEqual([1, 2],
+                         [e['fields']['n'] for e in self.get_lines()])
+
+    def test_writes_after_interval(self):
+        handler = self.get_handler(capacity=100, flush_interval=0.01)
+        handler.handle(make_record(n=1))
+        for _ in range(100):
+            if self.get_lines():
+                break
+            time.sleep(0.01)
+        self.assertEqual(1, len(self.get_lines()))
+
+    def test_close_writes_buffer(self):
+        handler = self.get_handler(capacity=100)
+        handler.handle(make_record(n=1))
+        handler.close()
+        self.assertEqual(1, len(self.get_lines()))
+
+    def test_close_twice(self):
+        handler = self.get_handler(capacity=100)
+        handler.handle(make_record(n=1))
+        handler.close()
+        handler.close()
+        self.assertEqual(1, len(self.get_lines()))
+
+    def test_close_holding_the_lock_like_logging_shutdown(self):
+        handler = self.get_handler(capacity=100, flush_interval=0.01)
+        handler.handle(make_record(n=1))
+
+        def shutdown():
+            handler.acquire()
+            try:
+                # long enough for the flusher to be waiting on the lock
+                time.sleep(0.05)
+                handler.flush()
+                handler.close()
+            finally:
+                handler.release()
+        closer = threading.Thread(target=shutdown)
+        closer.daemon = True
+        closer.start()
+        closer.join(5)
+        self.assertFalse(closer.is_alive())
+        self.assertEqual(1, len(self.get_lines()))
+
+    def test_rotates_between_batches(self):
+        handler = self.get_handler(capacity=2, maxBytes=300, backupCount=2)
+        for n in range(6):
+            handler.handle(make_record(n=n))
+        # each file holds whole batches
+        self.assertEqual([4, 5],
+                         [e['fields']['n'] for e in self.get_lines()])
+        self.assertEqual([2, 3], [e['fields']['n']
+                                  for e in self.get_lines('foo.log.1')])
+        self.assertEqual([0, 1], [e['fields']['n']
+                                  for e in self.get_lines('foo.log.2')])
+
+
+class TestThreadBufferedHandler(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.path, 'foo.log')
+
+    def tearDown(self):
+        self.handler.close()
+        shutil.rmtree(self.path)
+
+    def get_handler(self, **kwargs):
+        kwargs.setdefault('flush_interval', 60)
+        self.handler = handlers.ThreadBufferedHandler(
+            handlers.BatchingRotatingFileHandler(
+                self.log_file, flush_interval=0), **kwargs)
+        self.handler.setFormatter(pyzlog.JsonFormatter(
+            server_hostname='localhost', fields={'n': None}))
+        return self.handler
+
+    def get_numbers(self):
+        with open(self.log_file) as f:
+            return [json.loads(line)['fields']['n'] for line in f]
+
+    def wait_for(self, count):
+        deadline = time.time() + 5
+        while len(self.get_numbers()) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return self.get_numbers()
+
+    def test_does_not_take_the_handler_lock(self):
+        handler = self.get_handler()
+        handler.acquire()
+        try:
+            handler.handle(make_record(n=1))
+        finally:
+            handler.release()
+        handler.flush()
+        self.assertEqual([1], self.get_numbers())
+
+    def test_buffers_until_capacity(self):
+        handler = self.get_handler(capacity=3)
+        handler.handle(make_record(n=1))
+        handler.handle(make_record(n=2))
+        time.sleep(0.05)
+        self.assertEqual([], self.get_numbers())
+        handler.handle(make_record(n=3))
+        self.assertEqual([1, 2, 3], self.wait_for(3))
+
+    def test_errors_wake_the_writer(self):
+        handler = self.get_handler()
+        handler.handle(make_record(n=1))
+        handler.handle(make_record(level=logging.ERROR, n=2))
+        self.assertEqual([1, 2], self.wait_for(2))
+
+    def test_keeps_each_threads_order(self):
+        handler = self.get_handler(capacity=7)
+
+        def log(start):
+            for n in range(start, start + 100):
+                handler.handle(make_record(n=n))
+        threads = [threading.Thread(target=log, args=(start,))
+                   for start in (0, 1000, 2000, 3000)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        handler.close()
+        numbers = self.get_numbers()
+        self.assertEqual(400, len(numbers))
+        for start in (0, 1000, 2000, 3000):
+            self.assertEqual(list(range(start, start + 100)),
+                             [n for n in numbers if start <= n < start + 100])
+        # buffers of threads that have exited are let go
+        self.assertEqual([], handler._buffers)
+
+
+class Collector(logging.Handler):
+    """keeps the entries it is handed"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.entries = []
+        self.setFormatter(pyzlog.JsonFormatter(
+            server_hostname='localhost', timestamp_from_record=True,
+            fields={'n': None}))
+
+    def emit(self, record):
+        self.entries.append(json.loads(self.format(record)))
+
+
+class TestDedupHandler(unittest2.TestCase):
+
+    def get_handler(self, **kwargs):
+        kwargs.setdefault('window', 60)
+        self.target = Collector()
+        handler = handlers.DedupHandler(self.target, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def log(self, handler, created, **fields):
+        record = make_record(**fields)
+        record.created = created
+        handler.handle(record)
+
+    def summary(self):
+        return [(e['fields'].get('n'), e['fields'].get('repeat_count'))
+                for e in self.target.entries]
+
+    def test_collapses_repeats(self):
+        handler = self.get_handler()
+        for created in [1000, 1001, 1002.5, 1003]:
+            self.log(handler, created, n=1)
+        self.assertEqual([(1, None)], self.summary())
+        handler.close()
+        self.assertEqual([(1, None), (1, 3)], self.summary())
+        fields = self.target.entries[1]['fields']
+        self.assertEqual(('1970-01-01T00:16:41.000000Z',
+                          '1970-01-01T00:16:43.000000Z'),
+                         (fields['first_timestamp'], fields['last_timestamp']))
+
+    def test_different_fields_are_kept(self):
+        handler = self.get_handler()
+        for n in [1, 2, 1, 2]:
+            self.log(handler, 1000, n=n)
+        self.assertEqual([(1, None), (2, None)], self.summary())
+
+    def test_window_ends(self):
+        handler = self.get_handler(window=10)
+        for created in [1000, 1005, 1010, 1011]:
+            self.log(handler, created, n=1)
+        self.assertEqual([(1, None), (1, 1), (1, None)], self.summary())
+
+    def test_single_record_has_no_summary(self):
+        handler = self.get_handler()
+        self.log(handler, 1000, n=1)
+        handler.close()
+        self.assertEqual([(1, None)], self.summary())
+
+    def test_max_keys_closes_oldest_window(self):
+        handler = self.get_handler(max_keys=2)
+        for n in [1, 1, 2, 3]:
+            self.log(handler, 1000, n=n)
+        self.assertEqual([(1, None), (2, None), (1, 1), (3, None)],
+                         self.summary())
+        self.assertEqual(2, len(handler._windows))
+
+    def test_lazy_fields_computed_once_per_record(self):
+        handler = self.get_handler()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 1
+        for _ in range(3):
+            self.log(handler, 1000, n=pyzlog.Lazy(compute))
+        handler.close()
+        self.assertEqual(3, len(calls))
+        self.assertEqual([(1, None), (1, 2)], self.summary())
+
+    def test_close_twice(self):
+        handler = self.get_handler()
+        self.log(handler, 1000, n=1)
+        self.log(handler, 1000, n=1)
+        handler.close()
+        handler.close()
+        self.assertEqual([(1, None), (1, 1)], self.summary())
+
+    def test_quiet_window_is_swept(self):
+        handler = self.get_handler(window=0.05)
+        for _ in range(3):
+            self.log(handler, time.time(), n=1)
+        deadline = time.time() + 5
+        while len(self.target.entries) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([(1, None), (1, 2)], self.summary())
+
+
+class TestProcessSafeRotatingFileHandler(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.path, 'foo.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_handler(self, **kwargs):
+        handler = handlers.ProcessSafeRotatingFileHandler(
+            self.log_file, **kwargs)
+        handler.setFormatter(pyzlog.JsonFormatter(
+            server_hostname='localhost', fields={'pid': None, 'n': None}))
+        self.addCleanup(handler.close)
+        return handler
+
+    def get_entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.lock'):
+                continue
+            opener = gzip.open if name.endswith('.gz') else open
+            f = opener(os.path.join(self.path, name), 'rb')
+            try:
+                entries.extend(json.loads(line.decode('utf-8'))
+                               for line in f)
+            finally:
+                f.close()
+        return entries
+
+    def test_needs_fcntl(self):
+        with mock.patch.object(handlers, 'fcntl', None):
+            with self.assertRaises(RuntimeError):
+                handlers.ProcessSafeRotatingFileHandler(self.log_file)
+
+    def test_rotates(self):
+        handler = self.get_handler(maxBytes=300, backupCount=5)
+        for n in range(6):
+            handler.handle(make_record(n=n))
+        self.assertTrue(os.path.exists(self.log_file + '.1'))
+        self.assertEqual(list(range(6)), sorted(
+            e['fields']['n'] for e in self.get_entries()))
+
+    def test_another_process_rotated(self):
+        size = len(pyzlog.JsonFormatter(
+            server_hostname='localhost', fields={'n': None}).format(
+                make_record(n=0))) + 1
+        first = self.get_handler(maxBytes=2 * size + 1, backupCount=5)
+        second = self.get_handler(maxBytes=2 * size + 1, backupCount=5)
+        first.handle(make_record(n=0))
+        first.handle(make_record(n=1))
+        second.handle(make_record(n=2))
+        # first finds its file full but already rotated, so just reopens
+        first.handle(make_record(n=3))
+        with open(self.log_file) as f:
+            self.assertEqual([2, 3], [json.loads(line)['fields']['n']
+                                      for line in f])
+        with open(self.log_file + '.1') as f:
+            self.assertEqual([0, 1], [json.loads(line)['fields']['n']
+                                      for line in f])
+        self.assertFalse(os.path.exists(self.log_file + '.2'))
+
+    def test_forked_writers_lose_nothing(self):
+        self.check_forked_writers()
+
+    def test_forked_writers_compressed_lose_nothing(self):
+        self.check_forked_writers(compress='gzip')
+
+    def check_forked_writers(self, **kwargs):
+        processes, records = 8, 300
+        handler = self.get_handler(maxBytes=20000, backupCount=1000,
+                                   **kwargs)
+        children = []
+        for pid in range(processes):
+            child = os.fork()
+            if child == 0:
+                try:
+                    for n in range(records):
+                        handler.handle(make_record(pid=pid, n=n))
+                    handler.close()
+                finally:
+                    os._exit(0)
+            children.append(child)
+        for child in children:
+            os.waitpid(child, 0)
+        handler.close()
+
+        entries = self.get_entries()
+        self.assertEqual(processes * records, len(entries))
+        self.assertEqual(
+            set((pid, n) for pid in range(processes)
+                for n in range(records)),
+            set((e['fields']['pid'], e['fields']['n']) for e in entries))
+        # rotated at least once
+        self.assertTrue([name for name in os.listdir(self.path)
+                         if name.startswith('foo.log.1')])
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_index
+----------------------------------
+
+Tests for `pyzlog.index` module.
+"""
+
+import io
+import os
+import gzip
+import json
+import shutil
+import logging
+import tempfile
+import unittest2
+import mock
+import pyzlog
+from pyzlog import handlers, index, reader
+
+
+def entry(n, timestamp, event_name='foo.event'):
+    return {'server_hostname': 'localhost',
+            'event_name': event_name,
+            'log_level': 'INFO',
+            'application_name': 'default',
+            'fields': {'n': n, 'event_timestamp': 'not this one'},
+            'event_timestamp': timestamp}
+
+
+class Unseekable(io.RawIOBase):
+    """stands in for a zstd stream_reader, which can only read forward"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self.data.read(len(b))
+        b[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class TestIndex(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.path, 'foo.log')
+        self.entries = [
+            entry(0, '2016-01-07T13:00:01.000000Z'),
+            entry(1, '2016-01-07T13:00:00.000000Z', 'bar.event'),
+            entry(2, '2016-01-07T13:01:00.000000Z'),
+            entry(3, '2016-01-07T13:02:00.000000Z', u'caf\xe9.event'),
+            entry(4, '2016-01-07T13:02:30.000000Z')]
+        self.write(self.log_file, self.entries)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, filename, entries, opener=open, mode='wb'):
+        f = opener(filename, mode)
+        try:
+            for e in entries:
+                f.write(json.dumps(e).encode('utf-8') + b'\n')
+        finally:
+            f.close()
+
+    def read_numbers(self, **filters):
+        return [e['fields']['n']
+                for e in reader.read_file(self.log_file, **filters)]
+
+    def test_build(self):
+        built = index.build(self.log_file, block_bytes=1024)
+        self.assertEqual(os.path.getsize(self.log_file), built.size)
+        self.assertEqual(
+            [('2016-01-07T13:00:00.000000Z', '2016-01-07T13:00:01.000000Z',
+              set(['foo.event', 'bar.event'])),
+             ('2016-01-07T13:01:00.000000Z', '2016-01-07T13:01:00.000000Z',
+              set(['foo.event'])),
+             ('2016-01-07T13:02:00.000000Z', '2016-01-07T13:02:30.000000Z',
+              set([u'caf\xe9.event', 'foo.event']))],
+            [(first, last, events)
+             for _, first, last, events in built.blocks])
+        self.assertEqual(0, built.blocks[0][0])
+
+    def test_block_bytes(self):
+        built = index.build(self.log_file, block_bytes=1)
+        self.assertEqual(5, len(built.blocks))
+
+    def test_save_and_load(self):
+        built = index.build(self.log_file)
+        built.save(self.log_file + index.index_suffix)
+        loaded = index.load(self.log_file)
+        self.assertEqual(built.size, loaded.size)
+        self.assertEqual([(o, f, l, frozenset(e))
+                          for o, f, l, e in built.blocks], loaded.blocks)
+        self.assertIsNone(index.load(os.path.join(self.path, 'missing')))
+
+    def test_reader_only_reads_matching_blocks(self):
+        index.rebuild(self.log_file)
+        with open(self.log_file, 'rb') as f:
+            data = f.read()
+        # garbage in the blocks that can't match doesn't get read
+        skipped = data.index(b'{', data.index(b'13:01:00'))
+        with open(self.log_file, 'wb') as f:
+            f.write(b'x' * skipped + data[skipped:])
+        self.assertEqual([3, 4], self.read_numbers(start='2016-01-07T13:02'))
+        self.assertEqual([3], self.read_numbers(event_name=u'caf\xe9.event'))
+        self.assertEqual([], self.read_numbers(end='2016-01-07T13:00'))
+
+    def test_reader_reads_past_the_index(self):
+        index.rebuild(self.log_file)
+        self.write(self.log_file, [entry(5, '2016-01-07T13:00:00.5Z')],
+                   mode='ab')
+        self.assertEqual([0, 1, 5], self.read_numbers(
+            end='2016-01-07T13:01'))
+
+    def test_compressed(self):
+        compressed = self.log_file + '.1.gz'
+        self.write(compressed, self.entries, opener=gzip.open)
+        index.main([compressed])
+        self.assertEqual(3, len(index.load(compressed).blocks))
+        self.assertEqual([2], [e['fields']['n'] for e in reader.read_file(
+            compressed, start='2016-01-07T13:01', end='2016-01-07T13:02')])
+
+    def test_unseekable(self):
+        compressed = self.log_file + '.1.zst'
+        index.build(self.log_file, block_bytes=1).save(
+            self.log_file + index.index_suffix)
+        os.rename(self.log_file, compressed)
+        os.rename(self.log_file + index.index_suffix,
+                  compressed + index.index_suffix)
+
+        def opener(filename):
+            with open(filename, 'rb') as f:
+                return io.BufferedReader(Unseekable(f.read()))
+        with mock.patch.dict(reader.openers, {'.zst': opener}):
+            self.assertEqual([2], [e['fields']['n'] for e in reader.read_file(
+                compressed, start='2016-01-07T13:01', end='2016-01-07T13:02')])
+            self.assertEqual([4], [e['fields']['n'] for e in reader.read_file(
+                compressed, start='2016-01-07T13:02:30')])
+
+
+class TestIndexedRotation(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.path, 'foo.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def rotate(self, **kwargs):
+        handler = handlers.RotatingFileHandler(
+            self.log_file, maxBytes=1, backupCount=2, index=True, **kwargs)
+        handler.setFormatter(pyzlog.JsonFormatter(fields={'n': None}))
+        for n in range(4):
+            record = logging.LogRecord('n', logging.INFO, 'p', 1, '',
+                                       None, None)
+            record.n = n
+            handler.handle(record)
+        handler.close()
+        return sorted(os.listdir(self.path))
+
+    def test_indexes_backups(self):
+        self.assertEqual(['foo.log', 'foo.log.1', 'foo.log.1.idx',
+                          'foo.log.2', 'foo.log.2.idx'],
+                         self.rotate())
+        for name in ['foo.log.1', 'foo.log.2']:
+            sidecar = index.load(os.path.join(self.path, name))
+            self.assertEqual(os.path.getsize(
+                os.path.join(self.path, name)), sidecar.size)
+
+    def test_indexes_compressed_backups(self):
+        self.assertEqual(['foo.log', 'foo.log.1.gz', 'foo.log.1.gz.idx',
+                          'foo.log.2.gz', 'foo.log.2.gz.idx'],
+                         self.rotate(compress='gzip'))
+        self.assertEqual([1, 2, 3], [
+            e['fields']['n'] for e in reader.read(
+                self.path, 'foo.log', event_name='default', end='9999')])
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+----------------------------------
+
+Tests for `pyzlog.metrics` module.
+"""
+
+import threading
+import unittest2
+from pyzlog import metrics
+
+
+class TestMetrics(unittest2.TestCase):
+
+    def setUp(self):
+        self.metrics = metrics.Metrics()
+
+    def count_in_threads(self, threads, times):
+        def count():
+            for _ in range(times):
+                self.metrics.add('records.INFO')
+        workers = [threading.Thread(target=count) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def test_adds_up_threads(self):
+        self.metrics.add('records.INFO', 2)
+        self.count_in_threads(4, 1000)
+        self.assertEqual({'records': {'INFO': 4002}},
+                         self.metrics.snapshot())
+        # the exited threads are still counted on the next read
+        self.assertEqual({'records': {'INFO': 4002}},
+                         self.metrics.snapshot())
+        self.assertEqual(1, len(self.metrics._threads))
+
+    def test_exited_threads_are_retired_without_a_snapshot(self):
+        for _ in range(20):
+            self.count_in_threads(10, 1)
+        self.assertLessEqual(len(self.metrics._threads), 64)
+        self.assertEqual({'records': {'INFO': 200}},
+                         self.metrics.snapshot())
+
+    def test_histogram(self):
+        for seconds in [0.0003, 0.0004, 0.000001]:
+            self.metrics.observe('write_seconds', seconds)
+        histogram = self.metrics.snapshot()['write_seconds']
+        self.assertEqual(3, histogram['count'])
+        self.assertAlmostEqual(0.000701, histogram['seconds'])
+        self.assertEqual({'512': 2, '2': 1}, histogram['buckets'])
+
+    def test_gauges(self):
+        self.metrics.gauge('queues.root', lambda: {'depth': 3})
+        self.metrics.gauge('depth', lambda: 1)
+        self.assertEqual({'queues': {'root': {'depth': 3}}, 'depth': 1},
+                         self.metrics.snapshot())
+        self.metrics.remove_gauge('queues.root')
+        self.assertEqual({'depth': 1}, self.metrics.snapshot())
+
+    def test_reset(self):
+        self.count_in_threads(2, 10)
+        self.metrics.add('rotations')
+        self.metrics.snapshot()
+        self.metrics.reset()
+        self.assertEqual({}, self.metrics.snapshot())
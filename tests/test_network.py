@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_network
+----------------------------------
+
+Tests for `pyzlog.network` module, against local stand-in collectors.
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import logging
+import tempfile
+import threading
+import unittest2
+from genty import genty, genty_dataset
+import pyzlog
+from pyzlog import network
+from tests.test_handlers import make_record
+
+
+class Collector(object):
+    """local stand-in for a log collector, keeps every line it receives
+
+    :param transport: 'tcp', 'udp' or 'unix'
+    :param address: where to listen, a free local port by default
+    """
+
+    def __init__(self, transport, address=None):
+        self.transport = transport
+        self.lines = []
+        self.connections = 0
+        if transport == 'unix':
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        elif transport == 'udp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(address or ('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        target = self._receive_datagrams
+        if transport != 'udp':
+            self.sock.listen(5)
+            target = self._accept
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except (socket.error, OSError):
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._receive,
+                                      args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def _receive(self, connection):
+        data = b''
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+            lines = data.split(b'\n')
+            data = lines.pop()
+            self.lines.extend(json.loads(line.decode('utf-8'))
+                              for line in lines)
+        connection.close()
+
+    def _receive_datagrams(self):
+        while True:
+            try:
+                datagram = self.sock.recv(65536)
+            except (socket.error, OSError):
+                return
+            self.lines.extend(json.loads(line.decode('utf-8'))
+                              for line in datagram.splitlines())
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.lines) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return [line['fields']['n'] for line in self.lines]
+
+    def close(self):
+        self.sock.close()
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@genty
+class TestNetworkHandler(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_handler(self, address, **kwargs):
+        handler = network.NetworkHandler(address, **kwargs)
+        handler.setFormatter(pyzlog.JsonFormatter(fields={'n': None}))
+        self.addCleanup(handler.close)
+        return handler
+
+    def get_collector(self, transport, address=None):
+        collector = Collector(transport, address)
+        self.addCleanup(collector.close)
+        return collector
+
+    @genty_dataset('tcp', 'udp', 'unix')
+    def test_sends_entries(self, transport):
+        address = (os.path.join(self.path, 'collector.sock')
+                   if transport == 'unix' else None)
+        collector = self.get_collector(transport, address)
+        handler = self.get_handler(collector.address, transport=transport,
+                                   capacity=7)
+        for n in range(50):
+            handler.handle(make_record(n=n))
+        self.assertEqual(list(range(50)), collector.wait_for(50))
+        self.assertEqual(50, handler.sent)
+
+    def test_reuses_connection(self):
+        collector = self.get_collector('tcp')
+        handler = self.get_handler(collector.address)
+        for n in range(3):
+            handler.handle(make_record(n=n))
+            collector.wait_for(n + 1)
+        self.assertEqual(1, collector.connections)
+
+    def test_udp_datagrams_hold_whole_lines(self):
+        collector = self.get_collector('udp')
+        handler = self.get_handler(collector.address, transport='udp',
+                                   flush_interval=0.5)
+        handler.pool.connect = lambda: network.Connection(
+            'udp', collector.address, max_datagram=300)
+        for n in range(20):
+            handler.handle(make_record(n=n))
+        self.assertEqual(list(range(20)), collector.wait_for(20))
+
+    def test_spills_while_down(self):
+        address = ('127.0.0.1', free_port())
+        spill_path = os.path.join(self.path, 'foo.log.spill')
+        handler = self.get_handler(address, spill_path=spill_path,
+                                   backoff=0.01, max_backoff=0.01)
+        for n in range(10):
+            handler.handle(make_record(n=n))
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if os.path.exists(spill_path):
+                with open(spill_path, 'rb') as f:
+                    if f.read().count(b'\n') == 10:
+                        break
+            time.sleep(0.01)
+        collector = self.get_collector('tcp', address)
+        handler.handle(make_record(n=10))
+        self.assertEqual(list(range(11)), collector.wait_for(11))
+        self.assertFalse(os.path.exists(spill_path))
+
+    def test_drops_without_room_to_spill(self):
+        address = ('127.0.0.1', free_port())
+        handler = self.get_handler(
+            address, spill_path=os.path.join(self.path, 'foo.log.spill'),
+            spill_bytes=1)
+        handler.handle(make_record(n=1))
+        handler.close()
+        self.assertEqual(1, handler.dropped)
+
+    def test_unknown_transport(self):
+        with self.assertRaises(ValueError):
+            network.NetworkHandler(('localhost', 1), transport='carrier')
+
+
+class TestInitLogsAddress(unittest2.TestCase):
+
+    def tearDown(self):
+        logger = logging.getLogger('shipped')
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+    def test_init_logs_ships_entries(self):
+        collector = Collector('tcp')
+        self.addCleanup(collector.close)
+        pyzlog.init_logs(logger_name='shipped', address=collector.address,
+                         server_hostname='localhost', fields={'n': None})
+        pyzlog.info(logger_name='shipped', event_name='shipped.event',
+                    extra={'n': 1})
+        self.assertEqual([1], collector.wait_for(1))
+        self.assertEqual('shipped.event', collector.lines[0]['event_name'])
@@ -9,12 +9,19 @@ Tests for `pyzlog` module.
 """
 
 import os
+import sys
+import time
+import shutil
 import socket
+import logging
 import datetime
+import tempfile
+import traceback
 import unittest2
 import mock
 import pyzlog
 import json
+from pyzlog import metrics
 from genty import genty, genty_dataset, genty_dataprovider
 
 
@@ -54,6 +61,140 @@ class TestJsonFormatter(unittest2.TestCase):
                               'server_hostname': server_hostname},
                              doc.defaults)
 
+    def test_format_matches_full_encode(self):
+        doc = pyzlog.JsonFormatter(application_name='app%s',
+                                   server_hostname='a"b',
+                                   fields={'foo': None})
+        doc._get_now = mock.MagicMock(return_value='now')
+        record = logging.LogRecord('n', logging.INFO, 'p', 1, '', None, None)
+        record.event_name = 'foo.event'
+        record.log_level = 'INFO'
+        record.foo = [1, 'two']
+        # built the way entries used to be: defaults updated per record
+        expected = doc.defaults.copy()
+        expected.update({
+            'event_timestamp': 'now',
+            'event_name': 'foo.event',
+            'log_level': 'INFO',
+            'fields': {'foo': [1, 'two']}})
+        formatted = doc.format(record)
+        self.assertEqual(expected, json.loads(formatted))
+        # key order is the one _build_envelope documents, whatever order
+        # the dict happened to iterate in
+        order = ['server_hostname', 'event_name', 'log_level',
+                 'application_name', 'fields', 'event_timestamp']
+        positions = [formatted.index('"%s": ' % key) for key in order]
+        self.assertEqual(sorted(positions), positions)
+
+    def test_format_whitelist_defaults(self):
+        doc = pyzlog.JsonFormatter(server_hostname='localhost',
+                                   fields={'given': 'a', 'missing': 'b',
+                                           'unset': None, 'cleared': 'c'})
+        record = logging.LogRecord('n', logging.INFO, 'p', 1, '', None, None)
+        record.given = 1
+        record.cleared = None
+        record.ignored = 2
+        self.assertEqual({'given': 1, 'missing': 'b'},
+                         json.loads(doc.format(record))['fields'])
+
+    def test_format_timestamp_from_record(self):
+        doc = pyzlog.JsonFormatter(server_hostname='localhost',
+                                   timestamp_from_record=True)
+        record = logging.LogRecord('n', logging.INFO, 'p', 1, '', None, None)
+        record.created = 1446253261.42
+        self.assertEqual('2015-10-31T01:01:01.420000Z',
+                         json.loads(doc.format(record))['event_timestamp'])
+
+
+@genty
+class TestTimestampCache(unittest2.TestCase):
+
+    @genty_dataset(
+        epoch=(0.0,),
+        fraction=(1446253261.000001,),
+        end_of_second=(1446253261.999999,),
+        rounds_up=(1446253261.9999999,),
+        next_second=(1446253262.5,),
+        earlier_second=(1446253200.25,),
+    )
+    def test_render_matches_strftime(self, timestamp):
+        cache = pyzlog._TimestampCache()
+        cache.render(1446253261.5)
+        expected = datetime.datetime.utcfromtimestamp(timestamp).strftime(
+            '%Y-%m-%dT%H:%M:%S.%fZ')
+        self.assertEqual(expected, cache.render(timestamp))
+
+
+def raise_at(depth, message):
+    if depth:
+        raise_at(depth - 1, message)
+    raise ValueError(message)
+
+
+def raise_chained():
+    try:
+        raise_at(0, 'first')
+    except ValueError:
+        raise KeyError('second')
+
+
+def exc_info_of(fn, *args):
+    try:
+        fn(*args)
+    except Exception:
+        return sys.exc_info()
+
+
+class TestTracebackCache(unittest2.TestCase):
+
+    def test_render_matches_format_exception(self):
+        cache = pyzlog._TracebackCache()
+        for fn, args in [(raise_at, (3, 'foo')), (raise_chained, ())]:
+            exc_info = exc_info_of(fn, *args)
+            self.assertEqual(traceback.format_exception(*exc_info),
+                             cache.render(exc_info))
+
+    def test_no_exception(self):
+        self.assertIsNone(pyzlog._TracebackCache().render((None, None, None)))
+
+    def test_reuses_frames(self):
+        cache = pyzlog._TracebackCache()
+        exc_infos = [exc_info_of(raise_at, 3, str(i)) for i in range(3)]
+        with mock.patch('traceback.extract_tb',
+                        wraps=traceback.extract_tb) as extract_tb:
+            rendered = [cache.render(exc_info) for exc_info in exc_infos]
+        self.assertEqual(1, extract_tb.call_count)
+        self.assertEqual(['ValueError: 0\n', 'ValueError: 1\n',
+                          'ValueError: 2\n'], [r[-1] for r in rendered])
+        self.assertEqual(traceback.format_exception(*exc_infos[2]),
+                         rendered[2])
+
+    def test_limit(self):
+        cache = pyzlog._TracebackCache(limit=2)
+        exc_info = exc_info_of(raise_at, 5, 'deep')
+        rendered = cache.render(exc_info)
+        self.assertEqual(5, len(rendered))
+        self.assertEqual(['Traceback (most recent call last):\n',
+                          '  ... 5 frames omitted ...\n'], rendered[:2])
+        self.assertIn('raise_at(depth - 1, message)', rendered[2])
+        self.assertIn('raise ValueError(message)', rendered[3])
+        self.assertEqual('ValueError: deep\n', rendered[4])
+
+    def test_evicts_least_recently_used(self):
+        cache = pyzlog._TracebackCache(size=2)
+        first, second, third = [exc_info_of(raise_at, depth, 'foo')
+                                for depth in range(3)]
+        for exc_info in [first, second, first, third]:
+            cache.render(exc_info)
+        self.assertEqual(2, len(cache._frames))
+        with mock.patch('traceback.extract_tb',
+                        wraps=traceback.extract_tb) as extract_tb:
+            cache.render(first)
+            cache.render(third)
+            self.assertFalse(extract_tb.called)
+            cache.render(second)
+            self.assertTrue(extract_tb.called)
+
 
 @genty
 class TestPyzlog(unittest2.TestCase, pyzlog.LogTest):
@@ -64,6 +205,11 @@ class TestPyzlog(unittest2.TestCase, pyzlog.LogTest):
         self.remove_log()
 
     def tearDown(self):
+        for name in ('root', 'batched'):
+            logger = logging.getLogger(name)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
         self.remove_log()
 
     def get_mock_now(self):
@@ -150,3 +296,243 @@ class TestPyzlog(unittest2.TestCase, pyzlog.LogTest):
         self.assertIn('exception', event['fields'])
         self.assertIn('ValueError: foo bar baz\n',
                       event['fields']['exception'])
+
+    def test_log_async(self):
+        pyzlog.init_logs(path=self.path, target=self.target,
+                         server_hostname='localhost',
+                         fields={'extra': None}, async_mode=True)
+        for i in range(10):
+            pyzlog.info(event_name='async_event', extra={'extra': i})
+        pyzlog.shutdown()
+        events = [json.loads(e) for e in self.get_log_messages()]
+        self.assertEqual(list(range(10)),
+                         [e['fields']['extra'] for e in events])
+        self.assertEqual(set(['async_event']),
+                         set(e['event_name'] for e in events))
+
+    def test_log_batched(self):
+        pyzlog.init_logs(path=self.path, target=self.target,
+                         logger_name='batched', server_hostname='localhost',
+                         batch_records=2, batch_interval=0)
+        pyzlog.info(logger_name='batched', event_name='first')
+        self.assertEqual([], self.get_log_messages())
+        pyzlog.info(logger_name='batched', event_name='second')
+        self.assertEqual(['first', 'second'],
+                         [json.loads(e)['event_name']
+                          for e in self.get_log_messages()])
+
+    def test_disabled_level_does_no_work(self):
+        self.init_logs(level=logging.INFO)
+        extra = mock.MagicMock()
+        with mock.patch('pyzlog._write') as write:
+            pyzlog.debug(event_name='skipped', extra=extra)
+        self.assertFalse(write.called)
+        self.assertEqual([], extra.mock_calls)
+
+    def test_level_changes_are_seen(self):
+        self.init_logs(level=logging.DEBUG)
+        pyzlog.debug(event_name='cached')
+        logging.getLogger('root').setLevel(logging.INFO)
+        pyzlog.debug(event_name='before')
+        logging.getLogger('root').setLevel(logging.DEBUG)
+        pyzlog.debug(event_name='after')
+        self.assertEqual(['cached', 'after'],
+                         [json.loads(e)['event_name']
+                          for e in self.get_log_messages()])
+
+    def test_bind(self):
+        self.init_logs(extra={'request_id': None, 'user_id': None,
+                              'status': None})
+        log = pyzlog.bind(request_id='r1', user_id=7)
+        log.info(event_name='start')
+        log.bind(user_id=8).warning(event_name='changed',
+                                    extra={'status': 404})
+        log.debug(event_name='end')
+        events = [json.loads(e) for e in self.get_log_messages()]
+        self.assertEqual(
+            [('start', 'INFO', {'request_id': 'r1', 'user_id': 7}),
+             ('changed', 'WARNING',
+              {'request_id': 'r1', 'user_id': 8, 'status': 404}),
+             ('end', 'DEBUG', {'request_id': 'r1', 'user_id': 7})],
+            [(e['event_name'], e['log_level'], e['fields'])
+             for e in events])
+
+    def test_bind_error_adds_exception(self):
+        self.init_logs()
+        try:
+            raise ValueError('bound')
+        except ValueError:
+            pyzlog.bind(extra='x').error(event_name='failed')
+        event = json.loads(self.get_log_messages()[0])
+        self.assertEqual('x', event['fields']['extra'])
+        self.assertIn('ValueError: bound\n', event['fields']['exception'])
+
+    def test_bind_reserved_fields(self):
+        for name in ['msg', 'message', 'event_name']:
+            with self.assertRaises(ValueError):
+                pyzlog.bind(**{name: 1})
+
+    def test_lazy_fields(self):
+        self.addCleanup(self.remove_log, target='bar.log')
+        self.init_logs(level=logging.INFO,
+                       extra={'computed': None, 'empty': None})
+        self.init_logs(target='bar.log', level=logging.INFO,
+                       extra={'computed': None})
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            return value
+
+        pyzlog.debug(extra={'computed': pyzlog.Lazy(compute, 'disabled')})
+        pyzlog.info(extra={'computed': pyzlog.Lazy(compute, 'written'),
+                           'empty': pyzlog.Lazy(compute, None),
+                           'ignored': pyzlog.Lazy(compute, 'ignored')})
+        self.assertEqual(2, len(calls))
+        self.assertEqual(set(['written', None]), set(calls))
+        for target in ['foo.log', 'bar.log']:
+            self.assertEqual(
+                {'computed': 'written'},
+                json.loads(self.get_log_messages(target=target)[0])['fields'])
+
+    def test_limit_drops_and_reports(self):
+        self.init_logs()
+        pyzlog.limit(event_name='hot', sample_rate=0)
+        pyzlog.limit(event_name='hot', log_level='error')
+        pyzlog.limit(log_level='debug', rate=0.001, burst=2)
+        for _ in range(3):
+            pyzlog.info(event_name='hot')
+            pyzlog.error(event_name='hot')
+            pyzlog.debug(event_name='cold')
+        pyzlog.clear_limits()
+        events = [json.loads(e) for e in self.get_log_messages()]
+        self.assertEqual(
+            ['hot', 'cold', 'hot', 'cold', 'hot'] + ['pyzlog.dropped'] * 2,
+            [e['event_name'] for e in events])
+        self.assertEqual(
+            set([('hot', None, 3), (None, 'DEBUG', 1)]),
+            set((e['fields']['dropped']['event_name'],
+                 e['fields']['dropped']['log_level'],
+                 e['fields']['dropped']['count']) for e in events[-2:]))
+
+    def test_limit_needs_event_name_or_level(self):
+        with self.assertRaises(ValueError):
+            pyzlog.limit(sample_rate=0.5)
+
+    def test_stats(self):
+        metrics.registry.reset()
+        self.init_logs(level=logging.INFO)
+        pyzlog.info(event_name='counted')
+        pyzlog.error(event_name='counted')
+        pyzlog.debug(event_name='filtered')
+        stats = pyzlog.stats()
+        self.assertEqual({'INFO': 1, 'ERROR': 1}, stats['records'])
+        self.assertEqual({'level': 1}, stats['filtered'])
+        self.assertEqual(sum(len(line) for line in self.get_log_messages()),
+                         stats['bytes_written'])
+        self.assertEqual(2, stats['format_seconds']['count'])
+        self.assertEqual(2, stats['write_seconds']['count'])
+
+    def test_stats_count_records_once(self):
+        metrics.registry.reset()
+        self.init_logs()
+        second = logging.StreamHandler(mock.MagicMock())
+        second.setFormatter(pyzlog.JsonFormatter())
+        logging.getLogger('root').addHandler(second)
+        pyzlog.notice(event_name='twice')
+        self.assertEqual({'NOTICE': 1}, pyzlog.stats()['records'])
+
+    def test_stats_interval(self):
+        pyzlog.init_logs(path=self.path, target=self.target,
+                         server_hostname='localhost', stats_interval=0.01)
+        deadline = time.time() + 5
+        while time.time() < deadline and not self.get_log_messages():
+            time.sleep(0.01)
+        pyzlog.shutdown()
+        entry = json.loads(self.get_log_messages()[0])
+        self.assertEqual('pyzlog.stats', entry['event_name'])
+        self.assertIsInstance(entry['fields']['stats'], dict)
+
+    def test_thread_buffers(self):
+        pyzlog.init_logs(path=self.path, target=self.target,
+                         server_hostname='localhost', thread_buffers=True)
+        pyzlog.info(event_name='buffered')
+        for handler in logging.getLogger('root').handlers:
+            handler.flush()
+        self.assertEqual(
+            'buffered', json.loads(self.get_log_messages()[0])['event_name'])
+
+    def check_forked_child(self, log, count, **kwargs):
+        """init_logs, fork, log in the child, and check the child's own
+        background threads write its count lines without being closed"""
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.addCleanup(pyzlog.shutdown)
+        pyzlog.init_logs(path=self.path, target=self.target,
+                         server_hostname='localhost', **kwargs)
+        child = os.fork()
+        if child == 0:
+            written = []
+            try:
+                log()
+                deadline = time.time() + 5
+                while len(written) < count and time.time() < deadline:
+                    time.sleep(0.01)
+                    written = [line for line in self.get_log_messages()
+                               if '"child' in line]
+            finally:
+                os._exit(0 if len(written) == count else 1)
+        _, status = os.waitpid(child, 0)
+        self.assertEqual(0, status)
+
+    @genty_dataset(
+        thread_buffers=({'thread_buffers': True},),
+        process_safe=({'thread_buffers': True, 'process_safe': True},),
+    )
+    def test_thread_buffers_after_fork(self, kwargs):
+        self.check_forked_child(
+            lambda: pyzlog.info(event_name='child'), 1, batch_interval=0.01,
+            **kwargs)
+
+    @genty_dataset(
+        async_mode=({'async_mode': True},),
+        process_safe=({'async_mode': True, 'process_safe': True},),
+    )
+    def test_async_mode_after_fork(self, kwargs):
+        self.check_forked_child(
+            lambda: pyzlog.info(event_name='child'), 1, **kwargs)
+
+    def test_dedup_window_after_fork(self):
+        def log():
+            for _ in range(3):
+                pyzlog.error(event_name='child')
+        # the first entry, then the repeats once the window is over
+        self.check_forked_child(log, 2, dedup_window=0.05)
+
+    def test_thread_buffers_needs_its_own_writer(self):
+        with self.assertRaises(ValueError):
+            pyzlog.init_logs(path=self.path, target=self.target,
+                             thread_buffers=True, async_mode=True)
+
+    def test_dedup_window(self):
+        pyzlog.init_logs(path=self.path, target=self.target,
+                         server_hostname='localhost', dedup_window=60)
+        for _ in range(5):
+            pyzlog.error(event_name='dependency.down')
+        pyzlog.info(event_name='other')
+        logging.getLogger('root').handlers[-1].close()
+        entries = [json.loads(line) for line in self.get_log_messages()]
+        self.assertEqual(
+            [('dependency.down', None), ('other', None),
+             ('dependency.down', 4)],
+            [(e['event_name'], e['fields'].get('repeat_count'))
+             for e in entries])
+
+    def test_shutdown_detaches_async_handler(self):
+        pyzlog.init_logs(path=self.path, target=self.target,
+                         server_hostname='localhost', async_mode=True)
+        pyzlog.shutdown()
+        self.assertEqual([], pyzlog._listeners)
+        root_handlers = logging.getLogger('root').handlers
+        self.assertFalse([h for h in root_handlers
+                          if isinstance(h, pyzlog.handlers.QueueHandler)])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_queues
+----------------------------------
+
+Tests for `pyzlog.queues` module.
+"""
+
+import logging
+import threading
+import unittest2
+from genty import genty, genty_dataset
+from pyzlog import queues, handlers
+from tests.test_handlers import make_record
+
+
+def levels(record_queue):
+    drained = []
+    while True:
+        try:
+            drained.append(record_queue.get_nowait().levelname)
+        except queues.Empty:
+            return drained
+
+
+class BlockingHandler(logging.Handler):
+    """keeps the level of every record, once unblock is set"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.started = threading.Event()
+        self.unblock = threading.Event()
+        self.levels = []
+
+    def emit(self, record):
+        self.started.set()
+        self.unblock.wait()
+        self.levels.append(record.levelname)
+
+
+@genty
+class TestBoundedQueue(unittest2.TestCase):
+
+    def fill(self, record_queue, *levels):
+        for level in levels:
+            record_queue.put(make_record(level=getattr(logging, level)))
+
+    def test_unbounded(self):
+        record_queue = queues.BoundedQueue()
+        self.fill(record_queue, *['DEBUG', 'ERROR'] * 50)
+        self.assertEqual(['DEBUG', 'ERROR'] * 50, levels(record_queue))
+
+    @genty_dataset(
+        drop_newest=('drop_newest', ['DEBUG', 'ERROR', 'INFO'],
+                     {'DEBUG': 1, 'ERROR': 1}),
+        drop_oldest=('drop_oldest', ['INFO', 'DEBUG', 'ERROR'],
+                     {'DEBUG': 1, 'ERROR': 1}),
+        drop_lowest=('drop_lowest', ['ERROR', 'INFO', 'ERROR'],
+                     {'DEBUG': 2}),
+        block=('block', ['DEBUG', 'ERROR', 'INFO'],
+               {'DEBUG': 1, 'ERROR': 1}),
+    )
+    def test_overflow(self, overflow, queued, dropped):
+        record_queue = queues.BoundedQueue(3, overflow, timeout=0.01)
+        self.fill(record_queue, 'DEBUG', 'ERROR', 'INFO', 'DEBUG', 'ERROR')
+        self.assertEqual(queued, levels(record_queue))
+        self.assertEqual(dropped, record_queue.dropped)
+
+    def test_drop_lowest_drops_new_record_below_everything_queued(self):
+        record_queue = queues.BoundedQueue(2, 'drop_lowest')
+        self.fill(record_queue, 'ERROR', 'INFO', 'DEBUG', 'INFO')
+        self.assertEqual(['ERROR', 'INFO'], levels(record_queue))
+        self.assertEqual({'DEBUG': 1, 'INFO': 1}, record_queue.dropped)
+
+    def test_block_waits_for_room(self):
+        record_queue = queues.BoundedQueue(1, 'block', timeout=5)
+        self.fill(record_queue, 'INFO')
+        timer = threading.Timer(0.05, record_queue.get)
+        timer.start()
+        self.assertTrue(record_queue.put(make_record()))
+        timer.join()
+        self.assertEqual({}, record_queue.dropped)
+        self.assertEqual(1, record_queue.qsize())
+
+    def test_put_nowait_does_not_block(self):
+        record_queue = queues.BoundedQueue(1, 'block', timeout=5)
+        self.fill(record_queue, 'INFO')
+        self.assertFalse(record_queue.put_nowait(make_record()))
+        self.assertEqual({'INFO': 1}, record_queue.dropped)
+
+    def test_sentinel_is_always_queued(self):
+        record_queue = queues.BoundedQueue(1, 'drop_newest')
+        self.fill(record_queue, 'INFO')
+        self.assertTrue(record_queue.put(None))
+        self.fill(record_queue, 'ERROR')
+        self.assertEqual('INFO', record_queue.get().levelname)
+        self.assertIsNone(record_queue.get())
+        self.assertEqual({'ERROR': 1}, record_queue.dropped)
+
+    def test_counts_drops_by_pyzlog_level(self):
+        record_queue = queues.BoundedQueue(1, 'drop_newest')
+        self.fill(record_queue, 'INFO', 'WARNING')
+        for log_level, level in [('NOTICE', logging.INFO),
+                                 ('ALERT', logging.INFO),
+                                 ('EMERGENCY', logging.CRITICAL)]:
+            record_queue.put(make_record(level=level, log_level=log_level))
+        self.assertEqual({'WARNING': 1, 'NOTICE': 1, 'ALERT': 1,
+                          'EMERGENCY': 1}, record_queue.dropped)
+
+    def test_discard_gets_dropped_items(self):
+        discarded = []
+        record_queue = queues.BoundedQueue(1, 'drop_oldest',
+                                           discard=discarded.append)
+        first = make_record()
+        record_queue.put(first)
+        record_queue.put(make_record())
+        self.assertEqual([first], discarded)
+
+    def test_get_times_out(self):
+        with self.assertRaises(queues.Empty):
+            queues.BoundedQueue().get(timeout=0.01)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            queues.BoundedQueue(overflow='drop_everything')
+
+
+class TestQueueHandler(unittest2.TestCase):
+
+    def test_errors_survive_a_stalled_writer(self):
+        target = BlockingHandler()
+        handler, listener = handlers.queue_handler(target, queue_size=2)
+        self.addCleanup(target.unblock.set)
+        handler.handle(make_record(level=logging.INFO))
+        target.started.wait(5)
+        for level in [logging.DEBUG, logging.DEBUG, logging.ERROR,
+                      logging.DEBUG, logging.CRITICAL]:
+            handler.handle(make_record(level=level))
+        target.unblock.set()
+        listener.stop()
+        self.assertEqual(['INFO', 'ERROR', 'CRITICAL'], target.levels)
+        self.assertEqual({'DEBUG': 3}, handler.queue.dropped)
+
+    def test_flush_waits_for_queued_records(self):
+        target = BlockingHandler()
+        handler, listener = handlers.queue_handler(target)
+        self.addCleanup(listener.stop)
+        for level in [logging.INFO, logging.ERROR]:
+            handler.handle(make_record(level=level))
+        threading.Timer(0.05, target.unblock.set).start()
+        listener.flush()
+        self.assertEqual(['INFO', 'ERROR'], target.levels)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_reader
+----------------------------------
+
+Tests for `pyzlog.reader` module.
+"""
+
+import os
+import gzip
+import json
+import shutil
+import datetime
+import tempfile
+import unittest2
+from pyzlog import index, reader
+
+
+def entry(n, timestamp, event_name='foo.event', log_level='INFO'):
+    return {'server_hostname': 'localhost',
+            'event_name': event_name,
+            'log_level': log_level,
+            'application_name': 'default',
+            'fields': {'n': n},
+            'event_timestamp': timestamp}
+
+
+def is_odd(value):
+    return value % 2 == 1
+
+
+class TestReader(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.write('foo.log.2', [
+            entry(0, '2016-01-07T12:59:59.000000Z'),
+            entry(1, '2016-01-07T13:00:00.000000Z', 'bar.event')])
+        self.write('foo.log.1.gz', [
+            entry(2, '2016-01-07T13:00:01.500000Z', log_level='ERROR'),
+            entry(3, '2016-01-07T13:05:00.000000Z')], opener=gzip.open)
+        self.write('foo.log', [
+            entry(4, '2016-01-07T13:05:00.000001Z', 'bar.event')],
+            partial=b'{"server_hostname": "loc')
+        self.write('foo.log.1.pending', [entry(5, '2016-01-07T14:00:00Z')])
+        self.write('other.log.3', [entry(6, '2016-01-07T14:00:00Z')])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, entries, opener=open, partial=b''):
+        f = opener(os.path.join(self.path, name), 'wb')
+        try:
+            for e in entries:
+                f.write(json.dumps(e).encode('utf-8') + b'\n')
+            f.write(partial)
+        finally:
+            f.close()
+
+    def read_numbers(self, **filters):
+        return [e['fields']['n']
+                for e in reader.read(self.path, 'foo.log', **filters)]
+
+    def test_log_files_oldest_first(self):
+        names = ['foo.log.2016-01-07_13.1.zst', 'foo.log.2016-01-07_12',
+                 'foo.log.2016-01-07_13.zst', 'foo.log.10']
+        for name in names:
+            open(os.path.join(self.path, name), 'w').close()
+        self.assertEqual(
+            ['foo.log.10', 'foo.log.2', 'foo.log.1.gz',
+             'foo.log.2016-01-07_12', 'foo.log.2016-01-07_13.zst',
+             'foo.log.2016-01-07_13.1.zst', 'foo.log'],
+            [os.path.basename(filename)
+             for filename in reader.log_files(self.path, 'foo.log')])
+
+    def test_reads_backups_in_order(self):
+        self.assertEqual([0, 1, 2, 3, 4], self.read_numbers())
+
+    def test_filters_event_name_and_level(self):
+        self.assertEqual([1, 4], self.read_numbers(event_name='bar.event'))
+        self.assertEqual([0, 1, 3, 4], self.read_numbers(
+            event_name=['foo.event', 'bar.event'], log_level='INFO'))
+        self.assertEqual([2], self.read_numbers(log_level='ERROR'))
+
+    def test_filters_time_range(self):
+        self.assertEqual([1, 2], self.read_numbers(
+            start='2016-01-07T13:00', end='2016-01-07T13:05Z'))
+        self.assertEqual([2, 3], self.read_numbers(
+            start=datetime.datetime(2016, 1, 7, 13, 0, 1),
+            end=1452171900.000001))
+
+    def test_filters_fields(self):
+        self.assertEqual([3], self.read_numbers(where={'n': 3}))
+        self.assertEqual([1, 3], self.read_numbers(
+            where={'n': is_odd}))
+        self.assertEqual([], self.read_numbers(where={'missing': 1}))
+
+    def test_scan_matches_read(self):
+        self.assertEqual(
+            list(reader.read(self.path, 'foo.log', where={'n': is_odd})),
+            list(reader.scan(self.path, 'foo.log', processes=2,
+                             where={'n': is_odd})))
+
+    def test_scan_chunks(self):
+        self.write('foo.log', [
+            entry(n, '2016-01-07T13:%02d:00.000000Z' % n)
+            for n in range(7, 20)], partial=b'{"server_hostname": "loc')
+        index.build(os.path.join(self.path, 'foo.log'), block_bytes=300).save(
+            os.path.join(self.path, 'foo.log' + index.index_suffix))
+        for filters in [{}, {'start': '2016-01-07T13:10'}]:
+            expected = list(reader.read(self.path, 'foo.log', **filters))
+            for chunk_bytes in [1, 100, 150, 1 << 20]:
+                self.assertEqual(expected, list(reader.scan(
+                    self.path, 'foo.log', processes=2,
+                    chunk_bytes=chunk_bytes, **filters)))
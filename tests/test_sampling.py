@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sampling
+----------------------------------
+
+Tests for `pyzlog.sampling` module.
+"""
+
+import unittest2
+import mock
+from pyzlog import sampling
+
+
+class TestRule(unittest2.TestCase):
+
+    def test_token_bucket_refills(self):
+        rule = sampling.Rule(rate=10, burst=2)
+        now = rule.updated
+        self.assertEqual([True, True, False],
+                         [rule.allow(now) for _ in range(3)])
+        self.assertTrue(rule.allow(now + 0.15))
+        self.assertFalse(rule.allow(now + 0.15))
+        # never more than burst saved up
+        self.assertEqual([True, True, False],
+                         [rule.allow(now + 60) for _ in range(3)])
+
+    def test_sample_rate(self):
+        rule = sampling.Rule(sample_rate=0.25)
+        with mock.patch('random.random', side_effect=[0.1, 0.3, 0.24]):
+            self.assertEqual([True, False, True],
+                             [rule.allow(0) for _ in range(3)])
+
+    def test_sample_rate_range(self):
+        with self.assertRaises(ValueError):
+            sampling.Rule(sample_rate=2)
+
+    def test_take_dropped_resets(self):
+        rule = sampling.Rule(sample_rate=0)
+        for logger_name in ['a', 'a', 'b']:
+            rule.drop(logger_name)
+        self.assertEqual([('a', 2), ('b', 1)], sorted(rule.take_dropped()))
+        self.assertEqual([], rule.take_dropped())
+
+
+class TestLimiter(unittest2.TestCase):
+
+    def test_reports_every_interval(self):
+        report = mock.Mock()
+        limiter = sampling.Limiter(report, report_interval=60)
+        limiter.add(event_name='hot', sample_rate=0)
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertFalse(limiter.allow('root', 'hot', 'INFO'))
+            self.assertTrue(limiter.allow('root', 'cold', 'INFO'))
+        self.assertFalse(report.called)
+        with mock.patch('time.time', return_value=1060.0):
+            limiter.allow('root', 'cold', 'INFO')
+        report.assert_called_once_with('root', 'hot', None, 1, mock.ANY)
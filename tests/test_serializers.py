@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_serializers
+----------------------------------
+
+Tests for `pyzlog.serializers` module.
+"""
+
+import json
+import uuid
+import collections
+import decimal
+import datetime
+import unittest2
+import pyzlog
+from pyzlog import serializers
+from genty import genty, genty_dataset
+
+Pair = collections.namedtuple('Pair', 'x y')
+
+
+def auto_backend():
+    """the backend serializer='auto' picks"""
+    for name in serializers.auto_order:
+        try:
+            serializers.backends[name](serializers.registry)
+        except ImportError:
+            continue
+        return name
+
+
+@genty
+class TestSerializers(unittest2.TestCase):
+
+    def get_value(self):
+        return {'when': datetime.datetime(2015, 10, 31, 1, 1, 1),
+                'nested': [1, 'two', {'three': set()}],
+                'text': u'caf\xe9/bar',
+                'amount': decimal.Decimal('1.10'),
+                'id': uuid.UUID(int=5),
+                'pair': Pair(1, 2),
+                'nan': float('nan'),
+                'big': 2 ** 64 + 1,
+                'negative': -2 ** 64}
+
+    # the differences listed in the serializers docstring
+    differences = {'ujson': {'amount': 1.1}, 'orjson': {'nan': None}}
+
+    @genty_dataset('json', 'simplejson', 'ujson', 'orjson', 'auto')
+    def test_backend_matches_stdlib(self, name):
+        try:
+            encode = serializers.get_encoder(name, serializers.registry)
+        except ImportError as e:
+            self.skipTest(str(e))
+        if name == 'auto':
+            name = auto_backend()
+        differences = self.differences.get(name, {})
+        # one at a time, as orjson falls back to the stdlib for the whole
+        # entry if any value is too big for it
+        for key, value in self.get_value().items():
+            expected = json.loads(json.dumps(value,
+                                             default=serializers.registry),
+                                  parse_constant=str)
+            self.assertEqual(differences.get(key, expected),
+                             json.loads(encode(value), parse_constant=str))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            serializers.get_encoder('yaml', str)
+
+    def test_callable_backend(self):
+        encode = serializers.get_encoder(
+            lambda json_default: lambda obj: 'encoded', str)
+        self.assertEqual('encoded', encode({}))
+
+    def test_formatter_serializer(self):
+        doc = pyzlog.JsonFormatter(server_hostname='localhost',
+                                   serializer='auto')
+        self.assertEqual({'a': 1}, json.loads(doc._encode({'a': 1})))
+
+
+class Point(object):
+
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+    def __str__(self):
+        return 'point'
+
+
+class Point3D(Point):
+    pass
+
+
+@genty
+class TestRegistry(unittest2.TestCase):
+
+    def setUp(self):
+        self.registry = serializers.Registry(serializers.builtin_encoders)
+
+    def encode(self, value):
+        return json.dumps(value, default=self.registry)
+
+    @genty_dataset(
+        datetime=(datetime.datetime(2015, 10, 31, 1, 2, 3, 4),
+                  '2015-10-31T01:02:03.000004Z'),
+        date=(datetime.date(2010, 10, 10), '2010-10-10T00:00:00.000000Z'),
+        time=(datetime.time(1, 2, 3), '1900-01-01T01:02:03.000000Z'),
+        decimal=(decimal.Decimal('0.10'), '0.10'),
+        uuid=(uuid.UUID(int=1), '00000000-0000-0000-0000-000000000001'),
+        bytearray=(bytearray(b'caf\xc3\xa9'), u'caf\xe9'),
+        frozenset=(frozenset([1]), [1]),
+    )
+    def test_builtin_encoders(self, value, expected):
+        self.assertEqual(expected, self.registry(value))
+
+    def test_times_match_strftime(self):
+        for value in [datetime.datetime(2015, 10, 31, 1, 2, 3, 4),
+                      datetime.date(2010, 10, 10), datetime.time(1, 2, 3)]:
+            self.assertEqual(value.strftime(pyzlog.default_date_fmt),
+                             self.registry(value))
+
+    def test_unknown_types_use_str(self):
+        self.assertEqual('"point"', self.encode(Point(1, 2)))
+
+    def test_register(self):
+        self.registry.register(Point, lambda point: [point.x, point.y])
+        self.assertEqual('[[1, 2], [3, 4]]',
+                         self.encode([Point(1, 2), Point3D(3, 4)]))
+
+    def test_register_replaces_cached_encoder(self):
+        self.assertEqual('"point"', self.encode(Point3D(1, 2)))
+        self.registry.register(Point, lambda point: point.x)
+        self.assertEqual('1', self.encode(Point3D(1, 2)))
+        self.registry.unregister(Point)
+        self.assertEqual('"point"', self.encode(Point3D(1, 2)))
+
+    def test_nearest_type_wins(self):
+        self.registry.register(Point, lambda point: 'base')
+        self.registry.register(Point3D, lambda point: 'derived')
+        self.assertEqual('"derived"', self.encode(Point3D(1, 2)))
+
+    def test_encoded_values_are_encoded_again(self):
+        self.registry.register(Point, lambda point: {
+            'at': datetime.date(2010, 10, 10)})
+        self.assertEqual('{"at": "2010-10-10T00:00:00.000000Z"}',
+                         self.encode(Point(1, 2)))
+
+    @unittest2.skipIf(serializers.enum is None, 'needs the enum module')
+    def test_enum(self):
+        Color = serializers.enum.Enum('Color', 'red green')
+        self.assertEqual('[1, 2]', self.encode([Color.red, Color.green]))
+
+    def test_formatter_uses_registry(self):
+        self.assertIs(serializers.registry,
+                      pyzlog.JsonFormatter(server_hostname='localhost')
+                      .json_default)